@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+class AnalysisCache:
+    """
+    LRU cache of serialized model responses keyed on a content hash.
+
+    Entries are JSON strings so their size can be capped in bytes. When `path`
+    is set the cache is loaded from it at startup and written back by save().
+    """
+
+    def __init__(self, max_bytes: int, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if path:
+            self._load()
+
+    @staticmethod
+    def make_key(before: bytes, after: bytes, prompt_version: str, model_name: str) -> str:
+        h = hashlib.sha256()
+        # Hash each part separately so the boundaries between them are unambiguous
+        for part in (before, after, prompt_version.encode(), model_name.encode()):
+            h.update(hashlib.sha256(part).digest())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key: str, value: str):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(key) + len(self._entries.pop(key))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._bytes -= len(old_key) + len(old_value)
+                self.stats["evictions"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                **self.stats,
+            }
+
+    # region persistence
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not load analysis cache: {e}")
+            return
+        # Saved oldest first, so re-inserting keeps the LRU order
+        for key, value in entries.items():
+            self.put(key, value)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps(self._entries)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print(f"Warning: Could not save analysis cache: {e}")
+    # endregion
@@ -0,0 +1,85 @@
+import os
+import fcntl
+import threading
+from typing import Callable, Optional
+
+class AnalysisLeader:
+    """
+    Picks one worker process, among those sharing `lock_path`, to run capture analysis.
+
+    Every worker keeps trying to take an exclusive flock on the lock file.
+    The one holding it calls `dispatch()` every `poll` seconds to hand new
+    captures to its analysis pipelines (it returns how many it handed over).
+    The kernel drops the lock when the leader exits or crashes, and another
+    worker takes over on its next poll. Only the lock holder dispatches, and
+    it advances a shared cursor as it goes, so no two workers analyze the
+    same capture at once. A capture only counts as done once its analysis
+    is saved; a worker that wins an election first calls `elected()`, which
+    rewinds the cursor so the captures a crashed leader never finished are
+    dispatched again.
+    """
+
+    def __init__(self, lock_path: str, poll: float, dispatch: Callable[[], int],
+                 elected: Optional[Callable[[], None]] = None):
+        self.lock_path = lock_path
+        self.poll = poll
+        self.dispatch = dispatch
+        self.elected = elected
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.is_leader = False
+        self.stats = {"elections_won": 0, "dispatched": 0, "dispatch_errors": 0}
+
+    def _try_acquire(self) -> bool:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, str(os.getpid()).encode(), 0)
+        return True
+
+    def _loop(self):
+        while True:
+            if not self.is_leader and self._try_acquire():
+                self.is_leader = True
+                self.stats["elections_won"] += 1
+                print(f"Worker {os.getpid()} is now the analysis leader")
+                if self.elected is not None:
+                    try:
+                        self.elected()
+                    except Exception as e:
+                        print(f"Error taking over capture analysis: {e}")
+            if self.is_leader:
+                try:
+                    self.stats["dispatched"] += self.dispatch()
+                except Exception as e:
+                    self.stats["dispatch_errors"] += 1
+                    print(f"Error dispatching captures for analysis: {e}")
+            if self._stop.wait(self.poll):
+                return
+
+    def start(self):
+        """Start competing for leadership. Safe to call more than once."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="analysis-leader", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop dispatching and give up leadership."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)  # releases the flock
+            self._fd = None
+        self.is_leader = False
+
+    def status(self) -> dict:
+        return {"pid": os.getpid(), "is_leader": self.is_leader, **self.stats}
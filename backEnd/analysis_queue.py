@@ -0,0 +1,302 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+from tracing import Trace, activate
+
+QUEUE_POLICIES = ("reject", "drop_oldest", "coalesce")
+
+class QueueFullError(Exception):
+    """Raised by submit() when the queue is full and the policy is 'reject'."""
+
+class ConcurrencyLimit:
+    """
+    Slots shared by several AnalysisPools, so the total number of analyses
+    running at once stays at `capacity` however many devices have a pool.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        self._waits = deque(maxlen=100)
+        self.stats = {"acquired": 0, "waited": 0}
+
+    def acquire(self) -> float:
+        """Take a slot, blocking while all are in use. Returns the seconds spent waiting."""
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting += 1
+            while self._in_use >= self.capacity:
+                self._cond.wait()
+            self._waiting -= 1
+            self._in_use += 1
+            waited = time.perf_counter() - start
+            self._waits.append(waited)
+            self.stats["acquired"] += 1
+            self.stats["waited"] += 1 if waited > 0.001 else 0
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def status(self) -> dict:
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "capacity": self.capacity,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "avg_wait_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "max_wait_s": round(max(waits), 3) if waits else 0.0,
+                **self.stats,
+            }
+
+class AnalysisJob:
+    def __init__(self, seq: int, before: bytes, after: bytes, trace: Optional[Trace] = None, changed_blocks=None):
+        self.seq = seq
+        self.before = before
+        self.after = after
+        self.changed_blocks = changed_blocks  # where the change filter saw the pair change, if it ran
+        self.enqueued_at = time.time()
+        self.span = 1  # number of capture pairs this job covers
+        self.trace = trace
+        self.merged_traces = []  # traces of the pairs merged into this job
+        self.on_done = []  # callbacks of this pair and the pairs merged into it
+        self.done_at = None
+        self._finished = False
+
+    def finish(self, outcome: str):
+        """
+        Close the job's trace, merged pairs as 'coalesced' into it, and run the
+        on_done callbacks. Later calls are ignored.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        for callback in self.on_done:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in analysis job callback: {e}")
+        if self.trace is None:
+            return
+        self.trace.finish(outcome, span=self.span)
+        for trace in self.merged_traces:
+            trace.finish("coalesced", merged_into=self.trace.trace_id)
+
+class AnalysisPool:
+    """
+    Fixed number of worker threads fed by a bounded queue of capture pairs.
+
+    Workers run `analyze(before, after, changed_blocks)` concurrently, but
+    results are handed to `apply(result)` strictly in submission order: a
+    result that finishes early waits until every earlier job has been
+    applied, failed or been dropped. `analyze` may return None when there is
+    nothing to apply.
+
+    Pairs arrive as a chain (A->B, B->C, ...), so a new pair can be merged into the
+    newest waiting job by moving that job's 'after' image forward: A->B + B->C
+    becomes A->C, and only the net change is sent to the model (the changed
+    blocks of the merged pairs are combined). A job keeps absorbing new pairs
+    for `coalesce_window` seconds after it was queued and until it covers
+    `max_span` pairs. A window of 0 turns merging off.
+
+    When the queue is full the policy decides what happens to a new pair:
+      reject      - submit() raises QueueFullError
+      drop_oldest - the oldest waiting pair is discarded
+      coalesce    - the newest waiting pair is extended to end at the new 'after' image
+
+    Pools given the same ConcurrencyLimit hold one of its slots while
+    `analyze` runs, which caps model calls across all of them.
+
+    A pair may carry a Trace. The pool records its queue_wait, limit_wait
+    and reorder_wait stages, makes it the active trace while `analyze` and
+    `apply` run, and finishes it with the job's outcome. A pair's `on_done`
+    callback runs once the pool is done with it: after its result was
+    applied, or when it was dropped, failed or found nothing to apply.
+    """
+
+    def __init__(self, analyze: Callable[[bytes, bytes, Any], Any], apply: Callable[[Any], None],
+                 workers: int, max_queue: int, policy: str,
+                 coalesce_window: float = 0.0, max_span: int = 1, limit: Optional[ConcurrencyLimit] = None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {QUEUE_POLICIES}")
+        self.analyze = analyze
+        self.apply = apply
+        self.workers = workers
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.coalesce_window = coalesce_window
+        self.max_span = max(1, max_span)
+        self.limit = limit
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._next_seq = 0
+        self._in_flight = 0
+        self._stopped = False
+        self._threads = []
+
+        # Reorder buffer: seq -> result (None for failed, dropped or empty jobs)
+        self._apply_lock = threading.Lock()
+        self._results = {}
+        self._next_apply = 0
+
+        self._waits = deque(maxlen=100)
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "dropped": 0, "coalesced": 0}
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"analysis-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self):
+        """Stop accepting work; workers exit once their current job is done."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def submit(self, before: bytes, after: bytes, trace: Optional[Trace] = None,
+               changed_blocks=None, on_done: Optional[Callable[[], None]] = None) -> Optional[int]:
+        """
+        Queue a capture pair, with the change filter's `changed_blocks` grid when
+        it ran. Returns the job's sequence number, or None when the pair was
+        merged into a job that is already waiting.
+        """
+        dropped = None
+        with self._cond:
+            if self._pending and self._can_merge(self._pending[-1]):
+                self._merge(self._pending[-1], after, trace, changed_blocks, on_done)
+                return None
+
+            if len(self._pending) >= self.max_queue:
+                if self.policy == "reject":
+                    self.stats["rejected"] += 1
+                    raise QueueFullError(f"Analysis queue is full ({self.max_queue} waiting)")
+                if self.policy == "coalesce":
+                    self._merge(self._pending[-1], after, trace, changed_blocks, on_done)
+                    return None
+                dropped = self._pending.popleft()
+                self.stats["dropped"] += 1
+
+            job = AnalysisJob(self._next_seq, before, after, trace, changed_blocks)
+            if on_done is not None:
+                job.on_done.append(on_done)
+            self._next_seq += 1
+            self._pending.append(job)
+            self.stats["submitted"] += 1
+            self._cond.notify()
+
+        if dropped is not None:
+            dropped.finish("dropped")
+            self._finish(dropped, None)
+        return job.seq
+
+    def _can_merge(self, job: AnalysisJob) -> bool:
+        return (job.span < self.max_span
+                and time.time() - job.enqueued_at <= self.coalesce_window)
+
+    def _merge(self, job: AnalysisJob, after: bytes, trace: Optional[Trace], changed_blocks=None,
+               on_done: Optional[Callable[[], None]] = None):
+        """Extend a waiting job to end at a newer 'after' image. Caller holds the lock."""
+        job.after = after
+        if job.changed_blocks is not None and changed_blocks is not None:
+            job.changed_blocks = job.changed_blocks | changed_blocks
+        else:
+            job.changed_blocks = None  # one of the pairs wasn't located
+        job.span += 1
+        if on_done is not None:
+            job.on_done.append(on_done)
+        if trace is not None:
+            if job.trace is None:
+                job.trace = trace
+            else:
+                job.merged_traces.append(trace)
+        self.stats["coalesced"] += 1
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                job = self._pending.popleft()
+                self._in_flight += 1
+                now = time.time()
+                self._waits.append(now - job.enqueued_at)
+            if job.trace is not None:
+                job.trace.add_span("queue_wait", job.enqueued_at, now)
+
+            if self.limit is not None:
+                waited = self.limit.acquire()
+                if job.trace is not None:
+                    now = time.time()
+                    job.trace.add_span("limit_wait", now - waited, now)
+
+            result = None
+            outcome = "completed"
+            try:
+                with activate(job.trace):
+                    result = self.analyze(job.before, job.after, job.changed_blocks)
+            except Exception as e:
+                print(f"Error in pantry analysis job {job.seq}: {e}")
+                outcome = "failed"
+            finally:
+                if self.limit is not None:
+                    self.limit.release()
+
+            with self._cond:
+                self._in_flight -= 1
+                self.stats[outcome] += 1
+            if outcome == "failed":
+                job.finish("failed")
+            self._finish(job, result)
+
+    def _finish(self, job: AnalysisJob, result: Any):
+        """Record a job's outcome and apply every result that is now next in line."""
+        job.done_at = time.time()
+        with self._apply_lock:
+            self._results[job.seq] = (job, result)
+            while self._next_apply in self._results:
+                ready_job, ready = self._results.pop(self._next_apply)
+                self._next_apply += 1
+                if ready is None:
+                    # Failed and dropped jobs are already finished, this one found no change
+                    ready_job.finish("unchanged")
+                    continue
+                if ready_job.trace is not None:
+                    # Time spent waiting for earlier jobs to be applied first
+                    ready_job.trace.add_span("reorder_wait", ready_job.done_at, time.time())
+                try:
+                    with activate(ready_job.trace):
+                        self.apply(ready)
+                    ready_job.finish("applied")
+                except Exception as e:
+                    print(f"Error applying pantry analysis: {e}")
+                    ready_job.finish("failed")
+
+    def status(self) -> dict:
+        with self._cond:
+            now = time.time()
+            waits = list(self._waits)
+            return {
+                "policy": self.policy,
+                "workers": self.workers,
+                "queue_depth": len(self._pending),
+                "max_queue": self.max_queue,
+                "coalesce_window_s": self.coalesce_window,
+                "max_span": self.max_span,
+                "in_flight": self._in_flight,
+                "oldest_wait_s": round(now - self._pending[0].enqueued_at, 3) if self._pending else 0.0,
+                "avg_wait_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "max_wait_s": round(max(waits), 3) if waits else 0.0,
+                **self.stats,
+            }
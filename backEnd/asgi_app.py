@@ -0,0 +1,168 @@
+"""
+Async serving mode for the backend.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+    (or: python asgi_app.py)
+
+Device ingest (/api/frame, /api/capture), the LLM routes (/api/recipes,
+/api/analyze_pantry) and the streaming routes (/video_feed,
+/api/inventory/stream, /api/recipes/stream) are served natively: Gemini calls
+and open streams are awaited instead of holding a thread, and image work runs
+in worker threads off the event loop. Each route class has its own
+concurrency limit, so a pile of slow recipe requests can't starve frame
+uploads, and identical LLM requests arriving together share one call. Every
+other route is served by the Flask app from main.py, so the API is the same
+as `python main.py`.
+
+Several worker processes:
+
+    PANTRY_SHARED_DIR=/dev/shm/pantry uvicorn asgi_app:app --workers 4 --host 0.0.0.0 --port 5001
+
+Live frames are then kept in shared memory, so any worker can serve any
+device's feed. Captures from every worker go into the shared capture ring,
+where one elected worker picks them up for analysis. The pantry journal and
+bots.json are shared too: writes are serialized with file locks in
+PANTRY_SHARED_DIR, and every worker picks up the others' changes, so any
+worker serves the current inventory and inventory stream.
+"""
+import time
+import asyncio
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import main
+from pantry_analyzer import analyze_pantry_images_async
+from tracing import tracer, activate
+from config import ASGI_INGEST_CONCURRENCY, ASGI_LLM_CONCURRENCY, ASGI_WSGI_WORKERS
+
+ingest_limit = asyncio.Semaphore(ASGI_INGEST_CONCURRENCY)
+llm_limit = asyncio.Semaphore(ASGI_LLM_CONCURRENCY)
+
+# region device ingest
+async def receive_frame(request):
+    async with ingest_limit:
+        try:
+            device_id = main.device_id_from(request.headers, request.query_params)
+            payload, status = await asyncio.to_thread(main.store_frame, await request.body(), device_id)
+            return JSONResponse(payload, status)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"Error receiving frame: {e}")
+            return JSONResponse({'error': str(e)}, 500)
+
+async def receive_capture(request):
+    received_at = time.time()
+    async with ingest_limit:
+        try:
+            device_id = main.device_id_from(request.headers, request.query_params)
+            payload, status = await asyncio.to_thread(main.store_capture, await request.body(), device_id, received_at)
+            return JSONResponse(payload, status)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"Error receiving frame: {e}")
+            return JSONResponse({'error': str(e)}, 500)
+# endregion
+
+# region LLM routes
+async def recipe_handler(request):
+    try:
+        allergens, force_refresh = main.recipe_request_args(await request.json())
+        recipes_json_string, headers = await main.get_recipes_async(allergens, force_refresh, llm_limit)
+        return Response(recipes_json_string, 200, media_type='application/json', headers=headers)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except Exception as e:
+        print(f"Error in /api/recipes: {e}")
+        return JSONResponse({'error': str(e)}, 500)
+
+async def recipe_stream_handler(request):
+    try:
+        allergens, force_refresh = main.recipe_request_args(await request.json())
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+
+    async def events():
+        async with llm_limit:
+            async for message in main.recipe_events_async(allergens, force_refresh):
+                yield message
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers=main.SSE_HEADERS)
+
+async def analyze_pantry(request):
+    received_at = time.time()
+    try:
+        form = await request.form()
+        if "before_image" not in form or "after_image" not in form:
+            return JSONResponse({"error": "Missing before_image or after_image"}, 400)
+
+        before_bytes = await form["before_image"].read()
+        after_bytes = await form["after_image"].read()
+
+        trace = tracer.start_trace("analyze_pantry", start=received_at)
+        trace.add_span("receive", trace.start, time.time())
+        try:
+            waiting_since = time.time()
+            async with llm_limit:
+                trace.add_span("llm_limit_wait", waiting_since, time.time())
+                with activate(trace):
+                    response = await analyze_pantry_images_async(before_bytes, after_bytes)
+        except Exception as e:
+            trace.finish("failed", error=str(e))
+            raise
+        trace.finish("applied")
+
+        return JSONResponse(response.dict(), 200)
+    except Exception as e:
+        print(f"Error in analyze_pantry: {e}")
+        return JSONResponse({"error": str(e)}, 500)
+# endregion
+
+# region streams
+async def video_feed(request):
+    try:
+        pipeline = main.device_pipeline(main.device_id_from(request.headers, request.query_params))
+    except ValueError:
+        pipeline = None
+    if pipeline is None:
+        return JSONResponse({'error': 'Unknown device'}, 404)
+    return StreamingResponse(pipeline.frames.stream_async(), media_type='multipart/x-mixed-replace; boundary=frame')
+
+async def inventory_stream(request):
+    return StreamingResponse(main.inventory_events_stream_async(request.headers.get('Last-Event-ID', '')),
+                             media_type='text/event-stream', headers=main.SSE_HEADERS)
+# endregion
+
+def timed(route: str, handler):
+    """Record native routes in the same request metrics the Flask app records"""
+    async def wrapper(request):
+        start = time.perf_counter()
+        response = await handler(request)
+        main.record_request(route, request.method, response.status_code, time.perf_counter() - start)
+        return response
+    return wrapper
+
+app = Starlette(
+    routes=[
+        Route('/api/frame', timed('/api/frame', receive_frame), methods=['POST']),
+        Route('/api/capture', timed('/api/capture', receive_capture), methods=['POST']),
+        Route('/api/recipes', timed('/api/recipes', recipe_handler), methods=['POST']),
+        Route('/api/analyze_pantry', timed('/api/analyze_pantry', analyze_pantry), methods=['POST']),
+        Route('/api/recipes/stream', timed('/api/recipes/stream', recipe_stream_handler), methods=['POST']),
+        Route('/api/inventory/stream', timed('/api/inventory/stream', inventory_stream), methods=['GET']),
+        Route('/video_feed', timed('/video_feed', video_feed), methods=['GET']),
+        # Everything else runs on the Flask app in a thread pool
+        Mount('/', app=WSGIMiddleware(main.app, workers=ASGI_WSGI_WORKERS)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+)
+
+if __name__ == '__main__':
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -0,0 +1,91 @@
+"""
+Cost of bot heartbeats and status reads: the old read-scan-rewrite of
+bots.json on every POST against the in-memory BotRegistry.
+
+Sends --rounds rounds of one heartbeat per bot, with a GET /api/bots after
+every --get-every heartbeats, and reports time per heartbeat and per read.
+
+Usage: python benchmarks/bench_bot_heartbeats.py [--bots 300] [--rounds 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bot_registry import BotRegistry
+
+def file_heartbeat(path: str, bot_update: dict):
+    """The previous POST /api/bots handler, minus Flask"""
+    try:
+        with open(path, "r") as f:
+            bots_data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        bots_data = []
+    for i, bot in enumerate(bots_data):
+        if bot.get("id") == bot_update["id"]:
+            bots_data[i] = bot_update
+            break
+    else:
+        bots_data.append(bot_update)
+    with open(path, "w") as f:
+        json.dump(bots_data, f, indent=4)
+
+def file_snapshot(path: str) -> str:
+    with open(path, "r") as f:
+        return json.dumps(json.load(f))
+
+def run(mode: str, bots: int, rounds: int, get_every: int) -> dict:
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, "bots.json")
+    registry = BotRegistry(path, heartbeat_ttl=10.0, flush_interval=5.0)
+    if mode == "registry":
+        registry.start()
+
+    post_time = get_time = 0.0
+    posts = gets = 0
+    for r in range(rounds):
+        for i in range(bots):
+            update = {"id": f"bot-{i}", "status": "Connected", "battery": str(100 - r)}
+            start = time.perf_counter()
+            if mode == "file":
+                file_heartbeat(path, update)
+            else:
+                registry.heartbeat(update)
+            post_time += time.perf_counter() - start
+            posts += 1
+
+            if posts % get_every == 0:
+                start = time.perf_counter()
+                file_snapshot(path) if mode == "file" else registry.snapshot()
+                get_time += time.perf_counter() - start
+                gets += 1
+
+    if mode == "registry":
+        registry.close()
+    return {
+        "mode": mode,
+        "bots": bots,
+        "heartbeats": posts,
+        "heartbeat_us": round(post_time / posts * 1e6, 1),
+        "max_heartbeats_per_s": int(posts / post_time),
+        "get_us": round(get_time / gets * 1e6, 1) if gets else 0.0,
+        **({"snapshots_built": registry.stats["snapshots_built"], "flushes": registry.stats["flushes"]}
+           if mode == "registry" else {}),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--get-every", type=int, default=10)
+    args = parser.parse_args()
+
+    # Keep the registry's "bot connected" log lines out of the JSON output
+    with contextlib.redirect_stdout(sys.stderr):
+        results = [run(mode, args.bots, args.rounds, args.get_every) for mode in ("file", "registry")]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,84 @@
+"""
+Replay bursty capture traffic through the analysis pool with a stubbed
+analyze_pantry_images and compare model calls and end-to-end lag with and
+without coalescing.
+
+Usage: python benchmarks/bench_capture_coalescing.py [--captures 60] [--llm-latency 1.0]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from analysis_queue import AnalysisPool
+
+def run(captures: int, llm_latency: float, window: float, max_span: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    calls = []
+    lags = {}
+    done = threading.Event()
+    submitted_at = {}
+
+    def stub_analyze(before, after, changed_blocks=None):
+        calls.append((before, after))
+        time.sleep(llm_latency * rng.uniform(0.7, 1.5))
+        return after
+
+    def apply(after_index):
+        # Every capture up to and including after_index is now reflected in the pantry
+        now = time.time()
+        for i in range(after_index + 1):
+            lags.setdefault(i, now - submitted_at[i])
+        if after_index == captures:
+            done.set()
+
+    # The baseline gets an unbounded queue so that nothing is merged at all
+    pool = AnalysisPool(stub_analyze, apply, workers=2, max_queue=8 if window else captures,
+                        policy="coalesce", coalesce_window=window, max_span=max_span)
+    pool.start()
+
+    # Bursts of shelf activity: several captures a fraction of a second apart, then a pause
+    submitted_at[0] = time.time()
+    i = 0
+    while i < captures:
+        for _ in range(rng.randint(3, 8)):
+            if i >= captures:
+                break
+            i += 1
+            submitted_at[i] = time.time()
+            pool.submit(i - 1, i)
+            time.sleep(rng.uniform(0.05, 0.3))
+        time.sleep(rng.uniform(0.5, 2.0) * llm_latency)
+
+    done.wait(timeout=captures * llm_latency * 2)
+    pool.close()
+
+    samples = sorted(lags.values())
+    return {
+        "coalesce_window_s": window,
+        "max_span": max_span,
+        "captures": captures,
+        "llm_calls": len(calls),
+        "lag_p50_s": round(samples[len(samples) // 2], 3),
+        "lag_max_s": round(samples[-1], 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captures", type=int, default=60)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--window", type=float, default=10.0)
+    parser.add_argument("--max-span", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = [
+        run(args.captures, args.llm_latency, 0.0, 1, args.seed),
+        run(args.captures, args.llm_latency, args.window, args.max_span, args.seed),
+    ]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,170 @@
+"""
+Exercise the LLM call policy (deadline, retries, hedging, circuit breaker)
+against the offline stub model with injected latency and errors.
+
+Recipe calls are made straight to a StubChatModel whose first-token latency
+is lognormal with a long tail and which fails --error-rate of its calls. The
+same workload runs bare (no policy), with deadline and retries, and with
+hedging on top, synchronously and with asyncio. The last scenario takes the
+backend down and brings it back to show the breaker opening, refusing calls
+and closing again after a probe succeeds.
+
+Usage: python benchmarks/bench_llm_policy.py [--calls 400] [--concurrency 8] [--error-rate 0.1]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+from llm_stub import StubChatModel
+from llm_policy import LLMCallPolicy, CircuitBreaker, CircuitOpenError
+from recipe_service import RecipeList, prompt_template, parser as recipe_parser
+from tracing import percentile
+
+INPUT = {"pantry_items": "Basmati Rice, Chickpeas, Spinach", "allergens": "None"}
+
+def build_chain(args, error_rate: float):
+    model = StubChatModel(model="bench", text_schema=RecipeList, seed=args.seed,
+                          latency=("lognormal", args.median, args.sigma), error_rate=error_rate)
+    return prompt_template | model | recipe_parser
+
+def make_policy(args, hedge: bool, breaker: CircuitBreaker = None) -> LLMCallPolicy:
+    return LLMCallPolicy("bench", breaker or CircuitBreaker(args.breaker_failures, args.breaker_reset),
+                         args.deadline, args.attempts, args.backoff_base, args.backoff_max,
+                         args.hedge_percentile if hedge else None, args.hedge_min_samples,
+                         workers=args.concurrency * 4)
+
+class Counted:
+    """Counts the requests actually sent to the model"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def __call__(self, fn):
+        def counted():
+            with self._lock:
+                self.requests += 1
+            return fn()
+        return counted
+
+def summarize(latencies: list, errors: dict, requests: int, policy: LLMCallPolicy = None) -> dict:
+    latencies.sort()
+    report = {
+        "calls": len(latencies),
+        "ok": len(latencies) - sum(errors.values()),
+        "errors": errors,
+        "model_requests": requests,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+    if policy is not None:
+        report["policy"] = policy.status()
+    return report
+
+def run_sync(args, chain, policy: LLMCallPolicy = None) -> dict:
+    counted = Counted()
+    invoke = counted(lambda: chain.invoke(INPUT))
+    latencies, errors, lock = [], {}, threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            policy.call(invoke) if policy else invoke()
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.calls)))
+    return summarize(latencies, errors, counted.requests, policy)
+
+def run_async(args, chain, policy: LLMCallPolicy) -> dict:
+    requests = 0
+    latencies, errors = [], {}
+
+    async def invoke():
+        nonlocal requests
+        requests += 1
+        return await chain.ainvoke(INPUT)
+
+    async def one(limit: asyncio.Semaphore):
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await policy.call_async(invoke)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        limit = asyncio.Semaphore(args.concurrency)
+        await asyncio.gather(*[one(limit) for _ in range(args.calls)])
+
+    asyncio.run(main())
+    return summarize(latencies, errors, requests, policy)
+
+def run_outage(args) -> dict:
+    """Backend down for a while, then back: the breaker should stop sending requests and recover"""
+    breaker = CircuitBreaker(args.breaker_failures, args.breaker_reset)
+    policy = make_policy(args, hedge=False, breaker=breaker)
+    down, up = build_chain(args, error_rate=1.0), build_chain(args, error_rate=0.0)
+    counted = Counted()
+    phases = {}
+    for phase, chain, calls in (("down", down, 30), ("recovered", up, 10)):
+        invoke = counted(lambda: chain.invoke(INPUT))
+        sent_before = counted.requests
+        outcomes = {}
+        start = time.perf_counter()
+        for _ in range(calls):
+            try:
+                policy.call(invoke)
+                outcome = "ok"
+            except CircuitOpenError:
+                outcome = "short_circuited"
+            except Exception as e:
+                outcome = type(e).__name__
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        phases[phase] = {"calls": calls, "outcomes": outcomes, "model_requests": counted.requests - sent_before,
+                         "seconds": round(time.perf_counter() - start, 2), "breaker": breaker.status()}
+        if phase == "down":
+            time.sleep(args.breaker_reset)  # let the circuit half-open before the backend comes back
+    return phases
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median", type=float, default=0.05, help="median stub latency in seconds")
+    parser.add_argument("--sigma", type=float, default=1.0, help="lognormal sigma, larger = longer tail")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument("--backoff-base", type=float, default=0.02)
+    parser.add_argument("--backoff-max", type=float, default=0.2)
+    parser.add_argument("--hedge-percentile", type=float, default=0.9)
+    parser.add_argument("--hedge-min-samples", type=int, default=20)
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    parser.add_argument("--breaker-reset", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "bare": run_sync(args, build_chain(args, args.error_rate)),
+        "deadline_retries": run_sync(args, build_chain(args, args.error_rate), make_policy(args, hedge=False)),
+        "deadline_retries_hedged": run_sync(args, build_chain(args, args.error_rate), make_policy(args, hedge=True)),
+        "async_deadline_retries_hedged": run_async(args, build_chain(args, args.error_rate), make_policy(args, hedge=True)),
+        "outage": run_outage(args),
+    }, indent=2))
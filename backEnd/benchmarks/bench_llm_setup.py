@@ -0,0 +1,61 @@
+"""
+Measure the per-call setup cost of the recipe and analysis LLM clients:
+building everything on each call (the old behaviour) against the shared
+client registry. No requests are sent to the API.
+
+Usage: python benchmarks/bench_llm_setup.py [--calls 50]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from llm_clients import llm_clients
+from recipe_service import RecipeList, get_recipe_chain, prompt_template
+from pantry_analyzer import LLMPantryResponse, MODEL_NAME
+
+def build_per_call():
+    """What generate_recipes and analyze_pantry_images used to do on every call."""
+    llm = ChatGoogleGenerativeAI(model=MODEL_NAME, temperature=0.7)
+    parser = PydanticOutputParser(pydantic_object=RecipeList)
+    template = ChatPromptTemplate.from_messages(prompt_template.messages)
+    chain = template | llm | parser
+    parser.get_format_instructions()
+    ChatGoogleGenerativeAI(model=MODEL_NAME).with_structured_output(LLMPantryResponse)
+    return chain
+
+def build_shared():
+    get_recipe_chain(MODEL_NAME)
+    return llm_clients.structured_model(MODEL_NAME, LLMPantryResponse)
+
+def time_calls(fn, calls: int) -> dict:
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "per_call": time_calls(build_per_call, args.calls),
+        "shared": time_calls(build_shared, args.calls),
+    }, indent=2))
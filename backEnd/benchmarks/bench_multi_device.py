@@ -0,0 +1,106 @@
+"""
+Simulate several cameras posting captures at once and compare one shared
+capture pipeline (the old single-camera globals) with a pipeline per device.
+
+Each camera sends a capture every --interval seconds for --duration seconds.
+The model call is stubbed with a sleep. Reports analyses applied per device,
+rejected captures, and how many analysed pairs mixed images from two cameras.
+
+Usage: python benchmarks/bench_multi_device.py [--devices 16] [--llm-latency 0.5]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from analysis_queue import AnalysisPool, QueueFullError
+from devices import DevicePipeline, DeviceRegistry
+
+def run(mode: str, devices: int, duration: float, interval: float, llm_latency: float,
+        workers: int, max_queue: int, seed: int) -> dict:
+    lock = threading.Lock()
+    applied = {f"cam-{i}": 0 for i in range(devices)}
+    mixed_pairs = [0]
+
+    def stub_analyze(before, after, changed_blocks=None):
+        time.sleep(llm_latency)
+        return before, after
+
+    def build(device_id):
+        def apply(pair):
+            before, after = pair
+            with lock:
+                if before[0] != after[0]:
+                    mixed_pairs[0] += 1
+                applied[after[0]] += 1
+        pool = AnalysisPool(stub_analyze, apply, workers=workers, max_queue=max_queue, policy="reject")
+        pool.start()
+        return DevicePipeline(device_id, pool)
+
+    registry = DeviceRegistry(build, max_devices=devices)
+    rejected = {device_id: 0 for device_id in applied}
+    ingest = []
+
+    def camera(device_id: str, rng: random.Random):
+        pipeline = registry.get("shared" if mode == "shared" else device_id)
+        time.sleep(rng.uniform(0, interval))
+        n = 0
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            n += 1
+            start = time.perf_counter()
+            try:
+                # Captures are tagged with their camera so mixed pairs can be counted
+                pipeline.submit_capture((device_id, n))
+            except QueueFullError:
+                with lock:
+                    rejected[device_id] += 1
+            with lock:
+                ingest.append(time.perf_counter() - start)
+            time.sleep(interval * rng.uniform(0.8, 1.2))
+
+    rng = random.Random(seed)
+    threads = [threading.Thread(target=camera, args=(device_id, random.Random(rng.random())))
+               for device_id in applied]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    registry.close()
+
+    per_device = sorted(count / elapsed for count in applied.values())
+    ingest.sort()
+    return {
+        "mode": mode,
+        "devices": devices,
+        "analyses_applied": sum(applied.values()),
+        "analyses_per_s_total": round(sum(applied.values()) / elapsed, 2),
+        "analyses_per_s_per_device_min": round(per_device[0], 2),
+        "analyses_per_s_per_device_max": round(per_device[-1], 2),
+        "captures_rejected": sum(rejected.values()),
+        "mixed_device_pairs": mixed_pairs[0],
+        "capture_ingest_p99_ms": round(ingest[int(len(ingest) * 0.99)] * 1000, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = [run(mode, args.devices, args.duration, args.interval, args.llm_latency,
+                   args.workers, args.max_queue, args.seed)
+               for mode in ("shared", "per_device")]
+    print(json.dumps(results, indent=2))
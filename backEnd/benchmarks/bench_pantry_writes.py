@@ -0,0 +1,88 @@
+"""
+Compare single-item write latency of the old full-rewrite path against the
+journalled pantry store.
+
+Usage: python benchmarks/bench_pantry_writes.py [--writes 200]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pantry_store import PantryStore, empty_pantry_state
+
+SIZES = [100, 10_000, 100_000]
+
+def make_state(n: int) -> dict:
+    state = empty_pantry_state()
+    for i in range(n):
+        item_id = str(uuid.uuid4())
+        state["item_registry"][f"item {i}"] = item_id
+        state["current_full_inventory"].append({"id": item_id, "name": f"Item {i}", "expiry_date": "2026-12-31"})
+    return state
+
+def full_rewrite_write(path: str, item: dict):
+    """The pre-store behaviour of POST /api/inventory: load, append, dump everything."""
+    with open(path, "r") as f:
+        pantry_data = json.load(f)
+    pantry_data["current_full_inventory"].append(item)
+    with open(path, "w") as f:
+        json.dump(pantry_data, f, indent=4)
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+def bench(n: int, writes: int) -> dict:
+    workdir = tempfile.mkdtemp()
+    state_path = os.path.join(workdir, "pantry_state.json")
+    with open(state_path, "w") as f:
+        json.dump(make_state(n), f, indent=4)
+
+    # Full rewrite gets fewer iterations at 100k items, it takes seconds per write
+    rewrite_writes = max(5, min(writes, 2_000_000 // n))
+    rewrite = []
+    for i in range(rewrite_writes):
+        start = time.perf_counter()
+        full_rewrite_write(state_path, {"id": str(uuid.uuid4()), "name": f"New {i}", "expiry_date": None})
+        rewrite.append(time.perf_counter() - start)
+
+    # The journal path includes the amortized fsync every `batch` writes,
+    # which is what the background writer does in the server
+    store = PantryStore(state_path, os.path.join(workdir, "pantry_state.journal"), 0.2, 1024 * 1024)
+    journal = []
+    batch = 20
+    for i in range(writes):
+        start = time.perf_counter()
+        store.add_item({"id": store.registry.resolve(f"journal {i}"), "name": f"Journal {i}", "expiry_date": None})
+        if i % batch == batch - 1:
+            store.flush()
+        journal.append(time.perf_counter() - start)
+    store.close()
+
+    return {
+        "items": n,
+        "full_rewrite": summarize(rewrite),
+        "journal": summarize(journal),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    results = [bench(n, args.writes) for n in SIZES]
+    for r in results:
+        print(f"{r['items']:>7} items | full rewrite p50 {r['full_rewrite']['p50_ms']:>9} ms"
+              f" | journal p50 {r['journal']['p50_ms']:>7} ms (p99 {r['journal']['p99_ms']} ms)")
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,184 @@
+"""
+Request throughput against the number of worker processes.
+
+For each --workers count, starts a throwaway copy of the backend under
+`uvicorn asgi_app:app --workers N` with PANTRY_SHARED_DIR set and the stub
+LLM, then runs --clients load processes for --duration seconds. Each client
+posts live frames for its devices, reads them back through /latest_image and
+/api/analysis/status, and every --capture-every requests posts a capture.
+Every --write-every requests a client adds a pantry item and sends a
+heartbeat for its bot, so every worker writes to the shared pantry and bot
+registry.
+
+Clients open a new connection per request. A keep-alive connection stays
+with the worker that accepted it, so it would not spread load, and uvicorn's
+worker processes don't set TCP_NODELAY on the sockets they inherit, which
+adds ~40 ms of Nagle delay to every keep-alive response.
+
+Afterwards it checks that every capture was dispatched for analysis exactly
+once across workers: the analysis leaders' dispatch counters (collected from
+every worker) must add up to the captures the shared ring received, and the
+ring's completed cursor must reach its newest capture. It also
+checks that every worker reports the same pantry version and epoch, that the
+version counts every item added, and that every worker knows every bot.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --clients 4 --duration 15
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_fleet import BACKEND_DIR, free_port, generate_fixtures
+
+sys.path.insert(0, BACKEND_DIR)
+from config import BOT_SHARED_FLUSH_INTERVAL
+
+def spawn_workers(workers: int, workdir: str) -> tuple:
+    shutil.copytree(BACKEND_DIR, workdir, ignore=shutil.ignore_patterns(
+        "benchmarks", "__pycache__", "*.journal*", "captures.ring", "pipeline_traces.jsonl*"))
+    port = free_port()
+    env = dict(os.environ, LLM_BACKEND="stub", PANTRY_SHARED_DIR=os.path.join(workdir, "shm"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            httpx.get(f"{base_url}/api/analysis/status", timeout=1.0)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Workers did not start")
+
+def client(index: int, args, base_url: str, frames: list, results):
+    rng = random.Random(index)
+    devices = [f"bench-{index}-{i}" for i in range(args.devices_per_client)]
+    latencies, errors, captures, items_added = [], 0, 0, 0
+    deadline = time.time() + args.duration
+    with httpx.Client(base_url=base_url, timeout=5.0, headers={"Connection": "close"}) as http:
+        count = 0
+        while time.time() < deadline:
+            device = rng.choice(devices)
+            headers = {"X-Device-ID": device}
+            count += 1
+            start = time.perf_counter()
+            try:
+                if count % args.capture_every == 0:
+                    response = http.post("/api/capture", content=rng.choice(frames), headers=headers)
+                    captures += response.status_code == 200
+                elif count % args.write_every == 0:
+                    response = http.post("/api/inventory", json={"name": f"Item {index}-{count}", "quantity": 1})
+                    items_added += response.status_code == 201
+                    http.post("/api/bots", json={"id": f"bench-bot-{index}", "battery": 90})
+                elif count % 5 == 0:
+                    response = http.get("/latest_image", params={"device": device})
+                elif count % 7 == 0:
+                    response = http.get("/api/analysis/status")
+                else:
+                    response = http.post("/api/frame", content=rng.choice(frames), headers=headers)
+                errors += response.status_code >= 500
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    results.put({"latencies": latencies, "errors": errors, "captures": captures, "items_added": items_added})
+
+def collect_worker_status(base_url: str, workers: int) -> dict:
+    """Status of every worker, found by asking until each pid has answered"""
+    seen = {}
+    with httpx.Client(base_url=base_url, timeout=5.0, headers={"Connection": "close"}) as http:
+        for _ in range(workers * 50):
+            status = http.get("/api/analysis/status").json()
+            seen[status["workers"]["leader"]["pid"]] = status
+            if len(seen) == workers:
+                break
+    return seen
+
+def run(workers: int, args, frames: list) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    process, base_url = spawn_workers(workers, os.path.join(workdir, "backEnd"))
+    try:
+        initial = httpx.get(f"{base_url}/api/analysis/status").json()
+        start_version, start_bots = initial["workers"]["pantry"]["version"], initial["bots"]["bots"]
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(i, args, base_url, frames, results))
+                   for i in range(args.clients)]
+        for p in clients:
+            p.start()
+        reports = [results.get() for _ in clients]
+        for p in clients:
+            p.join()
+
+        # Wait for the leader to pick up and finish the last captures
+        for _ in range(300):
+            history = httpx.get(f"{base_url}/api/analysis/status").json()["capture_history"]
+            if history["completed_seq"] == history["newest_seq"]:
+                break
+            time.sleep(0.1)
+        # Let every worker merge the others' bot heartbeats
+        time.sleep(2 * BOT_SHARED_FLUSH_INTERVAL + 0.5)
+        statuses = collect_worker_status(base_url, workers)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(sample for report in reports for sample in report["latencies"])
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+    captures = sum(report["captures"] for report in reports)
+    dispatched = sum(status["workers"]["leader"]["dispatched"] for status in statuses.values())
+    items_added = sum(report["items_added"] for report in reports)
+    pantries = {(status["workers"]["pantry"]["version"], status["workers"]["pantry"]["epoch"])
+                for status in statuses.values()}
+    versions = {version for version, _ in pantries}
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+        "errors": sum(report["errors"] for report in reports),
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "workers_reporting": len(statuses),
+        "leaders": sum(1 for status in statuses.values() if status["workers"]["leader"]["is_leader"]),
+        "captures_accepted": captures,
+        "captures_dispatched": dispatched,
+        "dispatched_exactly_once": captures == dispatched,
+        "all_completed": history["completed_seq"] == history["newest_seq"],
+        "items_added": items_added,
+        "pantry_versions": sorted(versions),
+        # Besides the adds, analysis results also bump the version
+        "pantry_consistent": len(pantries) == 1 and max(versions) >= start_version + items_added,
+        "bots_known": sorted(status["bots"]["bots"] for status in statuses.values()),
+        "bots_consistent": all(status["bots"]["bots"] == start_bots + args.clients for status in statuses.values()),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4, help="load generating processes")
+    parser.add_argument("--devices-per-client", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--capture-every", type=int, default=25, help="one capture per this many requests")
+    parser.add_argument("--write-every", type=int, default=11, help="one pantry add and bot heartbeat per this many requests")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    frames = generate_fixtures(8, seed=1)
+    report = {"cpus": os.cpu_count(), "runs": [run(workers, args, frames) for workers in args.workers]}
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
@@ -0,0 +1,262 @@
+"""
+Fleet load generator: N simulated ESP32 camera bots plus frontend pollers.
+
+Each simulated device replays the firmware's traffic (cam/src/main.cpp):
+  - a live frame POSTed to /api/frame every --frame-interval seconds (800 ms on the device)
+  - shelf events at random (--capture-interval seconds apart on average), each
+    sending --burst captures to /api/capture at least 5 s apart
+    (3 s settle delay + 2 s cooldown on the device)
+  - a status heartbeat POSTed to /api/bots every --bot-interval seconds (3 s on the device)
+Meanwhile --pollers clients GET /api/inventory every --poll-interval seconds,
+revalidating with If-None-Match like a browser does.
+
+Frames come from a folder of JPEG fixtures (--fixtures), or from a few
+generated images when no folder is given. Reports request count, error rate,
+throughput and p50/p95/p99 latency per endpoint as JSON, so two runs can be
+diffed.
+
+Against a running server:
+    python benchmarks/load_fleet.py --url http://127.0.0.1:5001 --devices 20 --duration 60
+Against a throwaway copy of this backend with the stub LLM (nothing in this folder is touched):
+    python benchmarks/load_fleet.py --spawn asgi --devices 20 --duration 60 --output asgi.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Firmware: delay(3000) before a triggered snapshot, then CAPTURE_COOLDOWN_MS = 2000
+CAPTURE_SPACING = 5.0
+
+# region fixtures
+def load_fixtures(folder: str) -> list:
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith((".jpg", ".jpeg")):
+            with open(os.path.join(folder, name), "rb") as f:
+                frames.append(f.read())
+    if not frames:
+        raise SystemExit(f"No .jpg fixtures in {folder}")
+    return frames
+
+def generate_fixtures(count: int, seed: int) -> list:
+    """VGA JPEGs of a few random 'items' on a shelf, about the size the camera sends"""
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        image = Image.new("RGB", (640, 480), (90, 80, 70))
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(3, 8)):
+            x, y = rng.randint(0, 560), rng.randint(0, 380)
+            draw.rectangle((x, y, x + rng.randint(30, 80), y + rng.randint(40, 100)),
+                           fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=80)
+        frames.append(buf.getvalue())
+    return frames
+# endregion
+
+# region spawned server
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_server(kind: str, workdir: str) -> tuple:
+    """Start a copy of the backend in `workdir` with LLM_BACKEND=stub. Returns (process, base url)."""
+    shutil.copytree(BACKEND_DIR, workdir, ignore=shutil.ignore_patterns("benchmarks", "__pycache__", "*.journal*"))
+    port = free_port()
+    if kind == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-c",
+                   f"import main; main.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=workdir, env=dict(os.environ, LLM_BACKEND="stub"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(150):
+        try:
+            httpx.get(f"{base_url}/api/analysis/status", timeout=1.0)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Spawned server did not start")
+# endregion
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[name].append(time.perf_counter() - start)
+            self.statuses[name][type(e).__name__] += 1
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        self.statuses[name][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(self.latencies):
+            samples = sorted(self.latencies[name])
+            def pct(p):
+                return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(samples), 4),
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "p50_ms": pct(0.50),
+                "p95_ms": pct(0.95),
+                "p99_ms": pct(0.99),
+                "max_ms": round(samples[-1] * 1000, 2),
+                "status_counts": dict(self.statuses[name]),
+            }
+        return endpoints
+
+# region simulated clients
+async def device(index: int, args, frames: list, recorder: Recorder, client: httpx.AsyncClient):
+    rng = random.Random(args.seed * 1000 + index)
+    device_id = f"sim-{index:03d}"
+    headers = {"Content-Type": "image/jpeg"}
+    if not args.no_device_header:
+        headers["X-Device-ID"] = device_id
+
+    def jitter(seconds: float) -> float:
+        return seconds * rng.uniform(1 - args.jitter, 1 + args.jitter)
+
+    async def frame_loop():
+        await asyncio.sleep(rng.uniform(0, args.frame_interval))
+        while True:
+            await recorder.request(client, "POST /api/frame", "POST", f"{args.url}/api/frame",
+                                   content=rng.choice(frames), headers=headers)
+            await asyncio.sleep(jitter(args.frame_interval))
+
+    async def capture_loop():
+        while True:
+            await asyncio.sleep(rng.expovariate(1 / args.capture_interval))
+            for i in range(rng.randint(1, args.burst)):
+                if i:
+                    await asyncio.sleep(CAPTURE_SPACING)
+                await recorder.request(client, "POST /api/capture", "POST", f"{args.url}/api/capture",
+                                       content=rng.choice(frames), headers=headers)
+
+    async def bot_loop():
+        await asyncio.sleep(rng.uniform(0, args.bot_interval))
+        battery = rng.uniform(50, 100)
+        while True:
+            battery = max(0.0, battery - 0.05)
+            await recorder.request(client, "POST /api/bots", "POST", f"{args.url}/api/bots",
+                                   json={"id": device_id, "status": "Connected", "battery": f"{battery:.2f}"})
+            await asyncio.sleep(jitter(args.bot_interval))
+
+    tasks = [asyncio.create_task(loop()) for loop in (frame_loop, capture_loop, bot_loop)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def poller(index: int, args, recorder: Recorder, client: httpx.AsyncClient):
+    rng = random.Random(args.seed * 1000 + 500 + index)
+    etag = None
+    await asyncio.sleep(rng.uniform(0, args.poll_interval))
+    while True:
+        headers = {"If-None-Match": etag} if etag and not args.no_etag else {}
+        response = await recorder.request(client, "GET /api/inventory", "GET", f"{args.url}/api/inventory",
+                                          headers=headers)
+        if response is not None and response.status_code == 200:
+            etag = response.headers.get("ETag")
+        await asyncio.sleep(args.poll_interval)
+# endregion
+
+async def run(args, frames: list) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.time()
+        tasks = [asyncio.create_task(device(i, args, frames, recorder, client)) for i in range(args.devices)]
+        tasks += [asyncio.create_task(poller(i, args, recorder, client)) for i in range(args.pollers)]
+        await asyncio.sleep(args.duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.time() - start
+        status = (await client.get(f"{args.url}/api/analysis/status")).json()
+
+    # Analysis counters summed over every device's pool
+    pools = status.get("devices") or {"default": status}
+    analysis = {key: sum(pool.get(key, 0) for pool in pools.values())
+                for key in ("queue_depth", "submitted", "completed", "failed", "rejected", "dropped", "coalesced")}
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("url", "output")},
+        "duration_s": round(elapsed, 2),
+        "endpoints": recorder.report(elapsed),
+        "server_analysis": analysis,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--spawn", choices=["asgi", "flask"], help="start a throwaway copy of the backend with the stub LLM")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--pollers", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--frame-interval", type=float, default=0.8)
+    parser.add_argument("--capture-interval", type=float, default=20.0, help="mean seconds between shelf events per device")
+    parser.add_argument("--burst", type=int, default=2, help="most captures sent for one shelf event")
+    parser.add_argument("--bot-interval", type=float, default=3.0)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative jitter on the periodic intervals")
+    parser.add_argument("--timeout", type=float, default=2.5, help="client timeout, HTTP_TIMEOUT_MS on the device")
+    parser.add_argument("--fixtures", help="folder of .jpg frames; generated images are used if omitted")
+    parser.add_argument("--no-device-header", action="store_true", help="don't send X-Device-ID, like current firmware")
+    parser.add_argument("--no-etag", action="store_true", help="pollers always download the full inventory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    frames = load_fixtures(args.fixtures) if args.fixtures else generate_fixtures(8, args.seed)
+
+    process = None
+    workdir = tempfile.mkdtemp(prefix="load_fleet_")
+    try:
+        if args.spawn:
+            process, args.url = spawn_server(args.spawn, os.path.join(workdir, "backEnd"))
+        report = asyncio.run(run(args, frames))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
@@ -0,0 +1,119 @@
+"""
+Frame-ingest latency while recipe generation is saturated.
+
+Starts the backend in-process with the Gemini recipe call replaced by a sleep,
+posts a frame every --frame-interval seconds, and measures /api/frame latency
+first on an idle server and then while --recipe-clients clients keep
+/api/recipes busy.
+
+Usage:
+    python benchmarks/load_frame_ingest.py --server asgi
+    python benchmarks/load_frame_ingest.py --server flask
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+RECIPES_JSON = json.dumps({"recipes": [{"name": "Load test stew", "ingredients": ["water"]}]})
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(kind: str, port: int, llm_latency: float):
+    if kind == "asgi":
+        import uvicorn
+        import asgi_app
+
+        async def fake_generate_recipes_async(**kwargs):
+            await asyncio.sleep(llm_latency)
+            return RECIPES_JSON
+        asgi_app.generate_recipes_async = fake_generate_recipes_async
+
+        server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+    else:
+        from werkzeug.serving import make_server
+        import main
+
+        def fake_generate_recipes(**kwargs):
+            time.sleep(llm_latency)
+            return RECIPES_JSON
+        main.generate_recipes = fake_generate_recipes
+
+        server = make_server("127.0.0.1", port, main.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/analysis/status", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+def percentile(samples: list, p: float) -> float:
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+
+def measure_frames(base_url: str, frames: int, interval: float) -> dict:
+    frame = os.urandom(30_000)
+    latencies = []
+    with httpx.Client() as client:
+        for _ in range(frames):
+            start = time.perf_counter()
+            client.post(f"{base_url}/api/frame", content=frame, headers={"Content-Type": "image/jpeg"})
+            latencies.append(time.perf_counter() - start)
+            time.sleep(interval)
+    return {"p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95),
+            "max_ms": round(max(latencies) * 1000, 2)}
+
+def recipe_load(base_url: str, stop: threading.Event, completed: list):
+    with httpx.Client(timeout=120.0) as client:
+        while not stop.is_set():
+            client.post(f"{base_url}/api/recipes", json={"allergens": [], "force_refresh": True})
+            completed.append(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["asgi", "flask"], default="asgi")
+    parser.add_argument("--recipe-clients", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--frame-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    port = free_port()
+    start_server(args.server, port, args.llm_latency)
+    base_url = f"http://127.0.0.1:{port}"
+
+    idle = measure_frames(base_url, args.frames, args.frame_interval)
+
+    stop = threading.Event()
+    completed = []
+    clients = [threading.Thread(target=recipe_load, args=(base_url, stop, completed), daemon=True)
+               for _ in range(args.recipe_clients)]
+    for t in clients:
+        t.start()
+    time.sleep(args.llm_latency)  # let the recipe route saturate first
+    loaded = measure_frames(base_url, args.frames, args.frame_interval)
+    stop.set()
+
+    print(json.dumps({
+        "server": args.server,
+        "recipe_clients": args.recipe_clients,
+        "llm_latency_s": args.llm_latency,
+        "frame_idle": idle,
+        "frame_under_recipe_load": loaded,
+        "recipes_completed": len(completed),
+    }, indent=2))
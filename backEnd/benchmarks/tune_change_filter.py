@@ -0,0 +1,64 @@
+"""
+Score a fixture set of capture pairs with the change filter and suggest a threshold.
+
+Fixtures are laid out as
+    <fixtures>/changed/<pair name>/before.jpg, after.jpg
+    <fixtures>/unchanged/<pair name>/before.jpg, after.jpg
+
+Usage: python benchmarks/tune_change_filter.py <fixtures> [--block-threshold 0.5]
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from change_filter import ChangeFilter
+from config import CHANGE_FILTER_SIZE, CHANGE_FILTER_GRID, CHANGE_FILTER_BLOCK_THRESHOLD, CHANGE_FILTER_THRESHOLD
+
+def load_pairs(fixtures: str, label: str):
+    root = os.path.join(fixtures, label)
+    if not os.path.isdir(root):
+        return
+    for name in sorted(os.listdir(root)):
+        pair_dir = os.path.join(root, name)
+        with open(os.path.join(pair_dir, "before.jpg"), "rb") as f:
+            before = f.read()
+        with open(os.path.join(pair_dir, "after.jpg"), "rb") as f:
+            after = f.read()
+        yield name, before, after
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fixtures")
+    parser.add_argument("--block-threshold", type=float, default=CHANGE_FILTER_BLOCK_THRESHOLD)
+    parser.add_argument("--threshold", type=float, default=CHANGE_FILTER_THRESHOLD)
+    args = parser.parse_args()
+
+    change_filter = ChangeFilter(True, CHANGE_FILTER_SIZE, CHANGE_FILTER_GRID, args.block_threshold, args.threshold)
+
+    rows = []
+    for label in ("changed", "unchanged"):
+        for name, before, after in load_pairs(args.fixtures, label):
+            result = change_filter.compare(before, after)
+            result.pop("changed_blocks")
+            rows.append({"pair": f"{label}/{name}", "label": label, **result})
+            print(f"{label:>9}/{name:<30} score {result['score']:<7}"
+                  f" decode {result['decode_ms']} ms  diff {result['diff_ms']} ms")
+
+    changed_scores = [r["score"] for r in rows if r["label"] == "changed"]
+    unchanged_scores = [r["score"] for r in rows if r["label"] == "unchanged"]
+    summary = {"pairs": len(rows), "block_threshold": args.block_threshold, "threshold": args.threshold}
+    if changed_scores:
+        # The highest threshold that still sends every real change to the model
+        suggested = min(changed_scores)
+        summary["suggested_threshold"] = suggested
+        summary["unchanged_skipped_at_suggested"] = sum(s < suggested for s in unchanged_scores)
+    summary["false_skips"] = sum(s < args.threshold for s in changed_scores)
+    summary["unchanged_skipped"] = sum(s < args.threshold for s in unchanged_scores)
+    summary["unchanged_total"] = len(unchanged_scores)
+    if rows:
+        summary["avg_decode_ms"] = round(sum(r["decode_ms"] for r in rows) / len(rows), 3)
+        summary["avg_diff_ms"] = round(sum(r["diff_ms"] for r in rows) / len(rows), 3)
+    print(json.dumps(summary, indent=2))
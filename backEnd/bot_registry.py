@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+from metrics import persist_seconds
+
+class BotRegistry:
+    """
+    In-memory status of every ESP32 bot, keyed by bot ID.
+
+    A status POST is a heartbeat: it replaces the bot's entry in O(1) and
+    records when it was seen. Connected/Disconnected is worked out from the
+    age of the last heartbeat rather than taken from the bot, since a bot
+    that lost power never gets to say it disconnected.
+
+    GET requests share one serialized snapshot, rebuilt only after a visible
+    change or when a bot's heartbeat is about to expire. A background writer
+    saves the registry to disk at most every `flush_interval` seconds.
+
+    With `lock_path`, worker processes share the registry through the file:
+    each flush takes an fcntl lock on `lock_path`, folds in the heartbeats
+    other workers saved (the newest heartbeat of a bot wins) and saves the
+    result, so every worker's view lags by at most two flush intervals.
+    """
+
+    def __init__(self, path: str, heartbeat_ttl: float, flush_interval: float, lock_path: Optional[str] = None):
+        self.path = path
+        self.heartbeat_ttl = heartbeat_ttl
+        self.flush_interval = flush_interval
+        self._lock_fd = None
+        if lock_path:
+            os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+            self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        self._bots: Dict[str, dict] = self._load()
+        self._last_seen: Dict[str, float] = {bot_id: bot.pop("last_seen", 0.0) for bot_id, bot in self._bots.items()}
+        self._dirty = False
+        self._snapshot: Optional[Tuple[str, str]] = None  # (body, etag)
+        self._snapshot_expires = 0.0
+        self._stop = threading.Event()
+        self._writer = None
+        self.stats = {"heartbeats": 0, "snapshots_built": 0, "flushes": 0}
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not load {self.path}, starting empty: {e}")
+            return {}
+        # Older files may list the same bot twice; the last entry wins
+        bots = {}
+        for entry in entries:
+            if isinstance(entry, dict) and "id" in entry:
+                entry.pop("status", None)
+                bots[str(entry["id"])] = entry
+        return bots
+
+    def _status(self, bot_id: str, now: float) -> str:
+        return "Connected" if now - self._last_seen.get(bot_id, 0.0) <= self.heartbeat_ttl else "Disconnected"
+
+    def heartbeat(self, bot_update: dict) -> dict:
+        """Store a bot's latest report and return it with the derived status."""
+        bot_id = str(bot_update["id"])
+        entry = {key: value for key, value in bot_update.items() if key != "status"}
+        entry["id"] = bot_id
+        now = time.time()
+        with self._lock:
+            was_connected = self._status(bot_id, now) == "Connected"
+            if entry != self._bots.get(bot_id) or not was_connected:
+                # Only a visible change invalidates the snapshot, not a repeat heartbeat
+                self._snapshot = None
+            if not was_connected:
+                print(f"Bot {bot_id} connected | Battery: {entry.get('battery', 'N/A')}")
+            self._bots[bot_id] = entry
+            self._last_seen[bot_id] = now
+            self._dirty = True
+            self.stats["heartbeats"] += 1
+        return dict(entry, status="Connected")
+
+    def snapshot(self) -> Tuple[str, str]:
+        """(JSON list of every bot with its derived status, ETag of that list), shared between readers."""
+        now = time.time()
+        with self._lock:
+            if self._snapshot is not None and now < self._snapshot_expires:
+                return self._snapshot
+            bots = [dict(bot, status=self._status(bot_id, now)) for bot_id, bot in self._bots.items()]
+            # The snapshot goes stale when the oldest connected heartbeat expires
+            connected = [self._last_seen[bot_id] for bot_id in self._bots if self._status(bot_id, now) == "Connected"]
+            self._snapshot_expires = min(connected) + self.heartbeat_ttl if connected else float("inf")
+            body = json.dumps(bots)
+            self._snapshot = (body, hashlib.sha1(body.encode()).hexdigest()[:16])
+            self.stats["snapshots_built"] += 1
+            return self._snapshot
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            connected = sum(1 for bot_id in self._bots if self._status(bot_id, now) == "Connected")
+            return {"bots": len(self._bots), "connected": connected, **self.stats}
+
+    # region persistence
+    def flush(self):
+        """Write the registry to disk if anything changed since the last flush."""
+        if self._lock_fd is not None:
+            return self._merge()
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            entries = [dict(bot, status=self._status(bot_id, now), last_seen=self._last_seen[bot_id])
+                       for bot_id, bot in self._bots.items()]
+            self._dirty = False
+
+        try:
+            self._save(entries)
+        except IOError as e:
+            print(f"Warning: Could not save bot registry: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def _save(self, entries: list):
+        start = time.perf_counter()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=4)
+        os.replace(tmp_path, self.path)
+        persist_seconds.observe(time.perf_counter() - start, "bots")
+        self.stats["flushes"] += 1
+
+    def _merge(self):
+        """flush() for a registry shared between worker processes"""
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            saved = self._load()
+            saved_seen = {bot_id: bot.pop("last_seen", 0.0) for bot_id, bot in saved.items()}
+            now = time.time()
+            with self._lock:
+                for bot_id, bot in saved.items():
+                    if saved_seen[bot_id] > self._last_seen.get(bot_id, -1.0):
+                        self._bots[bot_id] = bot
+                        self._last_seen[bot_id] = saved_seen[bot_id]
+                        self._snapshot = None
+                # Save when this worker has heard from a bot more recently than the file says
+                if not any(seen > saved_seen.get(bot_id, -1.0) for bot_id, seen in self._last_seen.items()):
+                    return
+                entries = [dict(bot, status=self._status(bot_id, now), last_seen=self._last_seen[bot_id])
+                           for bot_id, bot in self._bots.items()]
+                self._dirty = False
+            self._save(entries)
+        except IOError as e:
+            print(f"Warning: Could not save bot registry: {e}")
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    def _writer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start the background writer. Safe to call more than once."""
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._writer_loop, name="bot-registry-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """Stop the background writer and save any pending changes."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+    # endregion
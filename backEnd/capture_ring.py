@@ -0,0 +1,398 @@
+import os
+import mmap
+import zlib
+import time
+import fcntl
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from config import CAPTURE_RING_FILE, CAPTURE_RING_BYTES
+
+FILE_MAGIC = b"PANTRYCR"
+FILE_VERSION = 3
+FILE_HEADER = struct.Struct("<8sIQ")  # magic, version, size of the record area
+STATE = struct.Struct("<QQQQ")  # head, next seq, last seq dispatched for analysis, last seq completed
+STATE_OFFSET = 32
+DATA_START = 64  # record area starts after the file header, padded
+
+RECORD_MAGIC = 0x50414E43
+RECORD_HEADER = struct.Struct("<IIQdII64s")  # magic, record length, seq, timestamp, JPEG size, crc32, device id
+ALIGN = 8
+
+SERVE_CHUNK = 64 * 1024
+
+def _aligned(size: int) -> int:
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+class CaptureRecord(NamedTuple):
+    seq: int
+    device_id: str
+    timestamp: float
+    start: int  # offset of the record in the record area
+    length: int  # header + JPEG, padded
+    size: int  # JPEG bytes
+
+    @property
+    def payload(self) -> Tuple[int, int]:
+        """(first, last + 1) file offsets of the JPEG"""
+        first = DATA_START + self.start + RECORD_HEADER.size
+        return first, first + self.size
+
+class CaptureRing:
+    """
+    The last captures of every device, kept in a fixed-size memory-mapped file.
+
+    Records (header + JPEG) are written one after another around a ring; a
+    record that no longer fits before the end of the file starts over at the
+    beginning, and the oldest records are overwritten to make room. An
+    in-memory index maps sequence numbers to offsets, so lookups never touch
+    the file and images are read as memoryviews of the mapping. The index is
+    rebuilt by scanning the file on startup, so history survives restarts;
+    each record carries a crc32 of its JPEG to skip records torn by a crash.
+    Memory and disk use stay at `size` bytes however long the server runs.
+    `path` None keeps the ring in anonymous memory only.
+
+    Several worker processes can share one ring file: appends are serialized
+    with an fcntl lock on the file, the head and next sequence number live
+    in the file header, and each process replays records appended by the
+    others into its own index before reading. The header also holds two
+    analysis cursors: the last capture handed to a pipeline, and the last one
+    before which every capture's analysis has finished. A worker that takes
+    over analysis from a leader that died re-dispatches the captures between
+    the two.
+    """
+
+    def __init__(self, path: Optional[str], size: int):
+        self.path = path
+        self.data_size = size
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[int, CaptureRecord]" = OrderedDict()  # oldest first
+        self._latest: Dict[str, int] = {}  # device id -> newest seq
+        self._head = 0  # where the next record goes
+        self._next_seq = 1
+        self._in_flight = set()  # captures this process dispatched whose analysis hasn't finished
+        self.stats = {"appended": 0, "overwritten": 0, "recovered": 0, "too_large": 0, "cut_short": 0, "replayed": 0}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644) if path is not None else None
+        with self._file_lock():
+            self._map = self._open()
+            self._recover()
+            self._write_state()
+
+    # region file
+    @contextmanager
+    def _file_lock(self, mode: int = fcntl.LOCK_EX):
+        """Lock against other processes using the same file; a no-op for an anonymous ring."""
+        if self._fd is None:
+            yield
+            return
+        fcntl.lockf(self._fd, mode)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _open(self) -> mmap.mmap:
+        total = DATA_START + self.data_size
+        header = FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.data_size)
+        if self._fd is None:
+            mapping = mmap.mmap(-1, total)
+            mapping[:FILE_HEADER.size] = header
+            return mapping
+
+        existing = os.pread(self._fd, FILE_HEADER.size, 0)
+        if existing != header or os.fstat(self._fd).st_size != total:
+            if existing:
+                print(f"Warning: {self.path} has a different size or format, starting an empty capture history")
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, total)
+            os.pwrite(self._fd, header, 0)
+        return mmap.mmap(self._fd, total)
+
+    def _write_state(self, dispatched: Optional[int] = None, completed: Optional[int] = None):
+        """Write the head and next seq, and the cursors given. Caller holds the file lock."""
+        _, _, old_dispatched, old_completed = STATE.unpack_from(self._map, STATE_OFFSET)
+        STATE.pack_into(self._map, STATE_OFFSET, self._head, self._next_seq,
+                        old_dispatched if dispatched is None else dispatched,
+                        old_completed if completed is None else completed)
+
+    def _read_record(self, start: int) -> Optional[CaptureRecord]:
+        """The record at `start` if it is complete and its JPEG matches its crc32"""
+        if start + RECORD_HEADER.size > self.data_size:
+            return None
+        magic, length, seq, timestamp, size, crc, device = RECORD_HEADER.unpack_from(self._map, DATA_START + start)
+        if magic != RECORD_MAGIC or length != _aligned(RECORD_HEADER.size + size) or start + length > self.data_size:
+            return None
+        record = CaptureRecord(seq, device.rstrip(b"\0").decode("utf-8", "replace"), timestamp, start, length, size)
+        first, end = record.payload
+        if zlib.crc32(memoryview(self._map)[first:end]) != crc:
+            return None
+        return record
+
+    def _recover(self):
+        """Rebuild the index from the records still intact in the file."""
+        found = []
+        needle = struct.pack("<I", RECORD_MAGIC)
+        pos = DATA_START
+        end = DATA_START + self.data_size
+        while True:
+            pos = self._map.find(needle, pos, end)
+            if pos < 0:
+                break
+            record = self._read_record(pos - DATA_START) if (pos - DATA_START) % ALIGN == 0 else None
+            if record is None:
+                pos += 1
+                continue
+            found.append(record)
+            pos += record.length
+        if not found:
+            return
+
+        # Keep the newest record and walk back through older ones as long as they sit
+        # in ring order (descending offsets, wrapping around the end at most once)
+        found.sort(key=lambda record: record.seq, reverse=True)
+        newest = found[0]
+        head = newest.start + newest.length
+        kept = [newest]
+        boundary = newest.start
+        wrapped = False
+        for record in found[1:]:
+            if record.start + record.length <= boundary and (not wrapped or record.start >= head):
+                kept.append(record)
+                boundary = record.start
+            elif not wrapped and record.start >= head:
+                wrapped = True
+                kept.append(record)
+                boundary = record.start
+            else:
+                break
+
+        for record in reversed(kept):
+            self._index[record.seq] = record
+            self._latest[record.device_id] = record.seq
+        self._head = head
+        self._next_seq = newest.seq + 1
+        self.stats["recovered"] = len(kept)
+        print(f"Capture history: recovered {len(kept)} captures from {self.path}")
+
+    def _sync(self):
+        """
+        Replay records other processes appended since this one last looked.
+        Caller holds self._lock and the file lock.
+        """
+        next_seq = STATE.unpack_from(self._map, STATE_OFFSET)[1]
+        while self._next_seq < next_seq:
+            # The writer put the record at our head, or wrapped to the start of the ring
+            record = self._read_record(self._head)
+            if record is None or record.seq != self._next_seq:
+                record = self._read_record(0)
+            if record is not None and record.seq == self._next_seq:
+                self._make_room(record.length, clear=False)
+            if record is None or record.seq != self._next_seq or record.start != self._head:
+                # Fell a whole ring behind: rebuild the index from the file
+                self._index.clear()
+                self._latest.clear()
+                self._head, self._next_seq = 0, 1
+                self._recover()
+                return
+            self._add(record)
+            self.stats["replayed"] += 1
+
+    def refresh(self):
+        """Pick up captures appended by other worker processes."""
+        if self._fd is None or STATE.unpack_from(self._map, STATE_OFFSET)[1] == self._next_seq:
+            return
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+    # endregion
+
+    def _oldest(self) -> CaptureRecord:
+        return next(iter(self._index.values()))
+
+    def _evict_oldest(self):
+        seq, record = self._index.popitem(last=False)
+        if self._latest.get(record.device_id) == seq:
+            del self._latest[record.device_id]
+        self.stats["overwritten"] += 1
+
+    def _make_room(self, length: int, clear: bool):
+        """Move head to where a record of `length` bytes goes and drop the records it will overwrite."""
+        if self._head + length > self.data_size:
+            # Doesn't fit before the end: the records still after head are the oldest, drop them and wrap.
+            # The writer clears their magic, as they are not overwritten and a restart would bring them back.
+            while self._index and self._oldest().start >= self._head:
+                if clear:
+                    struct.pack_into("<I", self._map, DATA_START + self._oldest().start, 0)
+                self._evict_oldest()
+            self._head = 0
+        while self._index and self._head <= self._oldest().start < self._head + length:
+            self._evict_oldest()
+
+    def _add(self, record: CaptureRecord):
+        self._index[record.seq] = record
+        self._latest[record.device_id] = record.seq
+        self._head += record.length
+        self._next_seq = record.seq + 1
+
+    def append(self, data: bytes, device_id: str, timestamp: Optional[float] = None) -> Optional[int]:
+        """Store a capture and return its sequence number, or None if it is larger than the ring."""
+        length = _aligned(RECORD_HEADER.size + len(data))
+        if length > self.data_size:
+            self.stats["too_large"] += 1
+            return None
+        crc = zlib.crc32(data)
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self._lock, self._file_lock():
+            self._sync()
+            self._make_room(length, clear=True)
+            seq = self._next_seq
+            record = CaptureRecord(seq, device_id, timestamp, self._head, length, len(data))
+            first, end = record.payload
+            # JPEG first, header last, so a crash mid-write leaves no valid-looking record
+            self._map[first:end] = data
+            RECORD_HEADER.pack_into(self._map, DATA_START + record.start, RECORD_MAGIC, length, seq, timestamp,
+                                    len(data), crc, device_id.encode()[:64])
+            self._add(record)
+            self._write_state()
+            self.stats["appended"] += 1
+        return seq
+
+    # region analysis dispatch
+    def dispatched(self) -> int:
+        """Sequence number of the last capture handed to an analysis pipeline"""
+        return STATE.unpack_from(self._map, STATE_OFFSET)[2]
+
+    def completed(self) -> int:
+        """Sequence number up to which every dispatched capture's analysis has finished"""
+        return STATE.unpack_from(self._map, STATE_OFFSET)[3]
+
+    def mark_dispatched(self, seq: int):
+        """A capture was handed to a pipeline; call mark_completed(seq) once it is done with it"""
+        with self._lock, self._file_lock():
+            self._in_flight.add(seq)
+            if seq > self.dispatched():
+                self._sync()
+                self._write_state(dispatched=seq)
+
+    def mark_completed(self, seq: int):
+        """A dispatched capture's analysis finished, moving the completed cursor past every finished capture"""
+        with self._lock, self._file_lock():
+            self._in_flight.discard(seq)
+            completed = min(self._in_flight) - 1 if self._in_flight else self.dispatched()
+            if completed > self.completed():
+                self._sync()
+                self._write_state(completed=completed)
+
+    def rewind_dispatch(self) -> int:
+        """
+        Move the dispatch cursor back to the completed one, so the captures a
+        previous analysis leader dispatched but never finished are dispatched
+        again. Returns the completed cursor.
+        """
+        with self._lock, self._file_lock():
+            self._in_flight.clear()
+            completed = self.completed()
+            self._sync()
+            self._write_state(dispatched=completed)
+        return completed
+
+    def records_after(self, seq: int) -> List[CaptureRecord]:
+        """Captures still in the ring with a sequence number above `seq`, oldest first"""
+        self.refresh()
+        with self._lock:
+            return [record for record in self._index.values() if record.seq > seq]
+    # endregion
+
+    # region reads
+    def latest(self, device_id: str, upto: Optional[int] = None) -> Optional[int]:
+        """Sequence number of a device's newest capture still in the ring, optionally no newer than `upto`"""
+        self.refresh()
+        if upto is None:
+            return self._latest.get(device_id)
+        with self._lock:
+            return next((seq for seq, record in reversed(self._index.items())
+                         if seq <= upto and record.device_id == device_id), None)
+
+    def view(self, seq: int) -> Optional[Tuple[CaptureRecord, memoryview]]:
+        """(record, JPEG as a view of the mapping), or None once the capture was overwritten"""
+        self.refresh()
+        with self._lock:
+            record = self._index.get(seq)
+            if record is None:
+                return None
+            first, end = record.payload
+            return record, memoryview(self._map)[first:end]
+
+    def read(self, seq: int) -> Optional[bytes]:
+        """Copy of a capture's JPEG"""
+        found = self.view(seq)
+        return bytes(found[1]) if found is not None else None
+
+    def stream(self, seq: int) -> Optional[Tuple[CaptureRecord, Iterator[bytes]]]:
+        """
+        (record, chunks of its JPEG) for a response body. WSGI servers only
+        take bytes, so each chunk is copied out of the mapping, after checking
+        under the locks that the capture is still there. If it is overwritten
+        while a slow client is still reading, the body is cut short rather
+        than mixing in bytes of a newer capture.
+        """
+        found = self.view(seq)
+        if found is None:
+            return None
+        record, view = found
+
+        def chunks():
+            for offset in range(0, len(view), SERVE_CHUNK):
+                self.refresh()
+                with self._lock, self._file_lock(fcntl.LOCK_SH):
+                    chunk = bytes(view[offset:offset + SERVE_CHUNK]) if seq in self._index else None
+                if chunk is None:
+                    self.stats["cut_short"] += 1
+                    print(f"Warning: capture {seq} was overwritten while being served")
+                    return
+                yield chunk
+        return record, chunks()
+
+    def records(self, device_id: Optional[str] = None, limit: int = 50) -> List[CaptureRecord]:
+        """Newest first"""
+        self.refresh()
+        with self._lock:
+            records = list(reversed(self._index.values()))
+        if device_id is not None:
+            records = [record for record in records if record.device_id == device_id]
+        return records[:limit]
+
+    def status(self) -> dict:
+        self.refresh()
+        with self._lock:
+            used = sum(record.length for record in self._index.values())
+            return {
+                "file": self.path,
+                "size_bytes": self.data_size,
+                "used_bytes": used,
+                "captures": len(self._index),
+                "oldest_seq": next(iter(self._index), None),
+                "newest_seq": self._next_seq - 1 if self._index else None,
+                "dispatched_seq": self.dispatched(),
+                "completed_seq": self.completed(),
+                **self.stats,
+            }
+    # endregion
+
+    def close(self):
+        """Write dirty pages back and unmap the file."""
+        with self._lock:
+            self._map.flush()
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # a response still holds a view; the mapping goes when it is released
+            if self._fd is not None:
+                os.close(self._fd)
+
+capture_ring = CaptureRing(
+    os.path.join(os.path.dirname(__file__), CAPTURE_RING_FILE) if CAPTURE_RING_FILE else None,
+    CAPTURE_RING_BYTES
+)
@@ -0,0 +1,132 @@
+import io
+import time
+import threading
+from typing import Tuple
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+from config import (CHANGE_FILTER_ENABLED, CHANGE_FILTER_SIZE, CHANGE_FILTER_GRID,
+                    CHANGE_FILTER_BLOCK_THRESHOLD, CHANGE_FILTER_THRESHOLD)
+
+# region image helpers
+def decode_gray(image_bytes: bytes, size: Tuple[int, int]):
+    """Decode a JPEG into a small grayscale float array of the given (width, height)."""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder scale down by up to 8x while decoding, much cheaper than a full decode
+    image.draft("L", size)
+    image = image.convert("L").resize(size, Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+def normalize(pixels):
+    """Remove overall brightness and contrast so lighting shifts don't count as change."""
+    return (pixels - pixels.mean()) / (pixels.std() + 1e-6)
+
+def block_differences(before, after, grid: Tuple[int, int]):
+    """Mean absolute difference of each block in a (columns, rows) grid."""
+    cols, rows = grid
+    h, w = before.shape
+    diff = np.abs(before - after)[: h - h % rows, : w - w % cols]
+    blocks = diff.reshape(rows, diff.shape[0] // rows, cols, diff.shape[1] // cols)
+    return blocks.mean(axis=(1, 3))
+# endregion
+
+class ChangeFilter:
+    """
+    Cheap local check of whether a before/after capture pair shows a real shelf change.
+
+    Both images are decoded at low resolution, normalized for brightness and
+    compared block by block. The pair counts as changed when the fraction of
+    blocks that differ by more than `block_threshold` reaches `threshold`.
+    """
+
+    def __init__(self, enabled: bool, size: Tuple[int, int], grid: Tuple[int, int],
+                 block_threshold: float, threshold: float):
+        self.enabled = enabled and np is not None
+        if enabled and np is None:
+            print("Warning: numpy/Pillow not installed, change filter disabled")
+        self.size = size
+        self.grid = grid
+        self.block_threshold = block_threshold
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "skipped": 0, "decode_ms": 0.0, "diff_ms": 0.0}
+
+    def compare(self, before_bytes: bytes, after_bytes: bytes) -> dict:
+        """Score a capture pair. Returns the score, the verdict and per-stage timings."""
+        start = time.perf_counter()
+        before = decode_gray(before_bytes, self.size)
+        after = decode_gray(after_bytes, self.size)
+        decoded = time.perf_counter()
+
+        blocks = block_differences(normalize(before), normalize(after), self.grid)
+        changed_blocks = blocks > self.block_threshold
+        score = float(changed_blocks.mean())
+        done = time.perf_counter()
+
+        return {
+            "changed": score >= self.threshold,
+            "score": round(score, 4),
+            "changed_blocks": changed_blocks,
+            "decode_ms": round((decoded - start) * 1000, 3),
+            "diff_ms": round((done - decoded) * 1000, 3),
+        }
+
+    def check(self, before_bytes: bytes, after_bytes: bytes) -> dict:
+        """
+        compare() of a capture pair, counted in the stats. 'changed' is True
+        unless the filter is confident nothing on the shelf changed; when the
+        filter is off or can't read the pair, that is all the result holds.
+        """
+        if not self.enabled:
+            return {"changed": True}
+        try:
+            result = self.compare(before_bytes, after_bytes)
+        except Exception as e:
+            # Never skip a capture just because the filter couldn't read it
+            print(f"Warning: change filter failed, analyzing anyway: {e}")
+            return {"changed": True}
+
+        with self._lock:
+            self.stats["checked"] += 1
+            self.stats["skipped"] += 0 if result["changed"] else 1
+            self.stats["decode_ms"] += result["decode_ms"]
+            self.stats["diff_ms"] += result["diff_ms"]
+        return result
+
+    def locate(self, before_bytes: bytes, after_bytes: bytes):
+        """
+        The changed_blocks grid of a pair that never went through check(),
+        such as a pair uploaded to /api/analyze_pantry, or None when the filter
+        is off or can't read the pair. Not counted in the stats.
+        """
+        if not self.enabled:
+            return None
+        try:
+            return self.compare(before_bytes, after_bytes)["changed_blocks"]
+        except Exception:
+            return None
+
+    def status(self) -> dict:
+        with self._lock:
+            checked = self.stats["checked"]
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "checked": checked,
+                "skipped": self.stats["skipped"],
+                "avg_decode_ms": round(self.stats["decode_ms"] / checked, 3) if checked else 0.0,
+                "avg_diff_ms": round(self.stats["diff_ms"] / checked, 3) if checked else 0.0,
+            }
+
+change_filter = ChangeFilter(
+    CHANGE_FILTER_ENABLED,
+    CHANGE_FILTER_SIZE,
+    CHANGE_FILTER_GRID,
+    CHANGE_FILTER_BLOCK_THRESHOLD,
+    CHANGE_FILTER_THRESHOLD
+)
@@ -3,12 +3,106 @@ import os
 # API Keys
 GOOGLE_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 
+# LLM backend: "gemini", or "stub" to answer locally without network access or API spend
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+
 # File paths
 DB_FILE = "item_registry.json"
 PANTRY_STATE_FILE = "pantry_state.json"
+PANTRY_JOURNAL_FILE = "pantry_state.journal"
 BOTS_FILE = "bots.json"
 
 # Server settings
 HOST = "0.0.0.0"
 PORT = 5000
 DEBUG = True
+
+# Pantry store
+PANTRY_FLUSH_INTERVAL = 0.2  # seconds between journal fsyncs (max window of lost writes on a crash)
+PANTRY_COMPACT_BYTES = 1024 * 1024  # compact the journal into a snapshot once it grows past this
+PANTRY_CHANGE_LOG_SIZE = 256  # inventory changes kept for ?since= delta reads
+INVENTORY_STREAM_QUEUE = 64  # change events buffered per /api/inventory/stream client before it is resynced
+INVENTORY_STREAM_KEEPALIVE = 15.0  # seconds between keep-alive comments on an idle stream
+
+# Analysis worker pool
+ANALYSIS_WORKERS = 2  # concurrent Gemini calls for background capture analysis, per device
+ANALYSIS_MAX_CONCURRENT = 4  # analyses running at once across all devices' workers
+ANALYSIS_QUEUE_SIZE = 8  # capture pairs allowed to wait for a worker
+ANALYSIS_QUEUE_POLICY = "coalesce"  # when full: "reject" (429), "drop_oldest" or "coalesce"
+ANALYSIS_COALESCE_WINDOW = 10.0  # seconds a waiting pair keeps absorbing newer captures (0 = off)
+ANALYSIS_COALESCE_MAX_SPAN = 6  # most capture pairs merged into one analysis
+
+# Bot status
+BOT_HEARTBEAT_TTL = 10.0  # seconds without a status POST before a bot shows as disconnected
+BOT_FLUSH_INTERVAL = 5.0  # seconds between saves of bots.json
+BOT_SHARED_FLUSH_INTERVAL = 1.0  # with several workers, seconds between merges of bots.json with the other workers'
+
+# Capture devices (each camera sends its ID in an X-Device-ID header or ?device= parameter)
+DEFAULT_DEVICE_ID = "default"  # device of requests that don't send an ID
+MAX_DEVICES = 32  # cameras tracked at once, each with its own feed and analysis pool
+
+# Capture history (memory-mapped ring of the latest captures of every device)
+CAPTURE_RING_FILE = "captures.ring"  # None keeps the history in memory only, lost on restart
+CAPTURE_RING_BYTES = 64 * 1024 * 1024  # file size; the oldest captures are overwritten once it is full
+
+# Pipeline tracing (/api/debug/traces)
+TRACE_FILE = "pipeline_traces.jsonl"  # finished traces are appended here; None keeps them in memory only
+TRACE_FILE_MAX_BYTES = 5 * 1024 * 1024  # rotate the trace file once it grows past this
+TRACE_FILE_BACKUPS = 3  # rotated trace files kept
+TRACE_RECENT = 500  # finished traces kept in memory for the debug endpoint
+TRACE_FLUSH_INTERVAL = 1.0  # seconds between writes to the trace file
+
+# Multi-process serving (e.g. `uvicorn asgi_app:app --workers 4`)
+SHARED_DIR = os.environ.get("PANTRY_SHARED_DIR")  # e.g. "/dev/shm/pantry": workers share live frames, the pantry, bots and one analysis leader; None = single process
+SHARED_FRAME_BYTES = 512 * 1024  # largest live frame a shared frame slot holds
+SHARED_POLL_INTERVAL = 0.02  # seconds between video feed checks for frames posted to another worker
+LEADER_POLL_INTERVAL = 0.05  # seconds between checks for new captures on the analysis leader
+
+# Analysis result cache
+ANALYSIS_CACHE_MAX_BYTES = 4 * 1024 * 1024  # size cap of cached model responses
+ANALYSIS_CACHE_FILE = None  # e.g. "analysis_cache.json" to keep the cache across restarts
+
+# Change pre-filter (skips the model when a capture pair shows no shelf change)
+CHANGE_FILTER_ENABLED = True
+CHANGE_FILTER_SIZE = (64, 48)  # (width, height) both images are decoded down to
+CHANGE_FILTER_GRID = (8, 6)  # (columns, rows) of blocks compared
+CHANGE_FILTER_BLOCK_THRESHOLD = 0.5  # mean difference, in std units, for a block to count as changed
+CHANGE_FILTER_THRESHOLD = 0.02  # fraction of changed blocks needed to call the model (0.02: any one block of the 8x6 grid)
+
+# Image preparation before upload to the model (scaled full frames, plus close-ups of the changed region)
+IMAGE_PREP_ENABLED = True
+IMAGE_PREP_MARGIN = 0.1  # margin around the changed region in the close-ups, as a fraction of the frame size
+IMAGE_PREP_MAX_AREA = 0.6  # send no close-ups if the changed region covers more than this
+IMAGE_PREP_MAX_EDGE = 512  # longest edge in pixels of the images sent; below the camera's 640px so frames shrink
+IMAGE_PREP_MIN_DETAIL_EDGE = 128  # close-ups are always sent when the changed region is smaller than this in the scaled frames
+IMAGE_PREP_JPEG_QUALITY = 85
+
+# Recipes
+RECIPE_MODEL = "gemini-3-flash-preview"
+RECIPE_CACHE_TTL = 30 * 60  # seconds a generated recipe list is reused for the same pantry
+RECIPE_CACHE_SIZE = 32  # pantry/allergen combinations kept
+
+# LLM call policy (llm_policy.py): deadline, retries, hedging and circuit breaker around every Gemini call
+LLM_DEADLINE = 30.0  # seconds a call may take in total, retries and hedges included
+LLM_MAX_ATTEMPTS = 3  # tries per call when the error is transient (rate limit, overload, timeout)
+LLM_BACKOFF_BASE = 0.5  # seconds; retry n waits a random time up to base * 2**(n-1)
+LLM_BACKOFF_MAX = 4.0  # cap on the wait between retries
+LLM_HEDGE_PERCENTILE = 0.95  # send a duplicate request once an attempt is slower than this percentile of recent ones; None = off
+LLM_HEDGE_MIN_SAMPLES = 20  # successful attempts seen before hedging starts
+LLM_FIRST_TOKEN_TIMEOUT = 15.0  # seconds a streamed call may take to send its first chunk
+LLM_STREAM_IDLE_TIMEOUT = 10.0  # seconds a streamed call may go quiet between chunks
+LLM_BREAKER_FAILURES = 5  # failed attempts in a row that open the circuit (calls then fail at once)
+LLM_BREAKER_RESET = 30.0  # seconds the circuit stays open before one probe call is let through
+
+# Stub LLM backend (LLM_BACKEND = "stub")
+STUB_FIXTURES_DIR = "stub_fixtures"  # <SchemaName>.json answers; schemas without a file get random data
+STUB_SEED = 0
+STUB_LATENCY = ("lognormal", 1.5, 0.4)  # time to first token: ("fixed", s), ("uniform", lo, hi) or ("lognormal", median, sigma)
+STUB_TOKEN_INTERVAL = 0.02  # seconds between streamed chunks
+STUB_CHUNK_CHARS = 16  # characters per streamed chunk
+STUB_ERROR_RATE = 0.0  # fraction of calls that raise StubLLMError
+
+# Async serving mode (asgi_app.py)
+ASGI_INGEST_CONCURRENCY = 32  # /api/frame and /api/capture handled at once
+ASGI_LLM_CONCURRENCY = 4  # Gemini calls in flight for /api/recipes and /api/analyze_pantry
+ASGI_WSGI_WORKERS = 16  # threads serving the remaining Flask routes
@@ -0,0 +1,128 @@
+import re
+import time
+import threading
+from typing import Callable, Dict, List, Mapping, Optional
+from analysis_queue import AnalysisPool
+from tracing import Trace, activate, span
+from frame_broadcaster import FrameBroadcaster
+from config import DEFAULT_DEVICE_ID
+
+DEVICE_ID_HEADER = "X-Device-ID"
+_DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+class DeviceLimitError(Exception):
+    """Raised when a new device shows up and the registry is already full."""
+
+def device_id_from(headers: Mapping[str, str], args: Mapping[str, str]) -> str:
+    """
+    Device ID of a request: the X-Device-ID header, else the ?device= query
+    parameter, else the default device. Raises ValueError for malformed IDs.
+    """
+    device_id = headers.get(DEVICE_ID_HEADER) or args.get("device") or DEFAULT_DEVICE_ID
+    device_id = device_id.strip()
+    if not _DEVICE_ID_PATTERN.match(device_id):
+        raise ValueError(f"Invalid device id '{device_id}'")
+    return device_id
+
+class DevicePipeline:
+    """
+    Live feed, before/after capture chain and analysis pool of one camera.
+
+    Every device has its own lock and worker pool, so a camera with a long
+    analysis backlog never delays frames or captures from another one.
+    `frames` defaults to an in-process FrameBroadcaster; worker processes
+    sharing frames pass a SharedFrameBroadcaster instead.
+    """
+
+    def __init__(self, device_id: str, pool: AnalysisPool, frames=None,
+                 check_change: Optional[Callable[[bytes, bytes], dict]] = None):
+        self.device_id = device_id
+        self.frames = frames if frames is not None else FrameBroadcaster()
+        self.pool = pool
+        self.check_change = check_change
+        self.prev_capture = None  # 'before' image of the next pair: the last capture queued for analysis
+        self.capture_lock = threading.Lock()  # keeps the before/after chain consistent under concurrent captures
+        self.last_seen = time.time()
+
+    def publish_frame(self, data: bytes):
+        self.last_seen = time.time()
+        self.frames.publish(data)
+
+    def submit_capture(self, data: bytes, trace: Optional[Trace] = None,
+                       on_done: Optional[Callable[[], None]] = None) -> str:
+        """
+        Chain a capture onto the previous one and queue the pair for analysis.
+        Returns "queued", "first_capture" for the capture that only starts the
+        chain, or "unchanged" when `check_change` sees no shelf change. An
+        unchanged capture doesn't move the chain on, so the next capture is
+        still compared against the last one analyzed and changes that build up
+        over several captures aren't lost.
+        Raises QueueFullError if the pool rejects the pair; the chain is kept
+        the same way. `on_done` is called once a queued pair's analysis is
+        saved or given up, see AnalysisPool.
+        """
+        self.last_seen = time.time()
+        with self.capture_lock:
+            if not self.prev_capture:
+                self.prev_capture = data
+                return "first_capture"
+            changed_blocks = None
+            if self.check_change is not None:
+                with activate(trace), span("change_filter") as attrs:
+                    result = self.check_change(self.prev_capture, data)
+                    attrs.update({key: value for key, value in result.items() if key != "changed_blocks"})
+                if not result["changed"]:
+                    return "unchanged"
+                changed_blocks = result.get("changed_blocks")
+            self.pool.submit(self.prev_capture, data, trace, changed_blocks, on_done)
+            self.prev_capture = data
+            return "queued"
+
+    def status(self) -> dict:
+        return {
+            "last_seen": round(self.last_seen, 3),
+            "viewers": self.frames.viewers,
+            "frames": self.frames.seq,
+            **self.pool.status(),
+        }
+
+class DeviceRegistry:
+    """
+    Creates a DevicePipeline the first time a device ID is seen.
+    `build(device_id)` returns a new pipeline with its pool already started.
+    """
+
+    def __init__(self, build: Callable[[str], DevicePipeline], max_devices: int):
+        self.build = build
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self._pipelines: Dict[str, DevicePipeline] = {}
+
+    def get(self, device_id: str) -> DevicePipeline:
+        pipeline = self._pipelines.get(device_id)
+        if pipeline is not None:
+            return pipeline
+        with self._lock:
+            pipeline = self._pipelines.get(device_id)
+            if pipeline is None:
+                if len(self._pipelines) >= self.max_devices:
+                    raise DeviceLimitError(f"Too many devices, at most {self.max_devices} are tracked")
+                pipeline = self.build(device_id)
+                self._pipelines[device_id] = pipeline
+                print(f"New capture device: {device_id}")
+            return pipeline
+
+    def find(self, device_id: str) -> Optional[DevicePipeline]:
+        """Pipeline of a device that has already been seen, without creating one."""
+        return self._pipelines.get(device_id)
+
+    def all(self) -> List[DevicePipeline]:
+        with self._lock:
+            return list(self._pipelines.values())
+
+    def close(self):
+        for pipeline in self.all():
+            pipeline.pool.close()
+
+    def status(self) -> dict:
+        return {pipeline.device_id: pipeline.status() for pipeline in self.all()}
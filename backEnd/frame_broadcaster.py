@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+class FrameBroadcaster:
+    """
+    Holds the latest live frame and wakes MJPEG viewers when a new one arrives.
+
+    The multipart chunk for a frame is built once in publish() and the same
+    bytes object is handed to every viewer. Viewers always take the newest
+    frame when they wake up, so a slow client skips frames instead of
+    building up a backlog. Viewers on an event loop use stream_async(),
+    which waits for frames without holding a thread.
+    """
+
+    def __init__(self, keepalive: float = 5.0):
+        self.keepalive = keepalive
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._chunk = None
+        self._async_waiters = set()  # (loop, asyncio.Event) of async viewers waiting for a frame
+        self.viewers = 0
+
+    def publish(self, frame: bytes):
+        # MJPEG format requires boundaries between frames
+        chunk = b''.join((b'--frame\r\nContent-Type: image/jpeg\r\n\r\n', frame, b'\r\n'))
+        with self._cond:
+            self._frame = frame
+            self._chunk = chunk
+            self._seq += 1
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # its loop has shut down
+
+    @property
+    def latest(self) -> Optional[bytes]:
+        return self._frame
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def wait_for_frame(self, after_seq: int, timeout: float) -> Tuple[int, Optional[bytes]]:
+        """Newest (seq, chunk) once a frame newer than `after_seq` exists, or (after_seq, None) on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            if self._seq > after_seq:
+                return self._seq, self._chunk
+            return after_seq, None
+
+    async def wait_for_frame_async(self, after_seq: int, timeout: float) -> Tuple[int, Optional[bytes]]:
+        """Async version of wait_for_frame()"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            if self._seq > after_seq:
+                return self._seq, self._chunk
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        with self._cond:
+            if self._seq > after_seq:
+                return self._seq, self._chunk
+            return after_seq, None
+
+    async def stream_async(self) -> AsyncIterator[bytes]:
+        """Async version of stream()"""
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, chunk = await self.wait_for_frame_async(seq, self.keepalive)
+                if chunk is None:
+                    chunk = self._chunk
+                if chunk is not None:
+                    yield chunk
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+    def stream(self) -> Iterator[bytes]:
+        """Multipart chunks for one viewer, one per new frame."""
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, chunk = self.wait_for_frame(seq, self.keepalive)
+                if chunk is None:
+                    # No new frame for a while: resend the last one so a closed
+                    # connection is noticed and this generator gets cleaned up
+                    chunk = self._chunk
+                if chunk is not None:
+                    yield chunk
+        finally:
+            with self._cond:
+                self.viewers -= 1
@@ -0,0 +1,119 @@
+import io
+import threading
+from typing import Optional, Tuple
+
+from change_filter import np, Image
+from config import (IMAGE_PREP_ENABLED, IMAGE_PREP_MARGIN, IMAGE_PREP_MAX_AREA,
+                    IMAGE_PREP_MAX_EDGE, IMAGE_PREP_MIN_DETAIL_EDGE, IMAGE_PREP_JPEG_QUALITY)
+
+def changed_box(changed_blocks, image_size: Tuple[int, int], margin: float) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (left, top, right, bottom) of the changed blocks in full-resolution pixels."""
+    rows, cols = np.nonzero(changed_blocks)
+    if not len(rows):
+        return None
+    width, height = image_size
+    grid_rows, grid_cols = changed_blocks.shape
+    left = cols.min() * width / grid_cols - margin * width
+    right = (cols.max() + 1) * width / grid_cols + margin * width
+    top = rows.min() * height / grid_rows - margin * height
+    bottom = (rows.max() + 1) * height / grid_rows + margin * height
+    return (max(0, int(left)), max(0, int(top)), min(width, int(right)), min(height, int(bottom)))
+
+class ImagePreparer:
+    """
+    Shrinks a before/after pair before it is sent to the model.
+
+    Both full frames are scaled down so their longest edge is at most
+    `max_edge`; they always go to the model, since it reports the whole
+    inventory it can see. When the change filter located the change (its
+    `changed_blocks` grid), and it covers at most `max_area` of the frame,
+    close-ups of that region (plus a margin) are cropped from the original
+    frames, so small items keep their full resolution. They are only sent
+    when the whole set still comes out smaller than the original pair, or
+    when the region would be under `min_detail_edge` pixels across in the
+    scaled frames and too small for the model to read.
+    """
+
+    def __init__(self, enabled: bool, margin: float, max_area: float, max_edge: int,
+                 min_detail_edge: int, jpeg_quality: int):
+        self.enabled = enabled and np is not None
+        self.margin = margin
+        self.max_area = max_area
+        self.max_edge = max_edge
+        self.min_detail_edge = min_detail_edge
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self.stats = {"pairs": 0, "with_detail": 0, "full_frame_only": 0, "detail_too_large": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+
+    def _shrink(self, image_bytes: bytes, image, box=None) -> bytes:
+        if box is None and max(image.size) <= self.max_edge:
+            return image_bytes  # Nothing to do, don't pay for a re-encode
+        if box is not None:
+            image = image.crop(box)
+        image.thumbnail((self.max_edge, self.max_edge))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=self.jpeg_quality)
+        return out.getvalue()
+
+    def prepare(self, before_bytes: bytes, after_bytes: bytes,
+                changed_blocks=None) -> Tuple[bytes, bytes, Optional[Tuple[bytes, bytes]]]:
+        """
+        (before, after, (before close-up, after close-up) or None).
+        `changed_blocks` is the grid the change filter already computed for
+        this pair; without it no close-ups are made.
+        """
+        if not self.enabled:
+            return before_bytes, after_bytes, None
+        too_large = False
+        try:
+            before = Image.open(io.BytesIO(before_bytes))
+            after = Image.open(io.BytesIO(after_bytes))
+            size = before.size
+            box = None
+            if changed_blocks is not None and size == after.size:
+                box = changed_box(changed_blocks, size, self.margin)
+                if box is not None:
+                    area = (box[2] - box[0]) * (box[3] - box[1])
+                    if area > self.max_area * size[0] * size[1]:
+                        box = None
+            # Crop first: thumbnail() scales the image in place
+            detail = (self._shrink(before_bytes, before, box), self._shrink(after_bytes, after, box)) if box else None
+            full = (self._shrink(before_bytes, before), self._shrink(after_bytes, after))
+            if detail is not None:
+                scale = min(1.0, self.max_edge / max(size))
+                small = max(box[2] - box[0], box[3] - box[1]) * scale < self.min_detail_edge
+                if not small and sum(map(len, full + detail)) >= len(before_bytes) + len(after_bytes):
+                    detail = None
+                    too_large = True
+            prepared = (*full, detail)
+        except Exception as e:
+            print(f"Warning: image preparation failed, sending full images: {e}")
+            return before_bytes, after_bytes, None
+
+        with self._lock:
+            self.stats["pairs"] += 1
+            self.stats["with_detail" if detail is not None else "full_frame_only"] += 1
+            self.stats["detail_too_large"] += 1 if too_large else 0
+            self.stats["bytes_in"] += len(before_bytes) + len(after_bytes)
+            self.stats["bytes_out"] += len(prepared[0]) + len(prepared[1]) + (len(detail[0]) + len(detail[1]) if detail else 0)
+        return prepared
+
+    def status(self) -> dict:
+        with self._lock:
+            bytes_in = self.stats["bytes_in"]
+            return {
+                "enabled": self.enabled,
+                "max_edge": self.max_edge,
+                "size_ratio": round(self.stats["bytes_out"] / bytes_in, 3) if bytes_in else 1.0,
+                **self.stats,
+            }
+
+image_preparer = ImagePreparer(
+    IMAGE_PREP_ENABLED,
+    IMAGE_PREP_MARGIN,
+    IMAGE_PREP_MAX_AREA,
+    IMAGE_PREP_MAX_EDGE,
+    IMAGE_PREP_MIN_DETAIL_EDGE,
+    IMAGE_PREP_JPEG_QUALITY
+)
@@ -0,0 +1,62 @@
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+def group_by_id(inventory: list) -> Dict[str, list]:
+    groups = {}
+    for item in inventory:
+        groups.setdefault(item.get("id"), []).append(item)
+    return groups
+
+def inventory_diff(before: list, after: list) -> Dict[str, list]:
+    """
+    Ids whose entries differ between two inventories, mapped to their entries
+    in `after` ([] if the id is gone). The same id can appear more than once
+    in an inventory, so an id always carries its full list of entries.
+    """
+    return grouped_diff(group_by_id(before), group_by_id(after))
+
+def grouped_diff(old: Dict[str, list], new: Dict[str, list]) -> Dict[str, list]:
+    """inventory_diff() of two inventories already grouped by id"""
+    changed = {item_id: entries for item_id, entries in new.items() if old.get(item_id) != entries}
+    changed.update({item_id: [] for item_id in old if item_id not in new})
+    return changed
+
+class InventoryChangeLog:
+    """
+    The last `max_entries` inventory changes, each tagged with the store
+    version that produced it.
+
+    changes_since() merges every change after a version into one delta whose
+    size depends on how much changed, not on how big the inventory is.
+    Versions older than the log fall back to a full snapshot.
+    """
+
+    def __init__(self, max_entries: int, version: int):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)  # (version, {id: entries})
+        self._base = version  # oldest version a delta can start from
+
+    def record(self, version: int, changed: Dict[str, list]):
+        with self._lock:
+            if len(self._entries) == self._entries.maxlen:
+                self._base = self._entries[0][0]
+            self._entries.append((version, changed))
+
+    def changes_since(self, since: int, version: int) -> Optional[dict]:
+        """
+        {'changed': [...], 'removed': [...]} covering every change after `since`,
+        or None when `since` is older than the log or newer than `version`.
+        """
+        if since > version:
+            return None
+        with self._lock:
+            if since < self._base:
+                return None
+            merged = {}
+            for entry_version, changed in self._entries:
+                if entry_version > since:
+                    merged.update(changed)
+        changed_items: List[dict] = [item for entries in merged.values() for item in entries]
+        removed = [item_id for item_id, entries in merged.items() if not entries]
+        return {"changed": changed_items, "removed": removed}
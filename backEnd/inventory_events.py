@@ -0,0 +1,104 @@
+import queue
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, Optional
+
+# Put in a subscriber's queue in place of the events it could not keep up with
+RESYNC = {"event": "resync"}
+
+class InventoryEvents:
+    """
+    Fans inventory change events out to Server-Sent Events subscribers.
+
+    Each subscriber has its own queue of at most `max_queue` events, so a slow
+    client never holds up publish() or the other subscribers. When a queue
+    overflows, its events are thrown away and replaced by a single RESYNC
+    marker, after which that client is sent a fresh snapshot.
+
+    Subscribers on an event loop (the async server) get an asyncio.Queue
+    from subscribe_async(); events are handed to their loop, so waiting for
+    them doesn't hold a thread.
+    """
+
+    def __init__(self, max_queue: int, keepalive: float):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._async_subscribers = {}  # asyncio.Queue -> its event loop
+        self.stats = {"published": 0, "resyncs": 0}
+
+    def publish(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            async_subscribers = list(self._async_subscribers.items())
+            self.stats["published"] += 1
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                self._overflow(q)
+        for q, loop in async_subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put_async, q, event)
+            except RuntimeError:
+                self.unsubscribe_async(q)  # its loop has shut down
+
+    def _overflow(self, q: queue.Queue):
+        with q.mutex:
+            q.queue.clear()
+        q.put_nowait(RESYNC)
+        with self._lock:
+            self.stats["resyncs"] += 1
+
+    def _put_async(self, q: asyncio.Queue, event: dict):
+        """Runs on the subscriber's event loop"""
+        try:
+            q.put_nowait(event)
+        except asyncio.QueueFull:
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(RESYNC)
+            with self._lock:
+                self.stats["resyncs"] += 1
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscribe_async(self) -> asyncio.Queue:
+        """Subscribe from a coroutine; events are delivered on the running loop."""
+        q = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._async_subscribers[q] = asyncio.get_running_loop()
+        return q
+
+    def unsubscribe_async(self, q: asyncio.Queue):
+        with self._lock:
+            self._async_subscribers.pop(q, None)
+
+    async def events_async(self, q: asyncio.Queue) -> AsyncIterator[Optional[dict]]:
+        """Async version of events()"""
+        while True:
+            try:
+                yield await asyncio.wait_for(q.get(), self.keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    def events(self, q: queue.Queue) -> Iterator[Optional[dict]]:
+        """Events from a subscription as they arrive, or None after `keepalive` seconds without one."""
+        while True:
+            try:
+                yield q.get(timeout=self.keepalive)
+            except queue.Empty:
+                yield None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"subscribers": len(self._subscribers) + len(self._async_subscribers), **self.stats}
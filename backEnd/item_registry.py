@@ -0,0 +1,41 @@
+import uuid
+from typing import Callable, Dict, Iterable, Optional
+
+def normalize_name(item_name: str) -> str:
+    return item_name.strip().lower()
+
+class ItemRegistry:
+    """
+    In-memory name -> UUID mapping so the same item keeps the same id.
+
+    Lookups never touch disk. New names found in one call are handed to
+    `persist` as a single batch, so resolving a whole analysis result costs at
+    most one write no matter how many items it contains.
+    """
+
+    def __init__(self, entries: Dict[str, str], lock, persist: Callable[[Dict[str, str]], None]):
+        # `entries` is shared with the pantry state and updated by `persist`
+        self._entries = entries
+        self._lock = lock
+        self._persist = persist
+
+    def get(self, item_name: str) -> Optional[str]:
+        with self._lock:
+            return self._entries.get(normalize_name(item_name))
+
+    def resolve(self, item_name: str) -> str:
+        """Get existing UUID for item or create new one"""
+        return self.resolve_many([item_name])[item_name]
+
+    def resolve_many(self, item_names: Iterable[str]) -> Dict[str, str]:
+        """Map every name to its UUID, registering unknown names in one batch."""
+        item_names = list(item_names)
+        with self._lock:
+            new_entries = {}
+            for name in item_names:
+                key = normalize_name(name)
+                if key not in self._entries and key not in new_entries:
+                    new_entries[key] = str(uuid.uuid4())
+            if new_entries:
+                self._persist(new_entries)
+            return {name: self._entries[normalize_name(name)] for name in item_names}
@@ -0,0 +1,83 @@
+import os
+import threading
+from typing import Any, Callable, Hashable, Optional, Type
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel
+
+from llm_stub import StubChatModel
+from config import (LLM_BACKEND, STUB_FIXTURES_DIR, STUB_SEED, STUB_LATENCY, STUB_TOKEN_INTERVAL,
+                    STUB_CHUNK_CHARS, STUB_ERROR_RATE, LLM_DEADLINE)
+
+LLM_BACKENDS = ("gemini", "stub")
+
+class LLMClientRegistry:
+    """
+    Builds each LLM client or chain once and hands the same instance to every caller.
+
+    Reusing a ChatGoogleGenerativeAI instance also reuses its HTTP client, so
+    keep-alive connections to the API survive across requests. Building is
+    guarded by a lock, so worker threads asking for the same key at the same
+    time still get a single instance.
+
+    `backend` picks the chat model class: "gemini" for ChatGoogleGenerativeAI,
+    "stub" for the offline StubChatModel configured by the STUB_* settings.
+    """
+
+    def __init__(self, backend: str = "gemini"):
+        if backend not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend '{backend}', expected one of {LLM_BACKENDS}")
+        self.backend = backend
+        # Re-entrant: building a structured model builds its chat model through get() too
+        self._lock = threading.RLock()
+        self._clients = {}
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = build()
+                self._clients[key] = client
+            return client
+
+    def chat_model(self, model_name: str, temperature: Optional[float] = None,
+                   text_schema: Optional[Type[BaseModel]] = None) -> BaseChatModel:
+        """
+        Chat model for `model_name`. `text_schema` is the schema the prompt asks
+        the answer to be written in; only the stub backend uses it.
+        """
+        def build():
+            if self.backend == "stub":
+                return StubChatModel(
+                    model=model_name,
+                    text_schema=text_schema,
+                    fixtures_dir=os.path.join(os.path.dirname(__file__), STUB_FIXTURES_DIR),
+                    seed=STUB_SEED,
+                    latency=STUB_LATENCY,
+                    token_interval=STUB_TOKEN_INTERVAL,
+                    chunk_chars=STUB_CHUNK_CHARS,
+                    error_rate=STUB_ERROR_RATE
+                )
+            # Retries and deadlines are up to llm_policy, so the client makes a single attempt
+            options = {"max_retries": 1, "timeout": LLM_DEADLINE}
+            if temperature is None:
+                return ChatGoogleGenerativeAI(model=model_name, **options)
+            return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, **options)
+        return self.get(("chat", model_name, temperature, text_schema), build)
+
+    def structured_model(self, model_name: str, schema: Type[BaseModel], temperature: Optional[float] = None):
+        """Chat model wrapped with with_structured_output(schema)."""
+        return self.get(
+            ("structured", model_name, temperature, schema),
+            lambda: self.chat_model(model_name, temperature).with_structured_output(schema)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+llm_clients = LLMClientRegistry(LLM_BACKEND)
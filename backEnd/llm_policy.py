@@ -0,0 +1,394 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from llm_stub import StubLLMError
+from tracing import percentile
+from config import (LLM_DEADLINE, LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_HEDGE_PERCENTILE,
+                    LLM_HEDGE_MIN_SAMPLES, LLM_FIRST_TOKEN_TIMEOUT, LLM_STREAM_IDLE_TIMEOUT,
+                    LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+
+# Google API errors worth another attempt, by class name so the google client stays an optional import
+TRANSIENT_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                         "BadGateway", "GatewayTimeout", "DeadlineExceeded"}
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+LATENCY_SAMPLES = 200  # successful attempt latencies kept for the hedge percentile
+_END = object()  # end of a stream
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when an LLM call, retries and hedges included, ran out of its time budget."""
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while its circuit breaker is open."""
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed attempt may succeed if tried again (rate limits, overload, timeouts)"""
+    if isinstance(error, (StubLLMError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    return getattr(error, "code", None) in TRANSIENT_STATUS_CODES or getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+class CircuitBreaker:
+    """
+    Stops calls to a backend that keeps failing.
+
+    After `failures` failed attempts in a row the circuit opens and calls are
+    refused without trying. Once `reset_timeout` seconds have passed, one probe
+    call is let through: if it succeeds the circuit closes again, if it fails
+    it stays open for another `reset_timeout`.
+    """
+
+    def __init__(self, failures: int, reset_timeout: float):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed" or (self.state == "half_open" and not self._probing):
+                self._probing = self.state == "half_open"
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.stats["opened"] += 1
+            self._probing = False
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive, **self.stats}
+
+class LLMCallPolicy:
+    """
+    Deadline, retries, hedging and circuit breaking around one kind of LLM call.
+
+    Every call gets `deadline` seconds in total. Attempts that fail with a
+    transient error are retried up to `max_attempts` times, sleeping a random
+    time up to `backoff_base * 2**n` (at most `backoff_max`) in between, as
+    long as the budget allows. When `hedge_percentile` is set and an attempt
+    is still running after that percentile of recent attempt latencies, a
+    duplicate request is sent and whichever answers first is used.
+
+    call() runs the blocking function in a thread pool so it can stop waiting
+    at the deadline; the abandoned request still runs until the client's own
+    timeout. call_async() cancels the attempts it no longer needs.
+
+    Streamed calls (stream(), astream()) go through the circuit breaker and
+    must send their first chunk within `first_token_timeout` seconds, then
+    each next chunk within `idle_timeout` seconds of the previous one; a
+    stream that stalls fails like a call past its deadline. They are not
+    retried or hedged, as chunks may already have reached a client.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, deadline: float, max_attempts: int,
+                 backoff_base: float, backoff_max: float, hedge_percentile: Optional[float],
+                 hedge_min_samples: int, first_token_timeout: Optional[float] = None,
+                 idle_timeout: Optional[float] = None, workers: int = 16):
+        self.name = name
+        self.breaker = breaker
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.first_token_timeout = first_token_timeout if first_token_timeout is not None else deadline
+        self.idle_timeout = idle_timeout if idle_timeout is not None else self.first_token_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"llm-{name}")
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._rng = random.Random()
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                      "deadline_exceeded": 0, "short_circuited": 0, "failed": 0}
+
+    # region helpers
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _observe(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging an attempt, None while hedging is off or there are too few samples"""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._latencies)
+        return percentile(samples, self.hedge_percentile)
+
+    def _backoff(self, attempt: int) -> float:
+        with self._lock:
+            return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _start(self, attrs: Optional[dict]) -> float:
+        self._count("calls")
+        if attrs is not None:
+            attrs.update(attempts=0, hedged=False)
+        return time.monotonic() + self.deadline
+
+    def _before_attempt(self, attrs: Optional[dict]):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"LLM circuit is open after repeated {self.name} failures")
+        self._count("attempts")
+        if attrs is not None:
+            attrs["attempts"] += 1
+
+    def _after_failure(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if `error` should be raised"""
+        if isinstance(error, DeadlineExceededError):
+            self.breaker.record_failure()
+            self._count("deadline_exceeded")
+            return None
+        if not is_transient(error):
+            self.breaker.record_success()  # the backend answered, the request itself was bad
+            self._count("failed")
+            return None
+        self.breaker.record_failure()
+        delay = self._backoff(attempt)
+        if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+            self._count("failed")
+            return None
+        self._count("retries")
+        return delay
+
+    def _hedged(self, attrs: Optional[dict], won: bool):
+        self._count("hedges")
+        if won:
+            self._count("hedge_wins")
+        if attrs is not None:
+            attrs["hedged"] = True
+    # endregion
+
+    # region blocking calls
+    def _submit(self, fn: Callable[[], Any]):
+        start = time.monotonic()
+        future = self._executor.submit(fn)
+        future.add_done_callback(lambda f: None if f.cancelled() or f.exception() else self._observe(time.monotonic() - start))
+        return future
+
+    def _attempt(self, fn: Callable[[], Any], deadline: float, attrs: Optional[dict]) -> Any:
+        hedge_at = self.hedge_delay()
+        hedge_at = time.monotonic() + hedge_at if hedge_at is not None else None
+        futures = [self._submit(fn)]
+        pending = set(futures)
+        error = None
+        while pending:
+            wait_until = deadline if hedge_at is None or len(futures) > 1 else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wait_until - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1:
+                        self._hedged(attrs, future is futures[1])
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                raise DeadlineExceededError(f"{self.name} LLM call took longer than {self.deadline}s")
+            if len(futures) == 1 and hedge_at is not None and time.monotonic() >= hedge_at:
+                futures.append(self._submit(fn))
+                pending.add(futures[1])
+        if len(futures) > 1:
+            self._hedged(attrs, False)
+        raise error
+
+    def call(self, fn: Callable[[], Any], attrs: Optional[dict] = None) -> Any:
+        """
+        Result of `fn()` under this policy. `attrs`, e.g. a trace span's
+        attributes, gets the number of attempts and whether one was hedged.
+        """
+        deadline = self._start(attrs)
+        attempt = 0
+        while True:
+            self._before_attempt(attrs)
+            attempt += 1
+            try:
+                result = self._attempt(fn, deadline, attrs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+    # endregion
+
+    # region async calls
+    async def _attempt_async(self, fn: Callable[[], Awaitable[Any]], deadline: float, attrs: Optional[dict]) -> Any:
+        async def timed():
+            start = time.monotonic()
+            result = await fn()
+            self._observe(time.monotonic() - start)
+            return result
+
+        hedge_at = self.hedge_delay()
+        hedge_at = time.monotonic() + hedge_at if hedge_at is not None else None
+        tasks = [asyncio.ensure_future(timed())]
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                wait_until = deadline if hedge_at is None or len(tasks) > 1 else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_until - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            self._hedged(attrs, task is tasks[1])
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    break
+                if time.monotonic() >= deadline:
+                    raise DeadlineExceededError(f"{self.name} LLM call took longer than {self.deadline}s")
+                if len(tasks) == 1 and hedge_at is not None and time.monotonic() >= hedge_at:
+                    tasks.append(asyncio.ensure_future(timed()))
+                    pending.add(tasks[1])
+        finally:
+            for task in tasks:
+                task.cancel()
+        if len(tasks) > 1:
+            self._hedged(attrs, False)
+        raise error
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], attrs: Optional[dict] = None) -> Any:
+        """Async version of call(); `fn` returns a new awaitable for every attempt"""
+        deadline = self._start(attrs)
+        attempt = 0
+        while True:
+            self._before_attempt(attrs)
+            attempt += 1
+            try:
+                result = await self._attempt_async(fn, deadline, attrs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+    # endregion
+
+    # region streams
+    def _stream_failed(self, error: Exception):
+        self._after_failure(error, self.max_attempts, 0.0)
+
+    def _stream_timeout(self, what: str, timeout: float) -> DeadlineExceededError:
+        return DeadlineExceededError(f"{self.name} LLM stream sent {what} for {timeout}s")
+
+    def _next_chunk(self, fn: Callable[[], Any], timeout: float, what: str) -> Any:
+        """fn() in the thread pool, given up after `timeout` seconds; failures are recorded"""
+        future = self._executor.submit(fn)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            error = self._stream_timeout(what, timeout)
+            self._stream_failed(error)
+            raise error
+        except Exception as e:
+            self._stream_failed(e)
+            raise
+
+    def stream(self, open_stream: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        Chunks of `open_stream()` under this policy. Each wait for a chunk runs
+        in the thread pool so it can be given up at the timeout; the abandoned
+        stream still runs until the client's own timeout.
+        """
+        self._start(None)
+        self._before_attempt(None)
+        iterator = None
+
+        def first_chunk():
+            nonlocal iterator
+            iterator = iter(open_stream())
+            return next(iterator, _END)
+
+        chunk = self._next_chunk(first_chunk, self.first_token_timeout, "nothing")
+        # The backend answered: a client leaving mid-stream must not leave a half-open probe hanging
+        self.breaker.record_success()
+        while chunk is not _END:
+            yield chunk
+            chunk = self._next_chunk(lambda: next(iterator, _END), self.idle_timeout, "no new chunk")
+
+    async def _anext_chunk(self, iterator: AsyncIterator[Any], timeout: float, what: str) -> Any:
+        try:
+            return await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return _END
+        except asyncio.TimeoutError:
+            error = self._stream_timeout(what, timeout)
+            self._stream_failed(error)
+            raise error
+        except Exception as e:
+            self._stream_failed(e)
+            raise
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Async version of stream(); a stream that doesn't send its next chunk in time is cancelled"""
+        self._start(None)
+        self._before_attempt(None)
+        iterator = open_stream().__aiter__()
+        chunk = await self._anext_chunk(iterator, self.first_token_timeout, "nothing")
+        self.breaker.record_success()
+        while chunk is not _END:
+            yield chunk
+            chunk = await self._anext_chunk(iterator, self.idle_timeout, "no new chunk")
+    # endregion
+
+    def status(self) -> dict:
+        hedge_delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "deadline_s": self.deadline,
+                "hedge_after_s": round(hedge_delay, 3) if hedge_delay is not None else None,
+                "latency_samples": len(self._latencies),
+                **self.stats,
+            }
+
+# One breaker for every call: recipes and analysis go to the same backend
+llm_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+recipe_policy = LLMCallPolicy("recipes", llm_breaker, LLM_DEADLINE, LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE,
+                              LLM_BACKOFF_MAX, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_FIRST_TOKEN_TIMEOUT,
+                              LLM_STREAM_IDLE_TIMEOUT)
+analysis_policy = LLMCallPolicy("analyzer", llm_breaker, LLM_DEADLINE, LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE,
+                                LLM_BACKOFF_MAX, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_FIRST_TOKEN_TIMEOUT,
+                                LLM_STREAM_IDLE_TIMEOUT)
+
+def llm_policy_status() -> dict:
+    return {"breaker": llm_breaker.status(), "recipes": recipe_policy.status(), "analyzer": analysis_policy.status()}
@@ -0,0 +1,206 @@
+"""
+Offline stand-in for the Gemini chat model, used when LLM_BACKEND = "stub".
+
+StubChatModel is a LangChain chat model, so the same prompts, parsers,
+structured output and streaming code run against it as against Gemini.
+Answers are valid instances of the schema the caller asks for: taken from
+<fixtures_dir>/<SchemaName>.json when that file exists, otherwise generated
+from the schema's fields. The content depends only on the seed and the
+prompt, so the same request always gets the same answer. Latency, errors and
+token streaming are simulated from the STUB_* settings in config.py.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import datetime
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Iterator, AsyncIterator, List, Optional, Tuple, Type, Union, get_args, get_origin
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, PrivateAttr, ValidationError
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+FOODS = [
+    "Heinz Tomato Ketchup", "Olive Oil", "Basmati Rice", "Whole Milk", "Cheddar Cheese", "Free Range Eggs",
+    "Penne Pasta", "Chopped Tomatoes", "Red Lentils", "Greek Yoghurt", "Peanut Butter", "Rolled Oats",
+    "Baked Beans", "Chickpeas", "Coconut Milk", "Sourdough Bread", "Unsalted Butter", "Honey",
+    "Spinach", "Bananas", "Carrots", "Red Onions", "Garlic", "Soy Sauce", "Tuna Chunks", "Frozen Peas",
+]
+
+class StubLLMError(Exception):
+    """Injected failure, standing in for a transient API error."""
+
+def sample_latency(rng: random.Random, latency: tuple) -> float:
+    """Seconds from a ("fixed", s), ("uniform", low, high) or ("lognormal", median, sigma) spec."""
+    kind, *params = latency
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return rng.uniform(params[0], params[1])
+    if kind == "lognormal":
+        median, sigma = params
+        return median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"Unknown latency distribution '{kind}', expected one of {LATENCY_DISTRIBUTIONS}")
+
+# region fake data
+def fake_value(annotation: Any, field_name: str, rng: random.Random) -> Any:
+    origin = get_origin(annotation)
+    if origin is Union:
+        options = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(options) < len(get_args(annotation)) and rng.random() < 0.2:
+            return None
+        return fake_value(options[0], field_name, rng)
+    if origin in (list, List):
+        (item_type,) = get_args(annotation) or (str,)
+        return [fake_value(item_type, field_name, rng) for _ in range(rng.randint(2, 6))]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation, rng)
+    if annotation is int:
+        return rng.randint(0, 100)
+    if annotation is float:
+        return round(rng.uniform(0, 100), 2)
+    if annotation is bool:
+        return rng.random() < 0.5
+    if "date" in field_name:
+        return (datetime.date.today() + datetime.timedelta(days=rng.randint(1, 60))).isoformat()
+    return rng.choice(FOODS)
+
+def fake_instance(schema: Type[BaseModel], rng: random.Random) -> BaseModel:
+    """A random but schema-valid instance of `schema`."""
+    return schema(**{name: fake_value(field.annotation, name, rng) for name, field in schema.model_fields.items()})
+
+@lru_cache(maxsize=None)
+def load_fixtures(path: str) -> list:
+    """Example answers from a fixture file, [] if there is none"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+# endregion
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that answers locally, without network access.
+
+    `text_schema` is the schema free-text answers are written in (e.g. the
+    JSON a PydanticOutputParser expects); with_structured_output() sets it
+    to the requested schema.
+    """
+    model: str = "stub"
+    text_schema: Optional[Type[BaseModel]] = None
+    fixtures_dir: Optional[str] = None
+    seed: int = 0
+    latency: tuple = ("fixed", 0.0)  # time until the first token
+    token_interval: float = 0.0  # time between streamed chunks
+    chunk_chars: int = 16
+    error_rate: float = 0.0
+
+    # Seeded RNG for latency and errors, shared with copies made by with_structured_output()
+    _timing_rng: Any = PrivateAttr(default=None)
+    _timing_lock: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any):
+        super().model_post_init(context)
+        self._timing_rng = random.Random(self.seed)
+        self._timing_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    # region answers
+    def _timing(self) -> Tuple[float, bool]:
+        """(seconds until the first token, whether this call fails)"""
+        with self._timing_lock:
+            return sample_latency(self._timing_rng, self.latency), self._timing_rng.random() < self.error_rate
+
+    def answer_text(self, messages: List[BaseMessage]) -> str:
+        """The full answer to `messages`, always the same for the same prompt and seed."""
+        prompt = json.dumps([message.content for message in messages], sort_keys=True)
+        digest = hashlib.sha256(f"{self.seed}:{self.model}:{prompt}".encode()).digest()
+        rng = random.Random(digest)
+        if self.text_schema is None:
+            return f"Stub answer {digest.hex()[:8]}"
+        fixtures = []
+        if self.fixtures_dir:
+            fixtures = load_fixtures(os.path.join(self.fixtures_dir, f"{self.text_schema.__name__}.json"))
+        if fixtures:
+            return self.text_schema.model_validate(rng.choice(fixtures)).model_dump_json()
+        return fake_instance(self.text_schema, rng).model_dump_json()
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+    # endregion
+
+    # region LangChain hooks
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self.answer_text(messages)
+        chunks = self._chunks(text)
+        first_token, fails = self._timing()
+        time.sleep(first_token + self.token_interval * (len(chunks) - 1))
+        if fails:
+            raise StubLLMError("Injected stub LLM failure")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self.answer_text(messages)
+        chunks = self._chunks(text)
+        first_token, fails = self._timing()
+        await asyncio.sleep(first_token + self.token_interval * (len(chunks) - 1))
+        if fails:
+            raise StubLLMError("Injected stub LLM failure")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = self._chunks(self.answer_text(messages))
+        first_token, fails = self._timing()
+        time.sleep(first_token)
+        for i, chunk in enumerate(chunks):
+            if fails and i == len(chunks) // 2:
+                raise StubLLMError("Injected stub LLM failure mid-stream")
+            if i:
+                time.sleep(self.token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._chunks(self.answer_text(messages))
+        first_token, fails = self._timing()
+        await asyncio.sleep(first_token)
+        for i, chunk in enumerate(chunks):
+            if fails and i == len(chunks) // 2:
+                raise StubLLMError("Injected stub LLM failure mid-stream")
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs: Any):
+        """
+        Answers written in `schema`, parsed back into an instance of it. With
+        include_raw, {'raw', 'parsed', 'parsing_error'} as chat models return it.
+        """
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+            raise ValueError(f"The stub only supports pydantic schemas, got {schema!r}")
+
+        def parse(message: AIMessage):
+            if not include_raw:
+                return schema.model_validate_json(message.content)
+            try:
+                return {"raw": message, "parsed": schema.model_validate_json(message.content), "parsing_error": None}
+            except ValidationError as e:
+                return {"raw": message, "parsed": None, "parsing_error": e}
+
+        return self.model_copy(update={"text_schema": schema}) | RunnableLambda(parse)
+    # endregion
@@ -1,180 +1,470 @@
-from flask import Flask, jsonify, request, Response
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 import time
 from flask_cors import CORS
 import json
 import os
 import socket
-import uuid
+import atexit
 import datetime
-from pantry_analyzer import analyze_pantry_images
-import threading
-from recipe_service import generate_recipes
+import asyncio
+from typing import AsyncIterator, Iterator, Optional, Tuple
+from urllib.parse import urlencode
+from pantry_analyzer import analyze_pantry_images, infer_pantry_changes, save_pantry_inventory, analysis_cache, analysis_flight, llm_status
+from recipe_service import generate_recipes, generate_recipes_async, stream_recipes, astream_recipes, RecipeList
+from pantry_store import pantry_store, item_registry
+from analysis_queue import AnalysisPool, ConcurrencyLimit, QueueFullError
+from change_filter import change_filter
+from image_prep import image_preparer
+from recipe_cache import RecipeCache
+from single_flight import SingleFlight
+from llm_policy import llm_breaker, recipe_policy, analysis_policy, llm_policy_status
+from bot_registry import BotRegistry
+from inventory_events import InventoryEvents, RESYNC
+from metrics import metrics
+from tracing import tracer, activate
+from capture_ring import capture_ring
+from shared_frames import SharedFrameStore, SharedFrameBroadcaster, SlotsFullError
+from analysis_leader import AnalysisLeader
+from devices import DevicePipeline, DeviceRegistry, DeviceLimitError, device_id_from
+from config import (ANALYSIS_WORKERS, ANALYSIS_MAX_CONCURRENT, ANALYSIS_QUEUE_SIZE, ANALYSIS_QUEUE_POLICY,
+                    ANALYSIS_COALESCE_WINDOW, ANALYSIS_COALESCE_MAX_SPAN,
+                    RECIPE_MODEL, RECIPE_CACHE_TTL, RECIPE_CACHE_SIZE,
+                    DEFAULT_DEVICE_ID, MAX_DEVICES, BOTS_FILE, BOT_HEARTBEAT_TTL, BOT_FLUSH_INTERVAL,
+                    BOT_SHARED_FLUSH_INTERVAL,
+                    INVENTORY_STREAM_QUEUE, INVENTORY_STREAM_KEEPALIVE,
+                    SHARED_DIR, SHARED_FRAME_BYTES, SHARED_POLL_INTERVAL, LEADER_POLL_INTERVAL)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-PANTRY_STATE_FILE = os.path.join(os.path.dirname(__file__), 'pantry_state.json')
+pantry_store.start()
+atexit.register(pantry_store.close)
 
-latest_frame = None
-prev_capture = None
-latest_capture = None
+if SHARED_DIR:
+    bot_registry = BotRegistry(os.path.join(os.path.dirname(__file__), BOTS_FILE), BOT_HEARTBEAT_TTL,
+                               BOT_SHARED_FLUSH_INTERVAL, os.path.join(SHARED_DIR, "bots.lock"))
+else:
+    bot_registry = BotRegistry(os.path.join(os.path.dirname(__file__), BOTS_FILE), BOT_HEARTBEAT_TTL, BOT_FLUSH_INTERVAL)
+bot_registry.start()
+atexit.register(bot_registry.close)
 
-def get_or_create_uuid(item_name: str) -> str:
-    """Generate or retrieve UUID for an item name to ensure consistency"""
-    name_key = item_name.strip().lower()
-    
-    # Load pantry_state.json
-    pantry_data = {}
-    if os.path.exists(PANTRY_STATE_FILE):
-        with open(PANTRY_STATE_FILE, "r") as f:
-            try:
-                pantry_data = json.load(f)
-            except json.JSONDecodeError:
-                pantry_data = {}
-    
-    # Get or create item_registry within pantry_state
-    registry = pantry_data.get('item_registry', {})
-    
-    if name_key in registry:
-        return registry[name_key]
-    
-    # Generate new UUID and save back to pantry_state
-    new_id = str(uuid.uuid4())
-    registry[name_key] = new_id
-    pantry_data['item_registry'] = registry
+tracer.start()
+atexit.register(tracer.close)
+
+# With several worker processes, live frames go through shared memory and captures through
+# the shared capture ring, where a single elected analysis leader picks them up
+shared_frames = SharedFrameStore(os.path.join(SHARED_DIR, "frames.shm"), MAX_DEVICES, SHARED_FRAME_BYTES) if SHARED_DIR else None
+# Every device has its own workers, but they all share these slots for Gemini calls
+analysis_limit = ConcurrencyLimit(ANALYSIS_MAX_CONCURRENT)
+
+def analyze_pantry_thread(before_img, after_img, changed_blocks=None):
+    """
+    Runs on an analysis worker: find the pantry changes between before and after images.
+    Pairs without a shelf change never get here, the device pipeline filters them out,
+    and the blocks it found changed locate the close-ups sent to the model.
+    The pool saves results in capture order.
+    """
+    print("Starting pantry analysis...")
     
-    with open(PANTRY_STATE_FILE, "w") as f:
-        json.dump(pantry_data, f, indent=4)
+    # Run the analysis
+    result = infer_pantry_changes(before_img, after_img, changed_blocks)
     
-    return new_id
+    print(f"Pantry analysis complete.")
+    return result
+
+def build_device_pipeline(device_id: str) -> DevicePipeline:
+    """Feed, capture chain and analysis pool for a newly seen camera"""
+    pool = AnalysisPool(
+        analyze=analyze_pantry_thread,
+        apply=lambda result: save_pantry_inventory(result, device_id),
+        workers=ANALYSIS_WORKERS,
+        max_queue=ANALYSIS_QUEUE_SIZE,
+        policy=ANALYSIS_QUEUE_POLICY,
+        coalesce_window=ANALYSIS_COALESCE_WINDOW,
+        max_span=ANALYSIS_COALESCE_MAX_SPAN,
+        limit=analysis_limit
+    )
+    frames = None
+    if shared_frames is None:
+        pool.start()  # with shared workers only the analysis leader starts its pools
+    else:
+        try:
+            frames = SharedFrameBroadcaster(shared_frames, device_id, SHARED_POLL_INTERVAL)
+        except SlotsFullError as e:
+            raise DeviceLimitError(str(e))
+    pipeline = DevicePipeline(device_id, pool, frames, change_filter.check)
+    # Continue the before/after chain from the last capture analyzed before a restart
+    latest = capture_ring.latest(device_id, upto=capture_ring.completed())
+    if latest is not None:
+        pipeline.prev_capture = capture_ring.read(latest)
+    return pipeline
+
+atexit.register(capture_ring.close)
+devices = DeviceRegistry(build_device_pipeline, MAX_DEVICES)
+devices.get(DEFAULT_DEVICE_ID)  # single-camera setups never send an ID
+atexit.register(devices.close)
+atexit.register(analysis_cache.save)
 
-def analyze_pantry_thread(before_img, after_img):
+def submit_stored_capture(pipeline: DevicePipeline, seq: Optional[int], data: bytes, trace) -> str:
     """
-    Thread function to analyze pantry changes between before and after images
+    submit_capture() for a capture stored in the ring as `seq` and marked
+    dispatched. It counts as completed once its analysis is saved, or
+    straight away when nothing is queued for it.
     """
+    if seq is None:
+        return pipeline.submit_capture(data, trace)
+    outcome = None
     try:
-        print("Starting pantry analysis...")
-        
-        # Run the analysis
-        _ = analyze_pantry_images(before_img, after_img)
-        
-        print(f"Pantry analysis complete.")
-        
-    except Exception as e:
-        print(f"Error in pantry analysis thread: {e}")
-        
-def create_pantry_state_if_not_exists():
-    if not os.path.exists(PANTRY_STATE_FILE):
-        initial_pantry_data = {
-            "item_registry": {},
-            "items_added": [],
-            "items_removed": [],
-            "current_full_inventory": []
-        }
-        with open(PANTRY_STATE_FILE, "w") as f:
-            json.dump(initial_pantry_data, f, indent=4)
-        print(f"Created initial {PANTRY_STATE_FILE}")
+        outcome = pipeline.submit_capture(data, trace, lambda: capture_ring.mark_completed(seq))
+        return outcome
+    finally:
+        if outcome != "queued":
+            capture_ring.mark_completed(seq)
+
+def dispatch_captures():
+    """
+    Analysis leader only: hand every capture stored since the last dispatch,
+    by any worker, to its device's pipeline in order. Returns how many were handed over.
+    """
+    cursor = capture_ring.dispatched()
+    dispatched = 0
+    for record in capture_ring.records_after(cursor):
+        if record.seq > cursor + 1:
+            print(f"Warning: {record.seq - cursor - 1} captures were overwritten before they were analyzed")
+        cursor = record.seq
+        capture_ring.mark_dispatched(record.seq)
+        data = capture_ring.read(record.seq)
+        if data is None:
+            capture_ring.mark_completed(record.seq)
+            continue
+        trace = tracer.start_trace("capture", start=record.timestamp, device=record.device_id,
+                                   bytes=record.size, seq=record.seq)
+        trace.add_span("handoff", record.timestamp, time.time())
+        try:
+            pipeline = devices.get(record.device_id)
+            pipeline.pool.start()
+            outcome = submit_stored_capture(pipeline, record.seq, data, trace)
+            if outcome != "queued":
+                trace.finish(outcome)
+        except (QueueFullError, DeviceLimitError) as e:
+            capture_ring.mark_completed(record.seq)
+            trace.finish("rejected", error=str(e))
+        dispatched += 1
+    return dispatched
+
+def take_over_analysis():
+    """
+    A newly elected analysis leader dispatches again every capture the last
+    one never finished, chained onto each device's last completed capture.
+    """
+    completed = capture_ring.rewind_dispatch()
+    for pipeline in devices.all():
+        latest = capture_ring.latest(pipeline.device_id, upto=completed)
+        with pipeline.capture_lock:
+            pipeline.prev_capture = capture_ring.read(latest) if latest is not None else None
+
+analysis_leader = None
+if shared_frames is not None:
+    analysis_leader = AnalysisLeader(os.path.join(SHARED_DIR, "analysis.lock"), LEADER_POLL_INTERVAL,
+                                     dispatch_captures, take_over_analysis)
+    analysis_leader.start()
+    atexit.register(analysis_leader.close)
+
+# Generated recipes only depend on the pantry, so any inventory change invalidates them
+recipe_cache = RecipeCache(RECIPE_CACHE_TTL, RECIPE_CACHE_SIZE)
+pantry_store.subscribe(lambda record: recipe_cache.clear())
+# Requests for the same recipes while they are being generated wait for that call
+recipe_flight = SingleFlight()
+
+# Inventory changes pushed to /api/inventory/stream subscribers
+inventory_events = InventoryEvents(INVENTORY_STREAM_QUEUE, INVENTORY_STREAM_KEEPALIVE)
+
+def publish_inventory_change(record: dict):
+    # Runs under the store lock, so this is exactly the change made by `record`
+    version, delta = pantry_store.changes_since(record["version"] - 1)
+    if delta is not None:
+        inventory_events.publish({'event': 'inventory', 'version': version, 'epoch': pantry_store.epoch, **delta})
+
+pantry_store.subscribe(publish_inventory_change)
+
+# region metrics
+http_request_seconds = metrics.histogram(
+    "pantry_http_request_duration_seconds",
+    "Time to handle a request; for streamed responses, until the response starts.", ("route", "method"))
+http_requests = metrics.counter("pantry_http_requests_total", "Requests handled.", ("route", "method", "status"))
+frames_received = metrics.counter("pantry_frames_received_total", "Live frames received.", ("device",))
+frame_bytes = metrics.counter("pantry_frame_bytes_total", "Bytes of live frames received.", ("device",))
+captures_received = metrics.counter("pantry_captures_received_total", "Trigger captures received.", ("device",))
+
+def record_request(route: str, method: str, status: int, latency: float):
+    http_request_seconds.observe(latency, route, method)
+    http_requests.inc(route, method, status)
+
+def pool_stat(key: str) -> dict:
+    return {(pipeline.device_id,): pipeline.pool.status()[key] for pipeline in devices.all()}
+
+def cache_stats(key: str) -> dict:
+    return {("analysis",): analysis_cache.stats[key], ("recipes",): recipe_cache.stats[key]}
+
+def single_flight_stats(key: str) -> dict:
+    return {("analysis",): analysis_flight.stats[key], ("recipes",): recipe_flight.stats[key]}
+
+def llm_policy_events() -> dict:
+    return {(policy.name, event): policy.stats[event] for policy in (recipe_policy, analysis_policy)
+            for event in ("retries", "hedges", "hedge_wins", "deadline_exceeded", "short_circuited")}
+
+def cache_hit_ratios() -> dict:
+    return {(name,): cache.status()["hit_ratio"] for name, cache in (("analysis", analysis_cache), ("recipes", recipe_cache))}
+
+metrics.collected("pantry_analysis_queue_depth", "Capture pairs waiting for an analysis worker.",
+                  "gauge", ("device",), lambda: pool_stat("queue_depth"))
+metrics.collected("pantry_analysis_in_flight", "Analyses running on a worker.",
+                  "gauge", ("device",), lambda: pool_stat("in_flight"))
+metrics.collected("pantry_analysis_jobs_completed_total", "Analyses finished.",
+                  "counter", ("device",), lambda: pool_stat("completed"))
+metrics.collected("pantry_analysis_jobs_failed_total", "Analyses that raised an error.",
+                  "counter", ("device",), lambda: pool_stat("failed"))
+metrics.collected("pantry_analysis_jobs_rejected_total", "Capture pairs turned away because the queue was full.",
+                  "counter", ("device",), lambda: pool_stat("rejected"))
+metrics.collected("pantry_analysis_limit_in_use", "Analysis slots shared by all devices that are in use.",
+                  "gauge", (), lambda: {(): analysis_limit.status()["in_use"]})
+metrics.collected("pantry_analysis_limit_waiting", "Analysis workers waiting for a shared slot.",
+                  "gauge", (), lambda: {(): analysis_limit.status()["waiting"]})
+metrics.collected("pantry_change_filter_skipped_total", "Capture pairs skipped as unchanged without calling the model.",
+                  "counter", (), lambda: {(): change_filter.stats["skipped"]})
+metrics.collected("pantry_cache_hits_total", "Cache hits.", "counter", ("cache",), lambda: cache_stats("hits"))
+metrics.collected("pantry_cache_misses_total", "Cache misses.", "counter", ("cache",), lambda: cache_stats("misses"))
+metrics.collected("pantry_cache_hit_ratio", "Cache hits over lookups since start.", "gauge", ("cache",), cache_hit_ratios)
+metrics.collected("pantry_single_flight_collapsed_total", "Calls that waited for an identical call already running.",
+                  "counter", ("call",), lambda: single_flight_stats("collapsed"))
+metrics.collected("pantry_llm_policy_events_total", "LLM retries, hedged requests, deadline overruns and calls refused by the breaker.",
+                  "counter", ("call", "event"), llm_policy_events)
+metrics.collected("pantry_llm_circuit_open", "1 while the LLM circuit breaker is refusing calls.",
+                  "gauge", (), lambda: {(): int(llm_breaker.state != "closed")})
+metrics.collected("pantry_inventory_version", "Current pantry version.", "gauge", (), lambda: {(): pantry_store.version})
+metrics.collected("pantry_inventory_stream_subscribers", "Open /api/inventory/stream connections.",
+                  "gauge", (), lambda: {(): inventory_events.status()["subscribers"]})
+metrics.collected("pantry_bots_connected", "Bots with a recent heartbeat.",
+                  "gauge", (), lambda: {(): bot_registry.status()["connected"]})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.received_at = time.time()  # start of the request's pipeline trace, if it gets one
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+# endregion
+
+def store_frame(data: bytes, device_id: str = DEFAULT_DEVICE_ID):
+    """
+    Keep the latest live frame from an ESP32 and wake that device's video feed viewers.
+    Returns (payload, status).
+    """
+    if not data:
+        return {'error': 'No data received'}, 400
+    try:
+        pipeline = devices.get(device_id)
+    except DeviceLimitError as e:
+        return {'error': str(e)}, 429
+    pipeline.publish_frame(data)
+    frames_received.inc(device_id)
+    frame_bytes.inc(device_id, amount=len(data))
+    # print(f"Received frame: {len(data)} bytes") # Debug
+    return {'status': 'Frame updated'}, 200
+
+def store_capture(data: bytes, device_id: str = DEFAULT_DEVICE_ID, received_at: float = None):
+    """
+    Chain a device's captures into before/after pairs and queue each pair for analysis.
+    Each capture is traced from `received_at` (time.time() when the request arrived)
+    until its analysis is saved. Returns (payload, status).
+    """
+    if not data:
+        return {'error': 'No data received'}, 400
+    
+    trace = tracer.start_trace("capture", start=received_at, device=device_id, bytes=len(data))
+    try:
+        pipeline = devices.get(device_id)
+        captures_received.inc(device_id)
+        trace.add_span("receive", trace.start, time.time())
+        with trace.span("history_write"):
+            seq = capture_ring.append(data, device_id, received_at)
+        if analysis_leader is not None:
+            # Whichever worker leads analysis picks the capture up from the shared ring
+            trace.finish("handed_off", seq=seq)
+            return {'status': 'Frame updated, analysis queued', 'seq': seq, 'trace_id': trace.trace_id}, 200
+        # If the queue is full the device keeps its previous capture,
+        # so the next capture is compared against it instead
+        if seq is not None:
+            capture_ring.mark_dispatched(seq)
+        outcome = submit_stored_capture(pipeline, seq, data, trace)
+        if outcome != "queued":
+            trace.finish(outcome)
+            return {'status': 'Frame updated', 'trace_id': trace.trace_id}, 200
+    except (QueueFullError, DeviceLimitError) as e:
+        trace.finish("rejected", error=str(e))
+        return {'error': str(e), 'trace_id': trace.trace_id}, 429
+    
+    return {'status': 'Frame updated, analysis queued', 'trace_id': trace.trace_id}, 200
+
+def request_device_id() -> str:
+    """Device ID of the current Flask request"""
+    return device_id_from(request.headers, request.args)
+
+def device_query() -> str:
+    """'?device=<id>' of the current request, for pages that load a device's feed or image"""
+    return '?' + urlencode({'device': request.args['device']}) if 'device' in request.args else ''
+
+def device_pipeline(device_id: str):
+    """Pipeline of a device, or None if it has never connected"""
+    try:
+        if shared_frames is not None and shared_frames.has(device_id):
+            return devices.get(device_id)  # may have connected to another worker
+        return devices.find(device_id)
+    except DeviceLimitError:
+        return None
+
+def find_device():
+    """Pipeline of the device asked for by the current request, or None if it has never connected"""
+    try:
+        return device_pipeline(request_device_id())
+    except ValueError:
+        return None
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_event(event: str, data, event_id=None) -> str:
+    """Format one Server-Sent Events message"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def inventory_etag(version: int) -> str:
+    return f"{pantry_store.epoch}-{version}"
+
+# Serialized inventory of the version it was built from, shared by GET requests
+inventory_body = (None, None)
+
+def get_inventory_json():
+    """(version, inventory JSON), serializing only after the pantry has changed"""
+    global inventory_body
+    version, body = inventory_body
+    if version != pantry_store.version:
+        version, inventory = pantry_store.snapshot()
+        body = json.dumps(inventory)
+        inventory_body = (version, body)
+    return version, body
+
+def get_pantry_ingredient_names() -> list:
+    """Names of the ingredients currently in the pantry"""
+    pantry_ingredient_names = []
+    for item in pantry_store.get_inventory():
+        if isinstance(item, dict) and "name" in item and item["name"].strip():
+            pantry_ingredient_names.append(item["name"].strip())
+    return pantry_ingredient_names
 
 # region endpoints
 @app.route('/api/bots', methods=['GET', 'POST'])
 def handle_bots():
-    json_path = os.path.join(os.path.dirname(__file__), 'bots.json')
-    
     if request.method == 'GET':
         # Frontend requests bot status
         try:
-            with open(json_path, 'r') as file:
-                bots_data = json.load(file)
-            return jsonify(bots_data), 200
-        except FileNotFoundError:
-            return jsonify({'error': 'bots.json not found'}), 404
-        except json.JSONDecodeError:
-            return jsonify({'error': 'Invalid JSON format'}), 500
+            body, etag = bot_registry.snapshot()
+            response = Response(body, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+            response.set_etag(etag)
+            return response.make_conditional(request)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
     elif request.method == 'POST':
-        # ESP32 bot posting status update
+        # ESP32 bot heartbeat with its status
         try:
             bot_update = request.get_json()
             
             # Validate required fields
-            if 'id' not in bot_update or 'status' not in bot_update:
-                return jsonify({'error': 'Missing id or status field'}), 400
-            
-            bot_id = bot_update['id']
-            
-            # Load existing bots
-            try:
-                with open(json_path, 'r') as file:
-                    bots_data = json.load(file)
-            except (FileNotFoundError, json.JSONDecodeError):
-                bots_data = []
-            
-            # Find and update existing bot or add new one
-            bot_found = False
-            for i, bot in enumerate(bots_data):
-                if bot.get('id') == bot_id:
-                    # Update existing bot
-                    bots_data[i] = bot_update
-                    bot_found = True
-                    break
+            if not isinstance(bot_update, dict) or 'id' not in bot_update:
+                return jsonify({'error': 'Missing id field'}), 400
             
-            if not bot_found:
-                # Add new bot
-                bots_data.append(bot_update)
-            
-            # Save updated bots
-            with open(json_path, 'w') as file:
-                json.dump(bots_data, file, indent=4)
-            
-            print(f"Bot {bot_id} status updated: {bot_update.get('status')} | Battery: {bot_update.get('battery', 'N/A')}")
-            return jsonify({'message': 'Bot status updated', 'bot': bot_update}), 200
+            bot = bot_registry.heartbeat(bot_update)
+            return jsonify({'message': 'Bot status updated', 'bot': bot}), 200
             
         except Exception as e:
             print(f"Error updating bot status: {e}")
             return jsonify({'error': str(e)}), 500
 
-@app.route('/api/recipes', methods=['POST'])
-def recipe_handler():
-    try:
-        request_data = request.get_json()
-        allergens = request_data.get('allergens', [])
-        
-        if not isinstance(allergens, list):
-            return jsonify({'error': 'Allergens must be a list of strings'}), 400
-
-        # Ensure pantry_state.json exists before attempting to read
-        create_pantry_state_if_not_exists()
-
-        pantry_data = {}
-        with open(PANTRY_STATE_FILE, "r") as f:
-            try:
-                pantry_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({'error': 'Invalid JSON format in pantry_state.json'}), 500
-        
-        current_inventory_raw = pantry_data.get('current_full_inventory', [])
-        
-        # Extract only the names of the ingredients from the inventory objects
-        pantry_ingredient_names = []
-        for item in current_inventory_raw:
-            if isinstance(item, dict) and "name" in item and item["name"].strip():
-                pantry_ingredient_names.append(item["name"].strip())
-        
-        # Call the generate_recipes function from recipe_service.py
-        # This function now returns a JSON string
+def recipe_request_args(request_data) -> Tuple[list, bool]:
+    """(allergens, force_refresh) of a recipe request; raises ValueError for a malformed one"""
+    request_data = request_data or {}
+    allergens = request_data.get('allergens', [])
+    if not isinstance(allergens, list):
+        raise ValueError('Allergens must be a list of strings')
+    return allergens, bool(request_data.get('force_refresh', False))
+
+def cached_recipes(allergens: list, force_refresh: bool) -> Tuple[list, tuple, Optional[str]]:
+    """(pantry ingredient names, recipe cache key, cached recipe JSON or None)"""
+    pantry_ingredient_names = get_pantry_ingredient_names()
+    # Same pantry and allergens as a recent call: the stored JSON is served as-is
+    cache_key = RecipeCache.make_key(pantry_ingredient_names, allergens, RECIPE_MODEL)
+    return pantry_ingredient_names, cache_key, None if force_refresh else recipe_cache.get(cache_key)
+
+def keep_recipes(cache_key: tuple, recipes_json_string: str):
+    # Failed generations come back as an empty list with an error, don't keep those
+    if 'error' not in json.loads(recipes_json_string):
+        recipe_cache.put(cache_key, recipes_json_string)
+
+def get_recipes(allergens: list, force_refresh: bool) -> Tuple[str, dict]:
+    """
+    Recipe JSON for the current pantry, and response headers saying where it
+    came from: the cache, an identical call already running, or a new call.
+    """
+    pantry_ingredient_names, cache_key, cached = cached_recipes(allergens, force_refresh)
+    if cached is not None:
+        return cached, {'X-Cache': 'HIT'}
+
+    def generate_and_cache():
         recipes_json_string = generate_recipes(
             pantry_ingredient_names=pantry_ingredient_names,
             allergies=allergens,
-            llm_model_name="gemini-3-flash-preview" # Specify your desired LLM here
+            llm_model_name=RECIPE_MODEL
         )
-        
-        # Parse the JSON string from generate_recipes back into a Python dict
-        # so Flask's jsonify can properly serialize it.
-        recipes_data = json.loads(recipes_json_string)
+        keep_recipes(cache_key, recipes_json_string)
+        return recipes_json_string
+
+    recipes_json_string, shared = recipe_flight.do(cache_key, generate_and_cache)
+    return recipes_json_string, {'X-Single-Flight': 'SHARED'} if shared else {}
+
+async def get_recipes_async(allergens: list, force_refresh: bool, llm_limit: asyncio.Semaphore) -> Tuple[str, dict]:
+    """
+    Async version of get_recipes(); the Gemini call runs within `llm_limit`.
+    The pantry is read in a thread, it may wait on the shared state's file lock.
+    """
+    pantry_ingredient_names, cache_key, cached = await asyncio.to_thread(cached_recipes, allergens, force_refresh)
+    if cached is not None:
+        return cached, {'X-Cache': 'HIT'}
+
+    async def generate_and_cache():
+        async with llm_limit:
+            recipes_json_string = await generate_recipes_async(
+                pantry_ingredient_names=pantry_ingredient_names,
+                allergies=allergens,
+                llm_model_name=RECIPE_MODEL
+            )
+        keep_recipes(cache_key, recipes_json_string)
+        return recipes_json_string
+
+    recipes_json_string, shared = await recipe_flight.do_async(cache_key, generate_and_cache)
+    return recipes_json_string, {'X-Single-Flight': 'SHARED'} if shared else {}
 
-        return jsonify(recipes_data), 200
+@app.route('/api/recipes', methods=['POST'])
+def recipe_handler():
+    try:
+        allergens, force_refresh = recipe_request_args(request.get_json())
+        recipes_json_string, headers = get_recipes(allergens, force_refresh)
+        return Response(recipes_json_string, mimetype='application/json', headers=headers), 200
     except ValueError as e:
         # Catch specific validation errors, e.g., if API key is not set
         return jsonify({'error': str(e)}), 400
@@ -182,24 +472,92 @@ def recipe_handler():
         print(f"Error in /api/recipes: {e}")
         return jsonify({'error': str(e)}), 500
 
+def cached_recipe_events(cached: str, start: float) -> list:
+    recipes = json.loads(cached)['recipes']
+    return [sse_event('recipe', recipe) for recipe in recipes] + [sse_event('done', {
+        'count': len(recipes), 'cached': True, 'time_to_first_recipe_s': 0.0,
+        'total_s': round(time.perf_counter() - start, 3)})]
+
+def recipes_done_event(cache_key: tuple, recipes: list, start: float, first_recipe_at: Optional[float]) -> str:
+    """Keep a finished stream's recipes and format its 'done' event"""
+    if recipes:
+        recipe_cache.put(cache_key, RecipeList(recipes=recipes).model_dump_json(indent=2))
+    return sse_event('done', {
+        'count': len(recipes),
+        'cached': False,
+        'time_to_first_recipe_s': round(first_recipe_at, 3) if first_recipe_at is not None else None,
+        'total_s': round(time.perf_counter() - start, 3)
+    })
+
+def recipe_events(allergens: list, force_refresh: bool) -> Iterator[str]:
+    """SSE messages of /api/recipes/stream"""
+    pantry_ingredient_names, cache_key, cached = cached_recipes(allergens, force_refresh)
+    start = time.perf_counter()
+    if cached is not None:
+        yield from cached_recipe_events(cached, start)
+        return
+
+    first_recipe_at = None
+    recipes = []
+    try:
+        for recipe in stream_recipes(pantry_ingredient_names, allergens, RECIPE_MODEL):
+            if first_recipe_at is None:
+                first_recipe_at = time.perf_counter() - start
+            recipes.append(recipe)
+            yield sse_event('recipe', recipe.model_dump())
+    except Exception as e:
+        print(f"Error in /api/recipes/stream: {e}")
+        yield sse_event('error', {'error': str(e)})
+        return
+    yield recipes_done_event(cache_key, recipes, start, first_recipe_at)
+
+async def recipe_events_async(allergens: list, force_refresh: bool) -> AsyncIterator[str]:
+    """Async version of recipe_events()"""
+    pantry_ingredient_names, cache_key, cached = await asyncio.to_thread(cached_recipes, allergens, force_refresh)
+    start = time.perf_counter()
+    if cached is not None:
+        for message in cached_recipe_events(cached, start):
+            yield message
+        return
+
+    first_recipe_at = None
+    recipes = []
+    try:
+        async for recipe in astream_recipes(pantry_ingredient_names, allergens, RECIPE_MODEL):
+            if first_recipe_at is None:
+                first_recipe_at = time.perf_counter() - start
+            recipes.append(recipe)
+            yield sse_event('recipe', recipe.model_dump())
+    except Exception as e:
+        print(f"Error in /api/recipes/stream: {e}")
+        yield sse_event('error', {'error': str(e)})
+        return
+    yield recipes_done_event(cache_key, recipes, start, first_recipe_at)
+
+@app.route('/api/recipes/stream', methods=['POST'])
+def recipe_stream_handler():
+    """
+    Same request as /api/recipes, but answers with Server-Sent Events:
+    a 'recipe' event for each recipe as soon as the model has written it,
+    then a 'done' event with timings (or an 'error' event).
+    """
+    try:
+        allergens, force_refresh = recipe_request_args(request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(stream_with_context(recipe_events(allergens, force_refresh)), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
 @app.route('/api/inventory', methods=['POST'])
 def add_inventory_item():
     try: 
         new_item = request.get_json()
         
-        with open(PANTRY_STATE_FILE, 'r') as file:
-            pantry_data = json.load(file)
-        current_inventory = pantry_data.get('current_full_inventory', [])
-        
         # Generate UUID for the new item based on its name
-        new_item['id'] = get_or_create_uuid(new_item['name'])
+        new_item['id'] = item_registry.resolve(new_item['name'])
         new_item['date_added'] = datetime.datetime.now().strftime('%Y-%m-%d')
         
-        current_inventory.append(new_item)
-        pantry_data['current_full_inventory'] = current_inventory
-        
-        with open(PANTRY_STATE_FILE, 'w') as file:
-            json.dump(pantry_data, file, indent=4)
+        pantry_store.add_item(new_item)
         
         return jsonify(new_item), 201
     except Exception as e:
@@ -208,17 +566,8 @@ def add_inventory_item():
 @app.route('/api/inventory/<item_id>', methods=['DELETE'])
 def delete_inventory_item(item_id):
     try:
-        with open(PANTRY_STATE_FILE, 'r') as file:
-            pantry_data = json.load(file)
-        
-        current_inventory = pantry_data.get('current_full_inventory', [])
-        updated_inventory = [item for item in current_inventory if item.get('id') != item_id]
-        if len(updated_inventory) == len(current_inventory):
+        if not pantry_store.remove_item(item_id):
             return jsonify({'error': 'Item not found'}), 404
-        pantry_data['current_full_inventory'] = updated_inventory
-        
-        with open(PANTRY_STATE_FILE, 'w') as file:
-            json.dump(pantry_data, file, indent=4)
         
         return jsonify({'message': 'Item deleted successfully'}), 200
     except Exception as e:
@@ -226,18 +575,124 @@ def delete_inventory_item(item_id):
 
 @app.route('/api/inventory', methods=['GET'])
 def get_inventory():
+    """
+    The full inventory list, with a strong ETag of the pantry version.
+    A matching If-None-Match gets 304 Not Modified.
+
+    With ?since=<version> (and optionally &epoch=<epoch>) only what changed
+    after that version is returned: {'version', 'epoch', 'full': false,
+    'changed', 'removed'}. Drop every entry whose id is in 'removed' or appears
+    in 'changed', then add the 'changed' entries. If the version is too old,
+    the answer is {'version', 'epoch', 'full': true, 'inventory'} instead.
+    """
     try:
-        with open(PANTRY_STATE_FILE, 'r') as file:
-            pantry_data = json.load(file)
+        if 'since' in request.args:
+            return get_inventory_delta()
+        
+        # Answer revalidations before serializing anything
+        etag = inventory_etag(pantry_store.version)
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
         
-        inventory = pantry_data.get('current_full_inventory', [])
-        return jsonify(inventory), 200
-    except FileNotFoundError:
-        return jsonify({'error': 'pantry_state.json not found'}), 404
-    except json.JSONDecodeError:
-        return jsonify({'error': 'Invalid JSON format'}), 500
+        version, body = get_inventory_json()
+        response = Response(body, mimetype='application/json',
+                            headers={'Cache-Control': 'no-cache', 'X-Pantry-Version': str(version)})
+        response.set_etag(inventory_etag(version))
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def inventory_snapshot_event() -> Tuple[int, str]:
+    version, inventory = pantry_store.snapshot()
+    data = {'version': version, 'epoch': pantry_store.epoch, 'inventory': inventory}
+    return version, sse_event('snapshot', data, f"{pantry_store.epoch}-{version}")
+
+def inventory_resume_event(last_event_id: str) -> Optional[Tuple[int, str]]:
+    """Changes since a client's Last-Event-ID as one event, None if the change log no longer covers them"""
+    # Last-Event-ID is the "<epoch>-<version>" of the last event the client saw
+    epoch, _, since = last_event_id.partition('-')
+    if epoch != pantry_store.epoch or not since.isdigit():
+        return None
+    version, delta = pantry_store.changes_since(int(since))
+    if delta is None:
+        return None
+    data = {'version': version, 'epoch': pantry_store.epoch, **delta}
+    return version, sse_event('inventory', data, f"{pantry_store.epoch}-{version}")
+
+def inventory_event_message(event, version: int) -> Tuple[int, Optional[str]]:
+    """(version, SSE message) for an InventoryEvents event; the message is None for one the client already has"""
+    if event is None:
+        return version, ": keep-alive\n\n"
+    if event is RESYNC:
+        return inventory_snapshot_event()
+    if event['version'] > version:
+        data = {key: value for key, value in event.items() if key != 'event'}
+        return event['version'], sse_event('inventory', data, f"{event['epoch']}-{event['version']}")
+    return version, None
+
+def first_inventory_event(last_event_id: str) -> Tuple[int, str]:
+    """The missed changes of a reconnecting client, else a full snapshot"""
+    return inventory_resume_event(last_event_id) or inventory_snapshot_event()
+
+def inventory_events_stream(last_event_id: str) -> Iterator[str]:
+    """SSE messages of /api/inventory/stream"""
+    q = inventory_events.subscribe()
+    try:
+        # Subscribed before reading the state, so no change falls in between;
+        # queued events the first message already covers are skipped
+        version, message = first_inventory_event(last_event_id)
+        yield message
+        for event in inventory_events.events(q):
+            version, message = inventory_event_message(event, version)
+            if message is not None:
+                yield message
+    finally:
+        inventory_events.unsubscribe(q)
+
+async def inventory_events_stream_async(last_event_id: str) -> AsyncIterator[str]:
+    """Async version of inventory_events_stream(); pantry reads run in a thread"""
+    q = inventory_events.subscribe_async()
+    try:
+        version, message = await asyncio.to_thread(first_inventory_event, last_event_id)
+        yield message
+        async for event in inventory_events.events_async(q):
+            if event is RESYNC:
+                version, message = await asyncio.to_thread(inventory_snapshot_event)
+            else:
+                version, message = inventory_event_message(event, version)
+            if message is not None:
+                yield message
+    finally:
+        inventory_events.unsubscribe_async(q)
+
+@app.route('/api/inventory/stream', methods=['GET'])
+def inventory_stream():
+    """
+    Server-Sent Events of inventory changes.
+
+    Starts with a 'snapshot' event {'version', 'epoch', 'inventory'}, then an
+    'inventory' event {'version', 'epoch', 'changed', 'removed'} for every
+    change, applied the same way as a ?since= delta. A reconnecting EventSource
+    sends Last-Event-ID and gets the missed changes as one 'inventory' event
+    when the change log still covers them. A client that falls too far behind
+    gets a new 'snapshot'. Comment lines are sent as keep-alives.
+    """
+    return Response(stream_with_context(inventory_events_stream(request.headers.get('Last-Event-ID', ''))),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+def get_inventory_delta():
+    try:
+        since = int(request.args['since'])
+    except ValueError:
+        return jsonify({'error': 'since must be an integer version'}), 400
+    
+    version, delta = pantry_store.changes_since(since)
+    if delta is not None and request.args.get('epoch', pantry_store.epoch) == pantry_store.epoch:
+        return jsonify({'version': version, 'epoch': pantry_store.epoch, 'full': False, **delta}), 200
+    
+    # The change log no longer reaches back that far, or the server restarted
+    version, inventory = pantry_store.snapshot()
+    return jsonify({'version': version, 'epoch': pantry_store.epoch, 'full': True, 'inventory': inventory}), 200
     
 
 @app.route("/api/analyze_pantry", methods=["POST"])
@@ -256,8 +711,16 @@ def analyze_pantry():
         before_bytes = before_image.read()
         after_bytes = after_image.read()
 
-        # Use the analyzer module
-        response = analyze_pantry_images(before_bytes, after_bytes)
+        trace = tracer.start_trace("analyze_pantry", start=g.get('received_at'))
+        trace.add_span("receive", trace.start, time.time())
+        try:
+            # Use the analyzer module
+            with activate(trace):
+                response = analyze_pantry_images(before_bytes, after_bytes)
+        except Exception as e:
+            trace.finish("failed", error=str(e))
+            raise
+        trace.finish("applied")
 
         return jsonify(response.dict()), 200
 
@@ -268,90 +731,113 @@ def analyze_pantry():
 @app.route('/api/frame', methods=['POST'])
 def receive_frame():
     """
-    ESP32 sends raw JPEG bytes here. We store them in a global variable.
+    ESP32 sends raw JPEG bytes here. We hand them to the frame broadcaster.
     """
-    global latest_frame
     try:
         # request.data contains the raw bytes (the image)
-        if request.data:
-            latest_frame = request.data
-            # print(f"Received frame: {len(latest_frame)} bytes") # Debug
-            return jsonify({'status': 'Frame updated'}), 200
-        else:
-            return jsonify({'error': 'No data received'}), 400
+        payload, status = store_frame(request.data, request_device_id())
+        return jsonify(payload), status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error receiving frame: {e}")
         return jsonify({'error': str(e)}), 500
 
-def generate_frames():
+def generate_frames(pipeline: DevicePipeline):
     """
-    Generator function that yields the latest frame in MJPEG format.
+    Generator function that yields the device's latest frame in MJPEG format.
+    Blocks until /api/frame stores a new frame instead of polling.
     """
-    while True:
-        if prev_capture: #latest_capture
-            # MJPEG format requires boundaries between frames
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-        
-        # Sleep briefly to avoid 100% CPU usage loop
-        # The ESP32 sends frames every ~800ms, so 0.1s check is fine
-        time.sleep(0.1)
+    return pipeline.frames.stream()
 
 @app.route('/video_feed')
 def video_feed():
     """
-    The browser <img> tag will point here.
+    The browser <img> tag will point here. Pass ?device=<id> for a specific camera.
     """
-    return Response(generate_frames(),
+    pipeline = find_device()
+    if pipeline is None:
+        return jsonify({'error': 'Unknown device'}), 404
+    return Response(generate_frames(pipeline),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/capture', methods=['POST'])
 def receive_capture():
     """
-    ESP32 sends raw JPEG bytes here. We store them in a global variable.
+    ESP32 sends raw JPEG bytes here. Each device keeps its own before/after chain.
     """
-    global prev_capture, latest_capture
-    if not prev_capture:
-        try:
-            # request.data contains the raw bytes (the image)
-            if request.data:
-                prev_capture = request.data
-                # print(f"Received capture: {len(prev_capture)} bytes")
-                return jsonify({'status': 'Frame updated'}), 200
-            else:
-                return jsonify({'error': 'No data received'}), 400
-        except Exception as e:
-            print(f"Error receiving frame: {e}")
-            return jsonify({'error': str(e)}), 500
-    
-    else:
-        try:
-            # request.data contains the raw bytes (the image)
-            if request.data:
-                latest_capture = request.data
-                # print(f"Received frame: {len(latest_capture)} bytes")
-                
-                # Trigger analysis in separate thread (allows "queueing" multiple analyses)
-                # We pass the current data as arguments so the thread has its own references
-                thread = threading.Thread(target=analyze_pantry_thread, args=(prev_capture, latest_capture), daemon=True)
-                thread.start()
-                
-                # Update captures immediately so we're ready for the next one
-                prev_capture = latest_capture
-                latest_capture = None
-                
-                return jsonify({'status': 'Frame updated, analysis started'}), 200
-            else:
-                return jsonify({'error': 'No data received'}), 400
-        except Exception as e:
-            print(f"Error receiving frame: {e}")
-            return jsonify({'error': str(e)}), 500
+    try:
+        # request.data contains the raw bytes (the image)
+        payload, status = store_capture(request.data, request_device_id(), g.get('received_at'))
+        return jsonify(payload), status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error receiving frame: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/status', methods=['GET'])
+def analysis_status():
+    """
+    Queue depth, wait times and drop/reject counters of the default device's
+    analysis pool, the same per device under 'devices', the slots all devices
+    share for model calls under 'limit', plus counters of the result cache,
+    collapsed duplicate calls, change filter, image preparation, Gemini calls
+    and their retries, hedges and circuit breaker.
+    """
+    return jsonify({
+        **devices.get(DEFAULT_DEVICE_ID).pool.status(),
+        'devices': devices.status(),
+        'limit': analysis_limit.status(),
+        'cache': analysis_cache.status(),
+        'single_flight': {'analysis': analysis_flight.status(), 'recipes': recipe_flight.status()},
+        'change_filter': change_filter.status(),
+        'image_prep': image_preparer.status(),
+        'llm': llm_status(),
+        'llm_policy': llm_policy_status(),
+        'bots': bot_registry.status(),
+        'inventory_stream': inventory_events.status(),
+        'tracing': tracer.status(),
+        'capture_history': capture_ring.status(),
+        'workers': {
+            'shared_dir': SHARED_DIR,
+            'leader': analysis_leader.status() if analysis_leader else None,
+            'frames': shared_frames.status() if shared_frames else None,
+            'pantry': {'version': pantry_store.version, 'epoch': pantry_store.epoch}
+        }
+    }), 200
+
+@app.route('/api/debug/traces', methods=['GET'])
+def debug_traces():
+    """
+    Slowest recent pipeline traces, and a per-stage breakdown of where their time went.
+    Optional filters: ?kind=capture|analyze_pantry, ?device=<id>, ?since=<unix time>, ?limit=<n> (default 20).
+    """
+    try:
+        limit = int(request.args.get('limit', 20))
+        since = float(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'limit and since must be numbers'}), 400
+
+    records = tracer.recent(kind=request.args.get('kind'), device=request.args.get('device'), since=since)
+    return jsonify({
+        'traces': len(records),
+        'stages': tracer.stage_breakdown(records),
+        'slowest': tracer.slowest(records, limit),
+        'tracer': tracer.status()
+    }), 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request, LLM, analysis queue, frame ingest, persistence and cache metrics in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/view_stream')
 def view_stream():
     """
     A simple HTML page to host the video feed.
     """
+    query = device_query()
     html = """
     <html>
         <head>
@@ -363,27 +849,74 @@ def view_stream():
         </head>
         <body>
             <h1>Pantry Bot Live Stream</h1>
-            <img src="/video_feed" />
+            <img src="/video_feed{query}" />
         </body>
     </html>
     """
-    return html
+    return html.replace('{query}', query)
+
+def capture_response(seq):
+    """A capture from the history as a JPEG, sent straight from the memory-mapped file"""
+    found = capture_ring.stream(seq) if seq is not None else None
+    if found is None:
+        return None
+    record, chunks = found
+    return Response(chunks, mimetype='image/jpeg', headers={
+        'Content-Length': str(record.size),
+        'Cache-Control': 'no-cache',
+        'X-Capture-Seq': str(record.seq),
+        'X-Device-ID': record.device_id,
+        'X-Capture-Time': f"{record.timestamp:.3f}"
+    })
 
 @app.route('/latest_image')
 def latest_image():
     """
-    Serves the most recent capture as a JPEG image.
+    Serves the device's most recent capture as a JPEG image.
     """
-    if prev_capture:
-        return Response(prev_capture, mimetype='image/jpeg')
-    else:
+    try:
+        device_id = request_device_id()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = capture_response(capture_ring.latest(device_id))
+    if response is None:
         return jsonify({'error': 'No capture available yet'}), 404
+    return response
+
+@app.route('/api/captures', methods=['GET'])
+def list_captures():
+    """
+    Captures still in the history, newest first.
+    Optional: ?device=<id> for one camera, ?limit=<n> (default 50).
+    """
+    try:
+        device_id = request.args.get('device')
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    return jsonify({
+        'captures': [{'seq': record.seq, 'device_id': record.device_id,
+                      'timestamp': record.timestamp, 'bytes': record.size}
+                     for record in capture_ring.records(device_id, limit)],
+        'history': capture_ring.status()
+    }), 200
+
+@app.route('/api/captures/<int:seq>', methods=['GET'])
+def get_capture(seq):
+    """
+    One capture from the history as a JPEG image.
+    """
+    response = capture_response(seq)
+    if response is None:
+        return jsonify({'error': 'Capture not in history'}), 404
+    return response
 
 @app.route('/latest')
 def latest():
     """
     A simple HTML page to display the most recent capture.
     """
+    query = device_query()
     html = """
     <html>
         <head>
@@ -420,11 +953,11 @@ def latest():
             <h1>Latest Pantry Capture</h1>
             <button onclick="location.reload()">Refresh</button>
             <br>
-            <img src="/latest_image" id="latestImg" onerror="this.alt='No capture available yet'"/>
+            <img src="/latest_image{query}" id="latestImg" onerror="this.alt='No capture available yet'"/>
         </body>
     </html>
     """
-    return html
+    return html.replace('{query}', query)
 
 # endregion
 
@@ -445,10 +978,16 @@ if __name__ == '__main__':
     print(f"Available endpoints:")
     print(f"  GET  /api/bots")
     print(f"  POST /api/recipes")
+    print(f"  POST /api/recipes/stream (Server-Sent Events)")
     print(f"  GET  /api/inventory")
+    print(f"  GET  /api/inventory/stream (Server-Sent Events)")
     print(f"  POST /api/inventory (Add Item)")
     print(f"  DEL  /api/inventory/<id> (Delete Item)")
     print(f"  POST /api/analyze_pantry")
+    print(f"  GET  /api/analysis/status")
+    print(f"  GET  /api/debug/traces")
+    print(f"  GET  /api/captures, /api/captures/<seq>")
+    print(f"  GET  /metrics (Prometheus)")
     print(f"\nServer starting on:")
     print(f"  Local:   http://localhost:5001/api/bots")
     print(f"  Network: http://{local_ip}:5001/api/bots")
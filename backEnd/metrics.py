@@ -0,0 +1,157 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence
+
+# Seconds; covers a ~1 ms frame upload up to a slow model call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_text(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in values]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], buckets: Iterable[float]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *label_values):
+        # Cheap enough for the frame path: one bisect and a few list updates under a lock
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _label_text(self.labels + ("le",), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+class Collected:
+    """Values read from elsewhere (queue depths, cache stats) at scrape time, so recording costs nothing."""
+
+    def __init__(self, name: str, help_text: str, kind: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[tuple, float]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return lines
+        lines += [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in values.items()]
+        return lines
+
+class MetricsRegistry:
+    """
+    Process-wide metrics, rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated where things happen. Numbers the
+    code already keeps (stats dicts, queue lengths) are registered with
+    collected() and only read when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def collected(self, name: str, help_text: str, kind: str, labels: Sequence[str],
+                  collect: Callable[[], Dict[tuple, float]]) -> Collected:
+        """`collect()` returns {label values: value}; `kind` is "gauge" or "counter"."""
+        return self._register(Collected(name, help_text, kind, labels, collect))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+# region shared metrics
+llm_call_seconds = metrics.histogram(
+    "pantry_llm_call_duration_seconds", "Duration of LLM calls, streamed calls until the last token.", ("kind",))
+llm_call_failures = metrics.counter("pantry_llm_call_failures_total", "LLM calls that raised an error.", ("kind",))
+llm_request_bytes = metrics.counter(
+    "pantry_llm_request_bytes_total", "Bytes of prompt and images sent to the LLM.", ("kind",))
+llm_response_bytes = metrics.counter(
+    "pantry_llm_response_bytes_total", "Bytes of answers received from the LLM.", ("kind",))
+persist_seconds = metrics.histogram(
+    "pantry_persist_duration_seconds", "Time spent writing state to disk.", ("store",))
+# endregion
+
+def observe_llm_call(kind: str, latency: float, request_bytes: int, response_bytes: int):
+    llm_call_seconds.observe(latency, kind)
+    llm_request_bytes.inc(kind, amount=request_bytes)
+    llm_response_bytes.inc(kind, amount=response_bytes)
+
+def observe_llm_failure(kind: str, latency: float, request_bytes: int):
+    llm_call_seconds.observe(latency, kind)
+    llm_request_bytes.inc(kind, amount=request_bytes)
+    llm_call_failures.inc(kind)
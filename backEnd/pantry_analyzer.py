@@ -1,17 +1,41 @@
 import os
+import time
+import asyncio
 import base64
-import json
-import uuid
 import datetime
-from typing import List, Optional, cast
+import threading
+from typing import Dict, List, Optional, Tuple, cast
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
-from config import GOOGLE_API_KEY, DB_FILE, PANTRY_STATE_FILE
+from config import GOOGLE_API_KEY, ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_FILE, DEFAULT_DEVICE_ID
+from pantry_store import pantry_store, item_registry
+from analysis_cache import AnalysisCache
+from single_flight import SingleFlight
+from image_prep import image_preparer
+from change_filter import change_filter
+from llm_clients import llm_clients
+from llm_policy import analysis_policy
+from metrics import observe_llm_call, observe_llm_failure
+from tracing import span
 
 # Set environment variable
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 
+MODEL_NAME = "gemini-3-flash-preview"
+# Bump whenever the prompt changes so cached responses to the old prompt are not reused
+PROMPT_VERSION = "2"
+
+analysis_cache = AnalysisCache(
+    ANALYSIS_CACHE_MAX_BYTES,
+    os.path.join(os.path.dirname(__file__), ANALYSIS_CACHE_FILE) if ANALYSIS_CACHE_FILE else None
+)
+# The same image pair arriving again while its analysis runs waits for that call
+analysis_flight = SingleFlight()
+
+# Size and latency of the requests actually sent to Gemini
+_llm_stats_lock = threading.Lock()
+llm_stats = {"calls": 0, "bytes_sent": 0, "latency_s": 0.0}
+
 # region pydantics
 class PantryItem(BaseModel):
     id: str = Field(description="Unique UUID for the item")
@@ -33,136 +57,215 @@ class PantryInventory(BaseModel):
     current_full_inventory: List[PantryItem]
 # endregion
 
-# region db stuff
-def get_or_create_uuid(item_name: str) -> str:
-    """Get existing UUID for item or create new one"""
-    name_key = item_name.strip().lower()
-    registry = {}
-    
-    # Load existing pantry state which contains the registry
-    pantry_data = {}
-    if os.path.exists(PANTRY_STATE_FILE):
-        try:
-            with open(PANTRY_STATE_FILE, "r") as f:
-                pantry_data = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pantry_data = {}
-    
-    registry = pantry_data.get('item_registry', {})
-    
-    # Return existing ID if found
-    if name_key in registry:
-        return registry[name_key]
-    
-    # Create new ID and save immediately
-    new_id = str(uuid.uuid4())
-    registry[name_key] = new_id
-    pantry_data['item_registry'] = registry # Update registry in data object
-
-    # We save immediately to ensure consistency
-    try:
-        with open(PANTRY_STATE_FILE, "w") as f:
-            json.dump(pantry_data, f, indent=4)
-    except IOError as e:
-        print(f"Warning: Could not save registry: {e}")
-    
-    return new_id
-# endregion
-
 # region helpers
 def encode_image_bytes(image_bytes: bytes):
     """Encode image bytes to base64 string"""
     return base64.b64encode(image_bytes).decode("utf-8")
 
-def map_to_pantry_item(item: LLMItemInput) -> PantryItem:
+def map_to_pantry_item(item: LLMItemInput, ids: Dict[str, str]) -> PantryItem:
     """Convert LLM input to PantryItem with UUID"""
     return PantryItem(
-        id=get_or_create_uuid(item.name),
+        id=ids[item.name],
         name=item.name,
         expiry_date=item.expiry_date
     )
 
-def map_removed_string_to_item(name: str) -> PantryItem:
+def map_removed_string_to_item(name: str, ids: Dict[str, str]) -> PantryItem:
     """Convert removed item name to PantryItem with UUID"""
     return PantryItem(
-        id=get_or_create_uuid(name),
+        id=ids[name],
         name=name,
         expiry_date=None
     )
 # endregion
 
 # region analysis
-def analyze_pantry_images(before_bytes: bytes, after_bytes: bytes) -> PantryInventory:
+def build_analysis_message(before_bytes: bytes, after_bytes: bytes, changed_blocks=None) -> Tuple[HumanMessage, int]:
     """
-    Analyze before and after pantry images using Gemini AI.
-    
-    Args:
-        before_bytes: Image bytes of pantry before changes
-        after_bytes: Image bytes of pantry after changes
-        
-    Returns:
-        PantryInventory object with added, removed, and current items
+    Downscale both images, add close-ups of the changed region when the change
+    filter located it (`changed_blocks`), then wrap them with the prompt.
+    Returns the message and the number of image bytes it carries.
     """
-    base64_before = encode_image_bytes(before_bytes)
-    base64_after = encode_image_bytes(after_bytes)
-
-    llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview")
-    structured_llm = llm.with_structured_output(LLMPantryResponse)
+    with span("image_prep"):
+        before_bytes, after_bytes, detail = image_preparer.prepare(before_bytes, after_bytes, changed_blocks)
+    with span("encode"):
+        images = [encode_image_bytes(image) for image in (before_bytes, after_bytes, *(detail or ()))]
 
     current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    detail_note = """
+                Images 3 and 4 are close-ups of the region where the change happened, cropped from the 'Before' and 'After' images. Use them to identify the items that were added or removed. They are not the whole pantry.""" if detail else ""
 
     message = HumanMessage(
         content=[
             {
                 "type": "text",
-                "text": f"""You are a pantry inventory specialist. Analyze the two images provided.
-                Image 1 is the 'Before' state, and Image 2 is the 'After' state.
+                "text": f"""You are a pantry inventory specialist. Analyze the images provided.
+                Image 1 is the 'Before' state, and Image 2 is the 'After' state.{detail_note}
                 Your task is to identify changes in food and grocery items only. Be as specific as possible with item names (e.g., "Heinz Tomato Ketchup" not "ketchup", "Olive Oil" not "oil"). Do not identify non-food items. If you cannot confidently identify an item, do not include it in the list. Do not express uncertainty.
                 The current date is {current_date}. Use it to estimate a reasonable expiry date for any new items.
 
                 Based on your analysis, provide the following information in the requested JSON format:
                 1.  `items_added`: A list of all new food/grocery items present in the 'After' image but not the 'Before' image. Include your best estimate for the expiry date.
                 2.  `items_removed`: A list of names of food/grocery items present in the 'Before' image but missing from the 'After' image.
-                3.  `current_full_inventory`: A complete and clean list of every single food/grocery item visible in the 'After' image, along with estimated expiry dates.
+                3.  `current_full_inventory`: A complete and clean list of every single food/grocery item visible in the full 'After' image (Image 2), along with estimated expiry dates.
                 """
             },
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_before}"}},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_after}"}}
+            *({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}} for image in images)
         ]
     )
+    return message, sum(len(image) for image in images)
 
-    raw_result = structured_llm.invoke([message])
-    analysis = cast(LLMPantryResponse, raw_result)
+def record_llm_call(bytes_sent: int, latency: float, response: LLMPantryResponse):
+    observe_llm_call("analyzer", latency, bytes_sent, len(response.model_dump_json()))
+    with _llm_stats_lock:
+        llm_stats["calls"] += 1
+        llm_stats["bytes_sent"] += bytes_sent
+        llm_stats["latency_s"] += latency
+    print(f"Pantry analysis ({llm_clients.backend}): {bytes_sent} bytes sent, {latency:.2f}s")
 
-    # Process with UUIDs
-    processed_added = [map_to_pantry_item(i) for i in analysis.items_added]
-    processed_full = [map_to_pantry_item(i) for i in analysis.current_full_inventory]
-    processed_removed = [map_removed_string_to_item(name) for name in analysis.items_removed]
+def llm_status() -> dict:
+    with _llm_stats_lock:
+        calls = llm_stats["calls"]
+        return {
+            "calls": calls,
+            "avg_bytes_sent": llm_stats["bytes_sent"] // calls if calls else 0,
+            "avg_latency_s": round(llm_stats["latency_s"] / calls, 3) if calls else 0.0,
+        }
 
-    response = PantryInventory(
-        items_added=processed_added,
-        items_removed=processed_removed,
-        current_full_inventory=processed_full
-    )
+def request_pantry_analysis(before_bytes: bytes, after_bytes: bytes, changed_blocks=None) -> LLMPantryResponse:
+    """
+    Send the before and after pantry images to Gemini AI and return its raw answer.
+    """
+    message, bytes_sent = build_analysis_message(before_bytes, after_bytes, changed_blocks)
+    structured_llm = llm_clients.structured_model(MODEL_NAME, LLMPantryResponse)
 
-    # Load existing state to preserve item_registry
-    existing_data = {}
-    if os.path.exists(PANTRY_STATE_FILE):
-         with open(PANTRY_STATE_FILE, "r") as f:
-            try:
-                existing_data = json.load(f)
-            except:
-                pass
-
-    # Save to pantry state file, preserving registry
-    pantry_state_payload = {
-        "items_added": [i.dict() for i in processed_added],
-        "items_removed": [i.name for i in processed_removed],
-        "current_full_inventory": [i.dict() for i in processed_full],
-        "item_registry": existing_data.get("item_registry", {})
-    }
+    start = time.perf_counter()
+    try:
+        with span("llm_call", backend=llm_clients.backend, bytes_sent=bytes_sent) as attrs:
+            raw_result = analysis_policy.call(lambda: structured_llm.invoke([message]), attrs)
+    except Exception:
+        observe_llm_failure("analyzer", time.perf_counter() - start, bytes_sent)
+        raise
+    record_llm_call(bytes_sent, time.perf_counter() - start, raw_result)
+
+    return cast(LLMPantryResponse, raw_result)
+
+async def request_pantry_analysis_async(before_bytes: bytes, after_bytes: bytes, changed_blocks=None) -> LLMPantryResponse:
+    """
+    Async version of request_pantry_analysis(). Image work runs in a thread,
+    the Gemini call is awaited.
+    """
+    message, bytes_sent = await asyncio.to_thread(build_analysis_message, before_bytes, after_bytes, changed_blocks)
+    structured_llm = llm_clients.structured_model(MODEL_NAME, LLMPantryResponse)
+
+    start = time.perf_counter()
+    try:
+        with span("llm_call", backend=llm_clients.backend, bytes_sent=bytes_sent) as attrs:
+            raw_result = await analysis_policy.call_async(lambda: structured_llm.ainvoke([message]), attrs)
+    except Exception:
+        observe_llm_failure("analyzer", time.perf_counter() - start, bytes_sent)
+        raise
+    record_llm_call(bytes_sent, time.perf_counter() - start, raw_result)
+
+    return cast(LLMPantryResponse, raw_result)
+
+def resolve_pantry_inventory(analysis: LLMPantryResponse) -> PantryInventory:
+    """Attach item UUIDs to the model's answer, resolving every name in one registry call"""
+    with span("resolve_ids"):
+        ids = item_registry.resolve_many(
+            [i.name for i in analysis.items_added]
+            + [i.name for i in analysis.current_full_inventory]
+            + analysis.items_removed
+        )
+        return PantryInventory(
+            items_added=[map_to_pantry_item(i, ids) for i in analysis.items_added],
+            items_removed=[map_removed_string_to_item(name, ids) for name in analysis.items_removed],
+            current_full_inventory=[map_to_pantry_item(i, ids) for i in analysis.current_full_inventory]
+        )
+
+def infer_pantry_changes(before_bytes: bytes, after_bytes: bytes, changed_blocks=None) -> PantryInventory:
+    """
+    Work out what changed between the before and after pantry images.
+    Identical image pairs are answered from the analysis cache instead of Gemini AI.
+    Does not touch the pantry state, see save_pantry_inventory().
+    
+    Args:
+        before_bytes: Image bytes of pantry before changes
+        after_bytes: Image bytes of pantry after changes
+        changed_blocks: Blocks the change filter found changed, used for close-ups
+        
+    Returns:
+        PantryInventory object with added, removed, and current items
+    """
+    with span("cache_lookup") as attrs:
+        cache_key = AnalysisCache.make_key(before_bytes, after_bytes, PROMPT_VERSION, MODEL_NAME)
+        cached = analysis_cache.get(cache_key)
+        attrs["hit"] = cached is not None
+    if cached is not None:
+        analysis = LLMPantryResponse.model_validate_json(cached)
+    else:
+        def request_and_cache():
+            analysis = request_pantry_analysis(before_bytes, after_bytes, changed_blocks)
+            analysis_cache.put(cache_key, analysis.model_dump_json())
+            return analysis
+        with span("single_flight") as attrs:
+            analysis, attrs["shared"] = analysis_flight.do(cache_key, request_and_cache)
+
+    return resolve_pantry_inventory(analysis)
+
+async def infer_pantry_changes_async(before_bytes: bytes, after_bytes: bytes, changed_blocks=None) -> PantryInventory:
+    """Async version of infer_pantry_changes()"""
+    with span("cache_lookup") as attrs:
+        cache_key = await asyncio.to_thread(AnalysisCache.make_key, before_bytes, after_bytes, PROMPT_VERSION, MODEL_NAME)
+        cached = analysis_cache.get(cache_key)
+        attrs["hit"] = cached is not None
+    if cached is not None:
+        analysis = LLMPantryResponse.model_validate_json(cached)
+    else:
+        async def request_and_cache():
+            analysis = await request_pantry_analysis_async(before_bytes, after_bytes, changed_blocks)
+            analysis_cache.put(cache_key, analysis.model_dump_json())
+            return analysis
+        with span("single_flight") as attrs:
+            analysis, attrs["shared"] = await analysis_flight.do_async(cache_key, request_and_cache)
+
+    # The item registry lookup takes the shared state's lock, keep it off the event loop
+    return await asyncio.to_thread(resolve_pantry_inventory, analysis)
+
+def save_pantry_inventory(inventory: PantryInventory, device_id: str = DEFAULT_DEVICE_ID):
+    """
+    Save an analysis result to the pantry store; the item registry is kept as-is.
+    Items from a named camera are tagged with its device_id, so its next analysis
+    only replaces what that camera can see.
+    """
+    tag = {} if device_id == DEFAULT_DEVICE_ID else {"device_id": device_id}
+    with span("save"):
+        pantry_store.replace_inventory(
+            items_added=[{**i.dict(), **tag} for i in inventory.items_added],
+            items_removed=[i.name for i in inventory.items_removed],
+            full_inventory=[{**i.dict(), **tag} for i in inventory.current_full_inventory],
+            device_id=device_id
+        )
+
+def analyze_pantry_images(before_bytes: bytes, after_bytes: bytes) -> PantryInventory:
+    """
+    Analyze before and after pantry images using Gemini AI and save the result.
     
-    with open(PANTRY_STATE_FILE, "w") as f:
-        json.dump(pantry_state_payload, f, indent=4)
+    Args:
+        before_bytes: Image bytes of pantry before changes
+        after_bytes: Image bytes of pantry after changes
+        
+    Returns:
+        PantryInventory object with added, removed, and current items
+    """
+    response = infer_pantry_changes(before_bytes, after_bytes, change_filter.locate(before_bytes, after_bytes))
+    save_pantry_inventory(response)
+    return response
 
+async def analyze_pantry_images_async(before_bytes: bytes, after_bytes: bytes) -> PantryInventory:
+    """Async version of analyze_pantry_images()"""
+    changed_blocks = await asyncio.to_thread(change_filter.locate, before_bytes, after_bytes)
+    response = await infer_pantry_changes_async(before_bytes, after_bytes, changed_blocks)
+    await asyncio.to_thread(save_pantry_inventory, response)
     return response
+# endregion
@@ -0,0 +1,169 @@
+import os
+import json
+import threading
+
+class PantryJournal:
+    """
+    Append-only log of pantry mutations, one JSON record per line.
+
+    append() only writes into the file buffer; sync() pushes everything written
+    since the last call to disk with a single fsync, so a burst of writes costs
+    one fsync. Every record carries a sequence number so replay can skip records
+    that are already contained in the snapshot.
+
+    With `shared`, several processes append to the same log (the caller
+    serializes them with a file lock): appends are flushed straight away so
+    the others can read them with read_new(), and a log another process has
+    rotated is reopened.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.old_path = path + ".old"
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._file = self._open()
+        self._pending = False
+        self._tail = None  # shared: reader positioned after the last record this process has seen
+        self._torn = False  # shared: the log ends in a line torn by a process that crashed mid-append
+
+    def _open(self):
+        f = open(self.path, "a")
+        if f.tell() and not self._ends_with_newline():
+            # A torn line from a crash mid-append; start the next record on a line of its own
+            f.write("\n")
+        return f
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            # A shared log also grows with other processes' appends
+            return os.fstat(self._file.fileno()).st_size if self.shared else self._file.tell()
+
+    def append(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._torn:
+                line = "\n" + line
+                self._torn = False
+            self._file.write(line)
+            self._pending = True
+            if self.shared:
+                self._file.flush()
+                self._tail.seek(0, os.SEEK_END)
+
+    def sync(self) -> bool:
+        """fsync records appended since the last sync. Returns False if there were none."""
+        with self._lock:
+            if not self._pending:
+                return False
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = False
+            return True
+
+    def rotate(self):
+        """
+        Move the current log aside and start a new one. The caller writes a
+        snapshot covering the old log and then calls drop_rotated().
+        """
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(self.old_path):
+                # A previous compaction failed before its snapshot landed; keep both logs
+                with open(self.path, "r") as src, open(self.old_path, "a") as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self._file = self._open()
+            self._pending = False
+            if self.shared:
+                self._follow()
+
+    def drop_rotated(self):
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+
+    def records(self):
+        """Yield every record from the rotated and current log, oldest first."""
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn line from a crash mid-append
+                        print(f"Warning: Skipping unreadable record in {path}")
+
+    # region shared
+    def _follow(self):
+        """Read on from the current end of the log. Caller holds self._lock."""
+        if self._tail is not None:
+            self._tail.close()
+        self._tail = open(self.path, "rb")
+        self._tail.seek(0, os.SEEK_END)
+
+    def follow(self):
+        """Start reading records appended by other processes from the current end of the log"""
+        with self._lock:
+            self._follow()
+
+    def rotated(self) -> bool:
+        """Whether another process has rotated the log since this one last followed it"""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._tail.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def has_new(self) -> bool:
+        """Cheap check, without the file lock, for records this process hasn't read yet"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        with self._lock:
+            return stat.st_ino != os.fstat(self._tail.fileno()).st_ino or stat.st_size != self._tail.tell()
+
+    def read_new(self) -> list:
+        """Records other processes appended since the last call, oldest first"""
+        with self._lock:
+            data = self._tail.read()
+            if data:
+                self._torn = not data.endswith(b"\n")
+        records = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping unreadable record in {self.path}")
+        return records
+
+    def reopen(self):
+        """Append to and follow the log now at `path`, after another process rotated it"""
+        with self._lock:
+            self._file.close()
+            self._file = self._open()
+            self._follow()
+    # endregion
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if self._tail is not None:
+                self._tail.close()
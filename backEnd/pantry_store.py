@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple
+from config import (PANTRY_STATE_FILE, PANTRY_JOURNAL_FILE, PANTRY_FLUSH_INTERVAL, PANTRY_COMPACT_BYTES,
+                    PANTRY_CHANGE_LOG_SIZE, DEFAULT_DEVICE_ID, SHARED_DIR)
+from pantry_journal import PantryJournal
+from item_registry import ItemRegistry
+from inventory_changes import InventoryChangeLog, group_by_id, grouped_diff
+from metrics import persist_seconds
+
+STATE_PATH = os.path.join(os.path.dirname(__file__), PANTRY_STATE_FILE)
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), PANTRY_JOURNAL_FILE)
+LOCK_PATH = os.path.join(SHARED_DIR, "pantry.lock") if SHARED_DIR else None
+
+def empty_pantry_state() -> dict:
+    return {
+        "item_registry": {},
+        "items_added": [],
+        "items_removed": [],
+        "current_full_inventory": []
+    }
+
+def apply_record(state: dict, record: dict):
+    """Apply one journal record to a pantry state dict in place."""
+    op = record["op"]
+    if op == "add":
+        state["current_full_inventory"].append(record["item"])
+    elif op == "remove":
+        state["current_full_inventory"] = [
+            item for item in state["current_full_inventory"] if item.get("id") != record["id"]
+        ]
+    elif op == "replace":
+        state["items_added"] = record["items_added"]
+        state["items_removed"] = record["items_removed"]
+        # A camera only sees its own shelf: keep the items another device reported
+        device_id = record.get("device_id", DEFAULT_DEVICE_ID)
+        kept = [item for item in state["current_full_inventory"]
+                if item.get("device_id", DEFAULT_DEVICE_ID) != device_id]
+        state["current_full_inventory"] = kept + record["current_full_inventory"]
+    elif op == "register":
+        state["item_registry"].update(record["entries"])
+    else:
+        raise ValueError(f"Unknown journal op: {op}")
+
+class PantryStore:
+    """
+    Process-wide, authoritative copy of the pantry state.
+
+    Every read is served from memory. Each mutation is appended to the journal
+    as a single record, and a background writer fsyncs the journal every
+    `flush_interval` seconds. Once the journal grows past `compact_bytes` the
+    state is written out as a snapshot and the journal starts over.
+    On startup the snapshot is loaded and the journal replayed on top of it.
+
+    Every record carries its journal sequence number and the pantry version
+    after it; the version only moves on when the inventory itself changed, so
+    item registrations leave ETags and delta reads alone. Together with
+    `epoch`, which is new for every process, the version identifies an
+    inventory exactly, and recent inventory changes are kept by version for
+    delta reads.
+
+    With `lock_path`, worker processes share the snapshot and journal. Writes
+    are serialized with an fcntl lock on that file, and each worker replays the
+    records the others appended before writing, before reading and on every
+    writer tick, so versions stay unique and every worker serves the same
+    inventory. A worker that finds the journal compacted by another reloads the
+    snapshot. The epoch is then shared by the workers running together, and
+    new when the first of them starts.
+    """
+
+    def __init__(self, path: str, journal_path: str, flush_interval: float, compact_bytes: int,
+                 lock_path: Optional[str] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        if lock_path:
+            os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+            self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file_locked = False
+        self._syncing = False
+        self._stop = threading.Event()
+        self._writer = None
+        self._listeners = []
+
+        with self._lock, self._file_lock():
+            self._state = self._load()
+            self._seq, self._version = self._positions(self._state)
+            self.registry = ItemRegistry(self._state["item_registry"], self._lock, self._register)
+            self.journal = PantryJournal(journal_path, shared=lock_path is not None)
+
+            needs_compaction = os.path.exists(self.journal.old_path)
+            self._seq, self._version, replayed = self._replay(self._state, self._seq, self._version)
+            if replayed:
+                print(f"Replayed {replayed} pantry journal records")
+            if self._lock_fd is not None:
+                self.journal.follow()
+
+            self.epoch = self._shared_epoch(lock_path) if lock_path else uuid.uuid4().hex[:8]
+            self.changes = InventoryChangeLog(PANTRY_CHANGE_LOG_SIZE, self._version)
+            # Inventory entries by id, so a mutation's change is found without diffing the inventory.
+            # Lists are replaced, never modified, as the change log keeps references to them.
+            self._by_id = group_by_id(self._state["current_full_inventory"])
+            if needs_compaction:
+                self.compact()
+
+    def _load(self) -> dict:
+        state = empty_pantry_state()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    state.update(json.load(f))
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Warning: Could not load {self.path}, starting empty: {e}")
+        return state
+
+    @staticmethod
+    def _positions(state: dict) -> Tuple[int, int]:
+        """Pop the (journal seq, version) a snapshot was taken at"""
+        seq = state.pop("journal_seq", 0)
+        return seq, state.pop("version", seq)  # snapshots without a version used the seq
+
+    @staticmethod
+    def _record_version(record: dict, version: int) -> int:
+        # Records journalled before versions were stored counted every non-register op
+        return record.get("version", version + (record["op"] != "register"))
+
+    def _replay(self, state: dict, seq: int, version: int) -> Tuple[int, int, int]:
+        """Apply the journal records after `seq` to `state`; (last seq, version, records applied)"""
+        replayed = 0
+        for record in self.journal.records():
+            if record.get("seq", 0) <= seq:
+                continue
+            apply_record(state, record)
+            seq = record["seq"]
+            version = self._record_version(record, version)
+            replayed += 1
+        return seq, version, replayed
+
+    def _commit(self, record: dict):
+        """Apply a mutation and journal it. Caller must be inside _writing()."""
+        record["seq"] = self._seq + 1
+        apply_record(self._state, record)
+        changed = self._changed_ids(record)
+        record["version"] = self._version + 1 if changed else self._version
+        self.journal.append(record)
+        self._applied(record, changed)
+
+    def _applied(self, record: dict, changed: Optional[dict]):
+        """Record the change an applied record made and tell the listeners if the inventory changed"""
+        self._seq = record["seq"]
+        version = self._record_version(record, self._version)
+        if version == self._version:
+            return
+        self._version = version
+        self.changes.record(version, changed or {})
+        self._notify(record)
+
+    def _notify(self, record: dict):
+        for callback in self._listeners:
+            try:
+                callback(record)
+            except Exception as e:
+                print(f"Error in pantry store listener: {e}")
+
+    def _changed_ids(self, record: dict) -> Optional[dict]:
+        """Update the id index for an applied record and return its inventory change"""
+        op = record["op"]
+        if op == "add":
+            item_id = record["item"].get("id")
+            self._by_id[item_id] = self._by_id.get(item_id, []) + [record["item"]]
+            return {item_id: self._by_id[item_id]}
+        if op == "remove":
+            self._by_id.pop(record["id"], None)
+            return {record["id"]: []}
+        if op == "replace":
+            old, self._by_id = self._by_id, group_by_id(self._state["current_full_inventory"])
+            return grouped_diff(old, self._by_id)
+        return None
+
+    # region worker processes
+    @contextmanager
+    def _file_lock(self, mode: int = fcntl.LOCK_EX):
+        """
+        Lock out other worker processes. Caller holds self._lock; a no-op in a
+        single process or when this process already holds the file lock.
+        """
+        if self._lock_fd is None or self._file_locked:
+            yield
+            return
+        fcntl.lockf(self._lock_fd, mode)
+        self._file_locked = True
+        try:
+            yield
+        finally:
+            self._file_locked = False
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, self._file_lock():
+            self._sync()
+            yield
+
+    def _shared_epoch(self, lock_path: str) -> str:
+        """
+        Epoch of the workers running together: every live worker holds a shared
+        flock on the members file, so one that gets it exclusively is the first.
+        Caller holds the file lock.
+        """
+        self._members = open(lock_path + ".members", "a")
+        try:
+            fcntl.flock(self._members, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            epoch = uuid.uuid4().hex[:8]
+            os.pwrite(self._lock_fd, epoch.encode(), 0)
+        except BlockingIOError:
+            epoch = os.pread(self._lock_fd, 8, 0).decode()
+        fcntl.flock(self._members, fcntl.LOCK_SH)
+        return epoch
+
+    def _sync(self):
+        """Apply the records other workers journalled since this one last looked. Caller holds both locks."""
+        if self._lock_fd is None or self._syncing:
+            return
+        self._syncing = True
+        try:
+            if self.journal.rotated():
+                self._reload()
+                return
+            for record in self.journal.read_new():
+                if record.get("seq", 0) > self._seq:
+                    apply_record(self._state, record)
+                    self._applied(record, self._changed_ids(record))
+        finally:
+            self._syncing = False
+
+    def _reload(self):
+        """Start over from the snapshot another worker compacted the journal into"""
+        self.journal.reopen()
+        state = self._load()
+        seq, version, _ = self._replay(state, *self._positions(state))
+        if seq <= self._seq:
+            return
+        # The registry keeps a reference to the entries dict
+        registry = self._state["item_registry"]
+        registry.update(state["item_registry"])
+        state["item_registry"] = registry
+        self._state = state
+        old, self._by_id = self._by_id, group_by_id(state["current_full_inventory"])
+        self._seq = seq
+        if version > self._version:
+            # One change covering everything since this worker's last version
+            self._version = version
+            self.changes.record(version, grouped_diff(old, self._by_id))
+            self._notify({"op": "reload", "seq": seq, "version": version})
+
+    def refresh(self):
+        """Pick up changes other worker processes made."""
+        if self._lock_fd is None or not self.journal.has_new():
+            return
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+    # endregion
+
+    def subscribe(self, callback):
+        """
+        Call `callback(record)` after every mutation that changed the inventory;
+        record["version"] is the version it produced. Runs under the store lock, keep it quick.
+        """
+        self._listeners.append(callback)
+
+    # region reads
+    @property
+    def version(self) -> int:
+        self.refresh()
+        return self._version
+
+    def get_inventory(self) -> list:
+        self.refresh()
+        with self._lock:
+            return [dict(item) for item in self._state["current_full_inventory"]]
+
+    def snapshot(self) -> Tuple[int, list]:
+        """(version, inventory) read together."""
+        self.refresh()
+        with self._lock:
+            return self._version, self.get_inventory()
+
+    def changes_since(self, since: int) -> Tuple[int, Optional[dict]]:
+        """(version, delta since `since`); the delta is None if the change log no longer covers it."""
+        self.refresh()
+        with self._lock:
+            return self._version, self.changes.changes_since(since, self._version)
+    # endregion
+
+    # region writes
+    def _register(self, entries: dict):
+        with self._writing():
+            # Another worker may have registered some of these names meanwhile; its ids win
+            entries = {key: item_id for key, item_id in entries.items() if key not in self._state["item_registry"]}
+            if entries:
+                self._commit({"op": "register", "entries": entries})
+
+    def add_item(self, item: dict) -> dict:
+        with self._writing():
+            self._commit({"op": "add", "item": item})
+        return item
+
+    def remove_item(self, item_id: str) -> bool:
+        """Remove every inventory entry with this id. Returns False if none matched."""
+        with self._writing():
+            if item_id not in self._by_id:
+                return False
+            self._commit({"op": "remove", "id": item_id})
+        return True
+
+    def replace_inventory(self, items_added: list, items_removed: list, full_inventory: list,
+                          device_id: str = DEFAULT_DEVICE_ID):
+        """
+        Apply the result of a pantry analysis, keeping the item registry.
+        Only the inventory seen by `device_id` is replaced.
+        """
+        record = {
+            "op": "replace",
+            "items_added": items_added,
+            "items_removed": items_removed,
+            "current_full_inventory": full_inventory
+        }
+        if device_id != DEFAULT_DEVICE_ID:
+            record["device_id"] = device_id
+        with self._writing():
+            self._commit(record)
+    # endregion
+
+    # region persistence
+    def flush(self):
+        """Make every journalled mutation durable, compacting if the journal is large."""
+        try:
+            start = time.perf_counter()
+            if self.journal.sync():
+                persist_seconds.observe(time.perf_counter() - start, "pantry_journal")
+            if self.journal.size >= self.compact_bytes:
+                self.compact()
+        except IOError as e:
+            print(f"Warning: Could not save pantry state: {e}")
+
+    def compact(self):
+        """Write the full state as a snapshot and discard the journal it covers."""
+        start = time.perf_counter()
+        with self._lock, self._file_lock():
+            self._sync()
+            self.journal.rotate()
+            payload = json.dumps(dict(self._state, journal_seq=self._seq, version=self._version), indent=4)
+            if self._lock_fd is not None:
+                # Other workers reload the snapshot once they see the journal rotated, it must be there by then
+                self._write_snapshot(payload)
+        if self._lock_fd is None:
+            self._write_snapshot(payload)
+        persist_seconds.observe(time.perf_counter() - start, "pantry_snapshot")
+
+    def _write_snapshot(self, payload: str):
+        # Write to a temp file and rename so a crash never leaves a half-written snapshot
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.journal.drop_rotated()
+
+    def _writer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.refresh()
+            self.flush()
+
+    def start(self):
+        """Start the background writer. Safe to call more than once."""
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._writer_loop, name="pantry-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """Stop the background writer and leave a compacted snapshot on disk."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        try:
+            if self.journal.size or os.path.exists(self.journal.old_path):
+                self.compact()
+        except IOError as e:
+            print(f"Warning: Could not save pantry state: {e}")
+        self.journal.close()
+    # endregion
+
+pantry_store = PantryStore(STATE_PATH, JOURNAL_PATH, PANTRY_FLUSH_INTERVAL, PANTRY_COMPACT_BYTES, LOCK_PATH)
+item_registry = pantry_store.registry
@@ -0,0 +1,60 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+class RecipeCache:
+    """
+    LRU cache of generated recipe JSON with a time-to-live.
+
+    Keys are built from the case-folded, sorted ingredient names and allergens,
+    so the same pantry always maps to the same entry regardless of order.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, recipes_json)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(ingredients: Iterable[str], allergens: Iterable[str], model_name: str) -> tuple:
+        return (
+            tuple(sorted({name.strip().casefold() for name in ingredients if name.strip()})),
+            tuple(sorted({name.strip().casefold() for name in allergens if name.strip()})),
+            model_name,
+        )
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: tuple, recipes_json: str):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, recipes_json)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self.stats["invalidations"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                **self.stats,
+            }
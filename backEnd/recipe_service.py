@@ -1,13 +1,18 @@
 # recipe_service.py
 import os
+import re
 import json
-from typing import List, Dict
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
+from llm_clients import llm_clients
+from llm_policy import recipe_policy
+from metrics import observe_llm_call, observe_llm_failure
+
 os.environ["GOOGLE_API_KEY"] = os.environ.get("GEMINI_API_KEY", "")
 
 # --- Pydantic Models for Structured Output ---
@@ -24,6 +29,65 @@ class RecipeList(BaseModel):
     """Represents a list of generated recipes."""
     recipes: List[Recipe] = Field(description="A list of 5 recipe suggestions.")
 
+# --- Prompt and parser, built once and shared by every request ---
+RECIPE_TEMPERATURE = 0.7
+
+# Set up the parser for the structured output
+parser = PydanticOutputParser(pydantic_object=RecipeList)
+
+# Define the prompt template, with the format instructions rendered once
+prompt_template = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are an expert culinary assistant. "
+            "Your task is to suggest 5 unique and creative recipe names along with their key ingredients. "
+            "Prioritize using the provided pantry ingredients. "
+            "Strictly avoid any ingredients that the user is allergic to. "
+            "Ensure the recipes are actionable with the available pantry items, but you can suggest a few common additions. "
+            "Output the recipes in a JSON format that matches the following schema:\n{format_instructions}"
+        ),
+        (
+            "human",
+            "Pantry ingredients: {pantry_items}\n"
+            "Allergies to avoid: {allergens}\n"
+            "Please provide 5 recipe suggestions."
+        ),
+    ]
+).partial(format_instructions=parser.get_format_instructions())
+
+def get_recipe_chain(llm_model_name: str):
+    """The prompt | llm | parser chain for a model, built on first use."""
+    # Note: Model names like "gemini-3-flash-preview" might require specific access or updates.
+    # Consider "gemini-1.5-flash" or "gemini-2.5-flash" if issues arise.
+    return llm_clients.get(
+        ("recipes", llm_model_name, RECIPE_TEMPERATURE),
+        lambda: prompt_template | llm_clients.chat_model(llm_model_name, RECIPE_TEMPERATURE, RecipeList) | parser
+    )
+
+def build_recipe_input(pantry_ingredient_names: List[str], allergies: List[str]) -> Optional[Dict[str, str]]:
+    """Chain input for the recipe prompt, or None if there are no usable ingredients."""
+    # Ensure GOOGLE_API_KEY is set
+    if "GOOGLE_API_KEY" not in os.environ:
+        raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it before running the script.")
+
+    # Clean and filter pantry ingredients (e.g., remove empty strings)
+    cleaned_pantry_ingredients = [item.strip() for item in pantry_ingredient_names if item.strip()]
+
+    if not cleaned_pantry_ingredients:
+        print("No usable ingredients provided after cleaning. Cannot generate recipes.")
+        return None
+
+    # Prepare input for the chain
+    return {
+        "pantry_items": ", ".join(cleaned_pantry_ingredients), # Use the cleaned list of names
+        "allergens": ", ".join(allergies) if allergies else "None",
+    }
+
+def prompt_bytes(input_data: Dict[str, str]) -> int:
+    """Size of the rendered recipe prompt, for the LLM payload metrics"""
+    return len(prompt_template.format(**input_data).encode())
+
 def generate_recipes(
     pantry_ingredient_names: List[str], # Changed to accept a list of names directly
     allergies: List[str],
@@ -40,62 +104,179 @@ def generate_recipes(
     Returns:
         str: A JSON string containing the generated recipes. Returns an empty recipe list JSON string on error.
     """
-    # Ensure GOOGLE_API_KEY is set
-    if "GOOGLE_API_KEY" not in os.environ:
-        raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it before running the script.")
-
-    # Clean and filter pantry ingredients (e.g., remove empty strings)
-    cleaned_pantry_ingredients = [item.strip() for item in pantry_ingredient_names if item.strip()]
-
-    if not cleaned_pantry_ingredients:
-        print("No usable ingredients provided after cleaning. Cannot generate recipes.")
+    input_data = build_recipe_input(pantry_ingredient_names, allergies)
+    if input_data is None:
         return json.dumps({"recipes": []}) # Return empty JSON array for recipes
 
-    # Initialize the LLM
-    # Note: Model names like "gemini-3-flash-preview" might require specific access or updates.
-    # Consider "gemini-1.5-flash" or "gemini-2.5-flash" if issues arise.
-    llm = ChatGoogleGenerativeAI(model=llm_model_name, temperature=0.7)
-
-    # Set up the parser for the structured output
-    parser = PydanticOutputParser(pydantic_object=RecipeList)
-
-    # Define the prompt template
-    prompt_template = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "You are an expert culinary assistant. "
-                "Your task is to suggest 5 unique and creative recipe names along with their key ingredients. "
-                "Prioritize using the provided pantry ingredients. "
-                "Strictly avoid any ingredients that the user is allergic to. "
-                "Ensure the recipes are actionable with the available pantry items, but you can suggest a few common additions. "
-                "Output the recipes in a JSON format that matches the following schema:\n{format_instructions}"
-            ),
-            (
-                "human",
-                "Pantry ingredients: {pantry_items}\n"
-                "Allergies to avoid: {allergens}\n"
-                "Please provide 5 recipe suggestions."
-            ),
-        ]
-    )
-
-    # Create the LangChain chain
-    chain = prompt_template | llm | parser
-
-    # Prepare input for the chain
-    input_data = {
-        "pantry_items": ", ".join(cleaned_pantry_ingredients), # Use the cleaned list of names
-        "allergens": ", ".join(allergies) if allergies else "None",
-        "format_instructions": parser.get_format_instructions(),
-    }
+    # Reuse the chain (and its HTTP connections) built by earlier calls
+    chain = get_recipe_chain(llm_model_name)
 
+    start = time.perf_counter()
     try:
-        # Invoke the chain
-        response = chain.invoke(input_data)
+        # Invoke the chain, within the deadline and with retries
+        response = recipe_policy.call(lambda: chain.invoke(input_data))
         # Return the Pydantic model dumped to a JSON string
-        return response.model_dump_json(indent=2)
+        recipes_json = response.model_dump_json(indent=2)
+        observe_llm_call("recipes", time.perf_counter() - start, prompt_bytes(input_data), len(recipes_json))
+        return recipes_json
     except Exception as e:
+        observe_llm_failure("recipes", time.perf_counter() - start, prompt_bytes(input_data))
         print(f"An error occurred during recipe generation: {e}")
         # Return an empty recipes list JSON string in case of error
-        return json.dumps({"recipes": [], "error": str(e)})
\ No newline at end of file
+        return json.dumps({"recipes": [], "error": str(e)})
+
+async def generate_recipes_async(
+    pantry_ingredient_names: List[str],
+    allergies: List[str],
+    llm_model_name: str = "gemini-3-flash-preview"
+) -> str:
+    """Async version of generate_recipes(); the Gemini call is awaited instead of blocking a thread."""
+    input_data = build_recipe_input(pantry_ingredient_names, allergies)
+    if input_data is None:
+        return json.dumps({"recipes": []})
+
+    chain = get_recipe_chain(llm_model_name)
+
+    start = time.perf_counter()
+    try:
+        response = await recipe_policy.call_async(lambda: chain.ainvoke(input_data))
+        recipes_json = response.model_dump_json(indent=2)
+        observe_llm_call("recipes", time.perf_counter() - start, prompt_bytes(input_data), len(recipes_json))
+        return recipes_json
+    except Exception as e:
+        observe_llm_failure("recipes", time.perf_counter() - start, prompt_bytes(input_data))
+        print(f"An error occurred during recipe generation: {e}")
+        return json.dumps({"recipes": [], "error": str(e)})
+
+# --- Streaming ---
+class RecipeStreamParser:
+    """
+    Pulls complete recipe objects out of the model's JSON output while it is still streaming.
+
+    Text is fed in as it arrives; every time an object inside the "recipes"
+    array is closed it is parsed and returned, without waiting for the rest.
+    """
+    _ARRAY_START = re.compile(r'"recipes"\s*:\s*\[')
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._obj_start = 0
+
+    def feed(self, text: str) -> List[Recipe]:
+        self._buf += text
+        recipes = []
+        if not self._in_array:
+            match = self._ARRAY_START.search(self._buf)
+            if not match:
+                return recipes
+            self._in_array = True
+            self._pos = match.end()
+
+        while self._pos < len(self._buf) and not self._done:
+            ch = self._buf[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = self._pos
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    recipes.append(Recipe.model_validate_json(self._buf[self._obj_start:self._pos + 1]))
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+            self._pos += 1
+        return recipes
+
+def get_recipe_stream_chain(llm_model_name: str):
+    """prompt | llm without the parser, so the raw tokens can be streamed."""
+    return llm_clients.get(
+        ("recipes-stream", llm_model_name, RECIPE_TEMPERATURE),
+        lambda: prompt_template | llm_clients.chat_model(llm_model_name, RECIPE_TEMPERATURE, RecipeList)
+    )
+
+def stream_recipes(
+    pantry_ingredient_names: List[str],
+    allergies: List[str],
+    llm_model_name: str = "gemini-3-flash-preview"
+) -> Iterator[Recipe]:
+    """
+    Like generate_recipes(), but yields each Recipe as soon as the model has finished writing it.
+    Errors from the model are raised to the caller, as is CircuitOpenError while the circuit is
+    open and DeadlineExceededError when the first chunk takes too long.
+    """
+    input_data = build_recipe_input(pantry_ingredient_names, allergies)
+    if input_data is None:
+        return
+
+    chain = get_recipe_stream_chain(llm_model_name)
+
+    start = time.perf_counter()
+    first_recipe_at = None
+    count = 0
+    response_bytes = 0
+    stream_parser = RecipeStreamParser()
+    try:
+        for chunk in recipe_policy.stream(lambda: chain.stream(input_data)):
+            response_bytes += len(chunk.text.encode())
+            for recipe in stream_parser.feed(chunk.text):
+                if first_recipe_at is None:
+                    first_recipe_at = time.perf_counter() - start
+                count += 1
+                yield recipe
+    except Exception:
+        observe_llm_failure("recipes", time.perf_counter() - start, prompt_bytes(input_data))
+        raise
+
+    total = time.perf_counter() - start
+    observe_llm_call("recipes", total, prompt_bytes(input_data), response_bytes)
+    first = f"{first_recipe_at:.2f}s" if first_recipe_at is not None else "n/a"
+    print(f"Streamed {count} recipes: first after {first}, all after {total:.2f}s")
+
+async def astream_recipes(
+    pantry_ingredient_names: List[str],
+    allergies: List[str],
+    llm_model_name: str = "gemini-3-flash-preview"
+) -> AsyncIterator[Recipe]:
+    """Async version of stream_recipes(); tokens are awaited instead of blocking a thread."""
+    input_data = build_recipe_input(pantry_ingredient_names, allergies)
+    if input_data is None:
+        return
+
+    chain = get_recipe_stream_chain(llm_model_name)
+
+    start = time.perf_counter()
+    first_recipe_at = None
+    count = 0
+    response_bytes = 0
+    stream_parser = RecipeStreamParser()
+    try:
+        async for chunk in recipe_policy.astream(lambda: chain.astream(input_data)):
+            response_bytes += len(chunk.text.encode())
+            for recipe in stream_parser.feed(chunk.text):
+                if first_recipe_at is None:
+                    first_recipe_at = time.perf_counter() - start
+                count += 1
+                yield recipe
+    except Exception:
+        observe_llm_failure("recipes", time.perf_counter() - start, prompt_bytes(input_data))
+        raise
+
+    total = time.perf_counter() - start
+    observe_llm_call("recipes", total, prompt_bytes(input_data), response_bytes)
+    first = f"{first_recipe_at:.2f}s" if first_recipe_at is not None else "n/a"
+    print(f"Streamed {count} recipes: first after {first}, all after {total:.2f}s")
@@ -0,0 +1,228 @@
+import os
+import mmap
+import time
+import asyncio
+import fcntl
+import struct
+import threading
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+FILE_MAGIC = b"PANTRYFS"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<8sIII")  # magic, version, slots, bytes per frame
+SLOT_HEADER = struct.Struct("<QIId64s")  # generation, frame length, unused, timestamp, device id
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 128
+
+class SlotsFullError(Exception):
+    """Raised when a new device needs a slot and every slot is taken."""
+
+class FrameTooLargeError(ValueError):
+    """Raised when a frame does not fit in a slot."""
+
+class SharedFrameStore:
+    """
+    Latest live frame of every device, in a memory-mapped file that all
+    worker processes map, so a frame posted to one worker is seen by viewers
+    connected to any other.
+
+    Each device has a slot guarded by a seqlock: the writer makes the slot's
+    generation odd, copies the frame in and makes it even again. Readers
+    never lock: they copy the frame and retry if the generation was odd or
+    changed meanwhile. Writers to the same slot are serialized with a
+    per-slot fcntl record lock (and a thread lock within a process); slots
+    are claimed for new devices under a lock on the file header.
+    """
+
+    def __init__(self, path: str, slots: int, frame_bytes: int):
+        self.path = path
+        self.slots = slots
+        self.frame_bytes = frame_bytes
+        self.slot_size = SLOT_HEADER_SIZE + frame_bytes
+        total = HEADER_SIZE + slots * self.slot_size
+        header = FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, slots, frame_bytes)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            # The first worker to start lays out the file, the others find it ready
+            if os.pread(self._fd, FILE_HEADER.size, 0) != header or os.fstat(self._fd).st_size != total:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, total)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        self._map = mmap.mmap(self._fd, total)
+
+        self._slot_of: Dict[str, int] = {}
+        self._write_locks = [threading.Lock() for _ in range(slots)]
+        self._lock = threading.Lock()
+        self.stats = {"writes": 0, "reads": 0, "read_retries": 0}
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self.slot_size
+
+    def _slot_device(self, slot: int) -> str:
+        return SLOT_HEADER.unpack_from(self._map, self._offset(slot))[4].rstrip(b"\0").decode("utf-8", "replace")
+
+    def has(self, device_id: str) -> bool:
+        """Whether any worker has claimed a slot for the device"""
+        return device_id in self._slot_of or any(self._slot_device(i) == device_id for i in range(self.slots))
+
+    def slot(self, device_id: str) -> int:
+        """Slot of a device, claiming a free one the first time any worker sees it."""
+        slot = self._slot_of.get(device_id)
+        if slot is not None:
+            return slot
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+            try:
+                free = None
+                for i in range(self.slots):
+                    owner = self._slot_device(i)
+                    if owner == device_id:
+                        slot = i
+                        break
+                    if not owner and free is None:
+                        free = i
+                if slot is None:
+                    if free is None:
+                        raise SlotsFullError(f"All {self.slots} shared frame slots are taken")
+                    slot = free
+                    SLOT_HEADER.pack_into(self._map, self._offset(slot), 0, 0, 0, 0.0, device_id.encode()[:64])
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+            self._slot_of[device_id] = slot
+            return slot
+
+    def write(self, slot: int, frame: bytes):
+        if len(frame) > self.frame_bytes:
+            raise FrameTooLargeError(f"Frame of {len(frame)} bytes is larger than a shared slot ({self.frame_bytes} bytes)")
+        offset = self._offset(slot)
+        with self._write_locks[slot]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+            try:
+                generation, _, _, _, device = SLOT_HEADER.unpack_from(self._map, offset)
+                SLOT_HEADER.pack_into(self._map, offset, generation + 1, 0, 0, 0.0, device)  # odd: being written
+                data_start = offset + SLOT_HEADER_SIZE
+                self._map[data_start:data_start + len(frame)] = frame
+                SLOT_HEADER.pack_into(self._map, offset, generation + 2, len(frame), 0, time.time(), device)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
+        self.stats["writes"] += 1
+
+    def generation(self, slot: int) -> int:
+        """Number of frames written to the slot so far, read without locking"""
+        return struct.unpack_from("<Q", self._map, self._offset(slot))[0] // 2
+
+    def read(self, slot: int) -> Tuple[int, Optional[bytes]]:
+        """(frame number, copy of the latest frame), consistent even while another worker writes."""
+        offset = self._offset(slot)
+        data_start = offset + SLOT_HEADER_SIZE
+        retries = 0
+        while True:
+            generation, length, _, _, _ = SLOT_HEADER.unpack_from(self._map, offset)
+            if not generation & 1:
+                frame = self._map[data_start:data_start + length] if length else None
+                if struct.unpack_from("<Q", self._map, offset)[0] == generation:
+                    self.stats["reads"] += 1
+                    self.stats["read_retries"] += retries
+                    return generation // 2, frame
+            retries += 1
+            if retries % 8 == 0:
+                time.sleep(0)  # let the writer finish
+
+    def status(self) -> dict:
+        used = sum(1 for i in range(self.slots) if self._slot_device(i))
+        return {"file": self.path, "slots": self.slots, "slots_used": used, "frame_bytes": self.frame_bytes, **self.stats}
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+class SharedFrameBroadcaster:
+    """
+    FrameBroadcaster for one device backed by a SharedFrameStore slot.
+    Viewers poll the slot's generation every `poll` seconds, since a worker
+    can't wake threads in another process.
+    """
+
+    def __init__(self, store: SharedFrameStore, device_id: str, poll: float, keepalive: float = 5.0):
+        self.store = store
+        self.slot_index = store.slot(device_id)
+        self.poll = poll
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._cached = (0, None)  # (frame number, multipart chunk), shared by this worker's viewers
+        self.viewers = 0
+
+    def publish(self, frame: bytes):
+        self.store.write(self.slot_index, frame)
+
+    @property
+    def latest(self) -> Optional[bytes]:
+        return self.store.read(self.slot_index)[1]
+
+    @property
+    def seq(self) -> int:
+        return self.store.generation(self.slot_index)
+
+    def _chunk(self) -> Tuple[int, Optional[bytes]]:
+        with self._lock:
+            if self._cached[0] != self.seq or self._cached[1] is None:
+                seq, frame = self.store.read(self.slot_index)
+                chunk = b''.join((b'--frame\r\nContent-Type: image/jpeg\r\n\r\n', frame, b'\r\n')) if frame else None
+                self._cached = (seq, chunk)
+            return self._cached
+
+    def wait_for_frame(self, after_seq: int, timeout: float) -> Tuple[int, Optional[bytes]]:
+        """Newest (seq, chunk) once a frame newer than `after_seq` exists, or (after_seq, None) on timeout."""
+        deadline = time.monotonic() + timeout
+        while self.seq <= after_seq:
+            if time.monotonic() >= deadline:
+                return after_seq, None
+            time.sleep(self.poll)
+        return self._chunk()
+
+    async def wait_for_frame_async(self, after_seq: int, timeout: float) -> Tuple[int, Optional[bytes]]:
+        """Async version of wait_for_frame(), polling with asyncio.sleep()"""
+        deadline = time.monotonic() + timeout
+        while self.seq <= after_seq:
+            if time.monotonic() >= deadline:
+                return after_seq, None
+            await asyncio.sleep(self.poll)
+        return self._chunk()
+
+    async def stream_async(self) -> AsyncIterator[bytes]:
+        """Async version of stream()"""
+        with self._lock:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, chunk = await self.wait_for_frame_async(seq, self.keepalive)
+                if chunk is None:
+                    chunk = self._chunk()[1]
+                if chunk is not None:
+                    yield chunk
+        finally:
+            with self._lock:
+                self.viewers -= 1
+
+    def stream(self) -> Iterator[bytes]:
+        """Multipart chunks for one viewer, one per new frame."""
+        with self._lock:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, chunk = self.wait_for_frame(seq, self.keepalive)
+                if chunk is None:
+                    # Resend the last frame so a closed connection is noticed
+                    chunk = self._chunk()[1]
+                if chunk is not None:
+                    yield chunk
+        finally:
+            with self._lock:
+                self.viewers -= 1
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapses identical concurrent calls into one.
+
+    The first caller with a key runs the function; callers arriving with the
+    same key while it runs wait for it and get its result, or its exception.
+    Nothing is kept once the call returns, so the next caller runs it again
+    (and a failure is never handed to anyone who arrives after it).
+
+    do() is for threads and do_async() for the event loop; the two don't
+    share in-flight calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"calls": 0, "executed": 0, "collapsed": 0, "errors": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result of fn(), whether it came from another caller's call)"""
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self.stats["collapsed"] += 1
+            else:
+                call = self._calls[key] = _Call()
+                self.stats["executed"] += 1
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async version of do(); fn returns the awaitable to share"""
+        with self._lock:
+            self.stats["calls"] += 1
+            task = self._tasks.get(key)
+            shared = task is not None
+            if shared:
+                self.stats["collapsed"] += 1
+            else:
+                task = self._tasks[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda done: self._finished(key, done))
+                self.stats["executed"] += 1
+        # Shielded, so a caller that disconnects doesn't cancel the call for the others
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            if not task.cancelled() and task.exception() is not None:
+                self.stats["errors"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls) + len(self._tasks), **self.stats}
@@ -0,0 +1,40 @@
+"""
+LRU eviction of the analysis result cache at its byte cap, and persistence.
+"""
+from analysis_cache import AnalysisCache
+
+def entry(n: int) -> str:
+    return "x" * (100 - len(f"key{n}"))  # 100 bytes with its key
+
+def test_cache_hit_survives_byte_cap():
+    cache = AnalysisCache(max_bytes=300)
+    for n in range(3):
+        cache.put(f"key{n}", entry(n))
+    assert cache.get("key0") == entry(0)  # now the most recently used
+
+    cache.put("key3", entry(3))  # over the cap: the least recently used entry goes
+    assert cache.get("key1") is None
+    assert cache.get("key0") == entry(0)
+    status = cache.status()
+    assert status["bytes"] <= 300 and status["entries"] == 3
+    assert status["evictions"] == 1 and status["hits"] == 2 and status["misses"] == 1
+
+def test_cache_skips_entry_larger_than_cap():
+    cache = AnalysisCache(max_bytes=100)
+    cache.put("small", "a")
+    cache.put("large", "b" * 200)
+    assert cache.get("large") is None
+    assert cache.get("small") == "a"
+
+def test_cache_saved_and_loaded_in_lru_order(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = AnalysisCache(max_bytes=300, path=path)
+    for n in range(3):
+        cache.put(f"key{n}", entry(n))
+    cache.get("key0")
+    cache.save()
+
+    loaded = AnalysisCache(max_bytes=300, path=path)
+    loaded.put("key3", entry(3))
+    assert loaded.get("key1") is None
+    assert loaded.get("key0") == entry(0)
@@ -0,0 +1,181 @@
+"""
+AnalysisPool ordering, queue policies and the concurrency limit shared by
+the pools of several devices, with a stubbed analyze function.
+"""
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from analysis_queue import AnalysisPool, ConcurrencyLimit, QueueFullError
+
+class SlowAnalyze:
+    """Stands in for the model call: sleeps and tracks how many run at once"""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, before, after, changed_blocks=None):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return (before, after)
+
+class Recorded:
+    """Stands in for analyze_pantry_images: remembers every pair it was asked about"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, before, after, changed_blocks=None):
+        self.calls.append((before, after, changed_blocks))
+        return (before, after)
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+# region ordering
+def test_results_applied_in_capture_order():
+    # Earlier captures take longer, so their results finish last
+    def analyze(before, after, changed_blocks=None):
+        time.sleep(0.05 * (5 - before))
+        return after
+
+    applied = []
+    pool = AnalysisPool(analyze, applied.append, workers=5, max_queue=8, policy="reject")
+    pool.start()
+    for capture in range(5):
+        pool.submit(capture, capture + 1)
+    wait_for(lambda: len(applied) == 5)
+    pool.close()
+    assert applied == [1, 2, 3, 4, 5]
+
+def test_failed_job_does_not_hold_back_later_results():
+    def analyze(before, after, changed_blocks=None):
+        if before == 0:
+            time.sleep(0.1)
+            raise RuntimeError("model error")
+        return after
+
+    applied = []
+    pool = AnalysisPool(analyze, applied.append, workers=3, max_queue=8, policy="reject")
+    pool.start()
+    for capture in range(3):
+        pool.submit(capture, capture + 1)
+    wait_for(lambda: len(applied) == 2)
+    pool.close()
+    assert applied == [2, 3]
+    assert pool.stats["failed"] == 1 and pool.stats["completed"] == 2
+# endregion
+
+# region queue policies
+def test_reject_when_full():
+    pool = AnalysisPool(Recorded(), lambda result: None, workers=1, max_queue=1, policy="reject")
+    pool.submit("A", "B")
+    with pytest.raises(QueueFullError):
+        pool.submit("B", "C")
+    assert pool.stats["rejected"] == 1
+
+def test_drop_oldest_keeps_newest_pairs():
+    analyze = Recorded()
+    applied = []
+    pool = AnalysisPool(analyze, applied.append, workers=1, max_queue=2, policy="drop_oldest")
+    # Not started yet, so everything waits in the queue
+    for before, after in (("A", "B"), ("B", "C"), ("C", "D"), ("D", "E")):
+        pool.submit(before, after)
+    assert pool.stats["dropped"] == 2
+    pool.start()
+    wait_for(lambda: len(applied) == 2)
+    pool.close()
+    assert [call[:2] for call in analyze.calls] == [("C", "D"), ("D", "E")]
+    assert applied == [("C", "D"), ("D", "E")]
+
+def test_coalesce_when_full_merges_into_newest_pair():
+    analyze = Recorded()
+    applied = []
+    pool = AnalysisPool(analyze, applied.append, workers=1, max_queue=1, policy="coalesce")
+    first = np.zeros((6, 8), dtype=bool)
+    first[0, 0] = True
+    second = np.zeros((6, 8), dtype=bool)
+    second[5, 7] = True
+    assert pool.submit("A", "B", changed_blocks=first) == 0
+    assert pool.submit("B", "C", changed_blocks=second) is None
+    pool.start()
+    wait_for(lambda: len(applied) == 1)
+    pool.close()
+
+    # A->B + B->C is sent as A->C, with the changed blocks of both pairs
+    (before, after, changed_blocks), = analyze.calls
+    assert (before, after) == ("A", "C")
+    assert changed_blocks[0, 0] and changed_blocks[5, 7] and changed_blocks.sum() == 2
+    assert pool.stats["coalesced"] == 1 and pool.stats["submitted"] == 1
+
+def test_coalesce_window_stops_at_max_span():
+    analyze = Recorded()
+    applied = []
+    pool = AnalysisPool(analyze, applied.append, workers=1, max_queue=8, policy="reject",
+                        coalesce_window=10.0, max_span=3)
+    for capture in range(5):
+        pool.submit(capture, capture + 1)
+    pool.start()
+    wait_for(lambda: len(applied) == 2)
+    pool.close()
+    assert [call[:2] for call in analyze.calls] == [(0, 3), (3, 5)]
+    assert pool.stats["coalesced"] == 3
+# endregion
+
+# region completion
+def test_on_done_runs_after_apply_for_every_merged_pair():
+    events = []
+    pool = AnalysisPool(Recorded(), lambda result: events.append(("applied", result)), workers=1,
+                        max_queue=1, policy="coalesce")
+    pool.submit("A", "B", on_done=lambda: events.append("done B"))
+    pool.submit("B", "C", on_done=lambda: events.append("done C"))
+    pool.start()
+    wait_for(lambda: len(events) == 3)
+    pool.close()
+    assert events == [("applied", ("A", "C")), "done B", "done C"]
+
+def test_on_done_runs_for_dropped_and_failed_pairs():
+    def analyze(before, after, changed_blocks=None):
+        raise RuntimeError("model error")
+
+    done = []
+    pool = AnalysisPool(analyze, lambda result: None, workers=1, max_queue=1, policy="drop_oldest")
+    pool.submit("A", "B", on_done=lambda: done.append("B"))
+    pool.submit("B", "C", on_done=lambda: done.append("C"))
+    assert done == ["B"]
+    pool.start()
+    wait_for(lambda: len(done) == 2)
+    pool.close()
+    assert done == ["B", "C"]
+# endregion
+
+# region shared limit
+def test_limit_caps_analyses_across_pools():
+    limit = ConcurrencyLimit(2)
+    analyze = SlowAnalyze(0.1)
+    applied = []
+    pools = [AnalysisPool(analyze, applied.append, workers=2, max_queue=8, policy="reject", limit=limit)
+             for _ in range(4)]
+    for pool in pools:
+        pool.start()
+        pool.submit(b"a", b"b")
+        pool.submit(b"b", b"c")
+    wait_for(lambda: len(applied) == 8)
+    for pool in pools:
+        pool.close()
+
+    assert analyze.most_running == 2
+    status = limit.status()
+    assert status["in_use"] == 0 and status["waiting"] == 0
+    assert status["acquired"] == 8 and status["waited"] > 0
+# endregion
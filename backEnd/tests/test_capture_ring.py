@@ -0,0 +1,38 @@
+"""
+The analysis cursors of the capture ring: a capture counts as completed only
+once its analysis is done, and a new analysis leader re-dispatches the rest.
+"""
+from capture_ring import CaptureRing
+
+def open_ring(tmp_path) -> CaptureRing:
+    return CaptureRing(str(tmp_path / "captures.ring"), 64 * 1024)
+
+def test_completed_cursor_waits_for_earlier_captures(tmp_path):
+    ring = open_ring(tmp_path)
+    seqs = [ring.append(b"jpeg %d" % n, "cam") for n in range(3)]
+    for seq in seqs:
+        ring.mark_dispatched(seq)
+    assert ring.dispatched() == 3 and ring.completed() == 0
+
+    ring.mark_completed(seqs[1])
+    assert ring.completed() == 0  # the first capture is still being analyzed
+    ring.mark_completed(seqs[0])
+    assert ring.completed() == 2
+    ring.mark_completed(seqs[2])
+    assert ring.completed() == 3
+    assert ring.status()["completed_seq"] == 3
+    ring.close()
+
+def test_new_leader_redispatches_unfinished_captures(tmp_path):
+    ring = open_ring(tmp_path)
+    seqs = [ring.append(b"jpeg %d" % n, "cam") for n in range(3)]
+    for seq in seqs:
+        ring.mark_dispatched(seq)
+    ring.mark_completed(seqs[0])
+    ring.close()  # the leader dies with two analyses running
+
+    ring = open_ring(tmp_path)
+    assert ring.dispatched() == 3 and ring.completed() == 1
+    assert ring.rewind_dispatch() == 1
+    assert [record.seq for record in ring.records_after(ring.dispatched())] == [2, 3]
+    ring.close()
@@ -0,0 +1,88 @@
+"""
+Size of what ImagePreparer sends to the model for a camera-sized (VGA)
+before/after pair, with the changed blocks handed over by the change filter.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import change_filter as change_filter_module
+from change_filter import change_filter
+from image_prep import ImagePreparer, image_preparer
+from config import (IMAGE_PREP_MARGIN, IMAGE_PREP_MAX_AREA, IMAGE_PREP_MAX_EDGE,
+                    IMAGE_PREP_MIN_DETAIL_EDGE, IMAGE_PREP_JPEG_QUALITY)
+
+SHELF = [(20 + i * 90, 60, 60, 88, ((i * 50) % 255, (i * 90) % 255, (i * 30) % 255)) for i in range(7)]
+SHELF += [(30 + i * 100, 220, 70, 88, ((i * 70) % 255, 120, (i * 40) % 255)) for i in range(6)]
+
+def shelf_jpeg(items, seed: int, size=(640, 480), quality: int = 80) -> bytes:
+    """A noisy shelf photo with one coloured box per item"""
+    image = Image.new("RGB", size, (200, 190, 170))
+    draw = ImageDraw.Draw(image)
+    for y in (150, 310, 470):
+        draw.rectangle((0, y, size[0], y + 8), fill=(90, 70, 50))
+    for x, y, width, height, colour in items:
+        draw.rectangle((x, y, x + width, y + height), fill=colour)
+        draw.text((x + 4, y + 10), "BRAND", fill=(255, 255, 255))
+    noise = np.random.default_rng(seed).integers(-6, 7, (size[1], size[0], 3))
+    pixels = np.clip(np.asarray(image).astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(0.6)).save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+def preparer(max_edge: int = IMAGE_PREP_MAX_EDGE, min_detail_edge: int = IMAGE_PREP_MIN_DETAIL_EDGE) -> ImagePreparer:
+    return ImagePreparer(True, IMAGE_PREP_MARGIN, IMAGE_PREP_MAX_AREA, max_edge,
+                         min_detail_edge, IMAGE_PREP_JPEG_QUALITY)
+
+def vga_pair():
+    before = shelf_jpeg(SHELF, seed=1)
+    after = shelf_jpeg(SHELF + [(300, 380, 50, 88, (200, 30, 30))], seed=2)
+    return before, after
+
+def test_default_max_edge_is_below_camera_resolution():
+    assert image_preparer.max_edge < 640
+
+def test_vga_pair_gets_smaller():
+    before, after = vga_pair()
+    result = change_filter.check(before, after)
+    assert result["changed"]
+
+    prep = preparer()
+    small_before, small_after, detail = prep.prepare(before, after, result["changed_blocks"])
+    assert max(Image.open(io.BytesIO(small_after)).size) == IMAGE_PREP_MAX_EDGE
+    status = prep.status()
+    assert status["bytes_out"] < status["bytes_in"] == len(before) + len(after)
+    assert status["size_ratio"] < 1.0
+    sent = len(small_before) + len(small_after) + (sum(map(len, detail)) if detail else 0)
+    assert sent == status["bytes_out"]
+
+def test_close_ups_dropped_when_they_make_the_pair_larger():
+    before, after = vga_pair()
+    changed_blocks = change_filter.check(before, after)["changed_blocks"]
+    prep = preparer(max_edge=640)  # full frames go unchanged, crops would only add bytes
+    assert prep.prepare(before, after, changed_blocks)[2] is None
+    assert prep.stats["detail_too_large"] == 1
+    assert prep.status()["size_ratio"] <= 1.0
+
+def test_close_ups_kept_for_a_region_too_small_to_read():
+    before, after = vga_pair()
+    changed_blocks = np.zeros((6, 8), dtype=bool)
+    changed_blocks[5, 3] = True
+    # The close-ups make the pair larger, but the region is under min_detail_edge across
+    prep = preparer(max_edge=640, min_detail_edge=320)
+    assert prep.prepare(before, after, changed_blocks)[2] is not None
+    assert prep.stats["with_detail"] == 1 and prep.stats["detail_too_large"] == 0
+
+def test_prepare_uses_the_filter_blocks_without_comparing_again(monkeypatch):
+    before, after = vga_pair()
+    changed_blocks = change_filter.check(before, after)["changed_blocks"]
+
+    def compare(*args):
+        raise AssertionError("prepare() compared the pair again")
+
+    monkeypatch.setattr(change_filter_module.ChangeFilter, "compare", compare)
+    prep = preparer()
+    prep.prepare(before, after, changed_blocks)
+    prep.prepare(before, after)  # no blocks: full frames only
+    assert prep.stats["pairs"] == 2
@@ -0,0 +1,245 @@
+"""
+Deadline, retries, hedging and circuit breaking of LLMCallPolicy, against the
+offline stub model with fixed latencies and injected errors.
+"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from llm_stub import StubChatModel, StubLLMError
+from llm_policy import LLMCallPolicy, CircuitBreaker, CircuitOpenError, DeadlineExceededError
+
+PROMPT = "What is in the pantry?"
+
+def stub(latency: float = 0.0, error_rate: float = 0.0, token_interval: float = 0.0) -> StubChatModel:
+    return StubChatModel(model="test", latency=("fixed", latency), error_rate=error_rate,
+                         token_interval=token_interval)
+
+def policy(breaker: CircuitBreaker = None, deadline: float = 5.0, max_attempts: int = 3,
+           hedge_percentile: float = None, hedge_min_samples: int = 5,
+           first_token_timeout: float = None, idle_timeout: float = None) -> LLMCallPolicy:
+    return LLMCallPolicy("test", breaker or CircuitBreaker(100, 60.0), deadline, max_attempts,
+                         0.001, 0.01, hedge_percentile, hedge_min_samples, first_token_timeout,
+                         idle_timeout, workers=4)
+
+class Counted:
+    """Calls a model and remembers when each request was sent"""
+    def __init__(self, *models: StubChatModel):
+        self.models = models
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.sent.append(time.monotonic())
+            model = self.models[min(len(self.sent), len(self.models)) - 1]
+        return model.invoke(PROMPT)
+
+# region deadline
+def test_deadline_exceeded_at_deadline():
+    llm_policy = policy(deadline=0.2)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        llm_policy.call(lambda: stub(latency=2.0).invoke(PROMPT))
+    assert 0.2 <= time.monotonic() - start < 0.6
+    assert llm_policy.stats["deadline_exceeded"] == 1
+
+def test_deadline_exceeded_at_deadline_async():
+    llm_policy = policy(deadline=0.2)
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            await llm_policy.call_async(lambda: stub(latency=2.0).ainvoke(PROMPT))
+        return time.monotonic() - start
+
+    assert 0.2 <= asyncio.run(run()) < 0.6
+
+def test_answer_within_deadline():
+    llm_policy = policy(deadline=1.0)
+    assert llm_policy.call(lambda: stub(latency=0.01).invoke(PROMPT)).content
+    assert llm_policy.stats["deadline_exceeded"] == 0
+# endregion
+
+# region retries
+def test_retries_stop_at_max_attempts():
+    llm_policy = policy(max_attempts=3)
+    counted = Counted(stub(error_rate=1.0))
+    attrs = {}
+    with pytest.raises(StubLLMError):
+        llm_policy.call(counted, attrs)
+    assert len(counted.sent) == 3
+    assert attrs["attempts"] == 3
+    assert llm_policy.stats["retries"] == 2
+
+def test_retry_recovers_from_transient_error():
+    llm_policy = policy(max_attempts=3)
+    counted = Counted(stub(error_rate=1.0), stub())
+    assert llm_policy.call(counted).content
+    assert len(counted.sent) == 2
+    assert llm_policy.stats["retries"] == 1
+
+def test_non_transient_error_is_not_retried():
+    llm_policy = policy(max_attempts=3)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        llm_policy.call(bad_request)
+    assert len(calls) == 1
+# endregion
+
+# region hedging
+def test_hedge_sent_after_percentile_delay():
+    llm_policy = policy(hedge_percentile=0.9, hedge_min_samples=5)
+    fast = stub(latency=0.05)
+    for _ in range(5):
+        llm_policy.call(lambda: fast.invoke(PROMPT))
+    hedge_delay = llm_policy.hedge_delay()
+    assert hedge_delay is not None and hedge_delay >= 0.05
+
+    # The first request hangs, the hedge answers
+    counted = Counted(stub(latency=2.0), fast)
+    attrs = {}
+    start = time.monotonic()
+    assert llm_policy.call(counted, attrs).content
+    assert time.monotonic() - start < 1.0
+    assert len(counted.sent) == 2
+    assert counted.sent[1] - counted.sent[0] >= hedge_delay * 0.9
+    assert attrs["hedged"] is True
+    assert llm_policy.stats["hedges"] == 1 and llm_policy.stats["hedge_wins"] == 1
+
+def test_no_hedge_before_enough_samples():
+    llm_policy = policy(hedge_percentile=0.9, hedge_min_samples=5)
+    counted = Counted(stub(latency=0.1))
+    llm_policy.call(counted)
+    assert llm_policy.hedge_delay() is None
+    assert len(counted.sent) == 1
+# endregion
+
+# region circuit breaker
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failures=3, reset_timeout=0.2)
+    llm_policy = policy(breaker=breaker, max_attempts=1)
+    failing = Counted(stub(error_rate=1.0))
+    for _ in range(3):
+        with pytest.raises(StubLLMError):
+            llm_policy.call(failing)
+    assert breaker.state == "open"
+
+    # Open: refused without sending a request
+    with pytest.raises(CircuitOpenError):
+        llm_policy.call(failing)
+    assert len(failing.sent) == 3
+
+    # After the reset timeout one probe is let through, and its success closes the circuit
+    time.sleep(0.25)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert llm_policy.call(lambda: stub().invoke(PROMPT)).content
+
+def test_failed_probe_opens_circuit_again():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.1)
+    llm_policy = policy(breaker=breaker, max_attempts=1)
+    failing = Counted(stub(error_rate=1.0))
+    with pytest.raises(StubLLMError):
+        llm_policy.call(failing)
+    time.sleep(0.15)
+    with pytest.raises(StubLLMError):
+        llm_policy.call(failing)  # the probe
+    assert breaker.state == "open"
+    assert breaker.stats["opened"] == 2
+    with pytest.raises(CircuitOpenError):
+        llm_policy.call(failing)
+    assert len(failing.sent) == 2
+# endregion
+
+# region streams
+def test_stream_refused_while_circuit_open():
+    breaker = CircuitBreaker(failures=1, reset_timeout=60.0)
+    breaker.record_failure()
+    llm_policy = policy(breaker=breaker)
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        return stub().stream(PROMPT)
+
+    with pytest.raises(CircuitOpenError):
+        list(llm_policy.stream(open_stream))
+    assert not opened
+
+def test_stream_first_token_timeout():
+    llm_policy = policy(first_token_timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        list(llm_policy.stream(lambda: stub(latency=2.0).stream(PROMPT)))
+    assert time.monotonic() - start < 0.6
+    assert llm_policy.stats["deadline_exceeded"] == 1
+
+def test_stream_runs_past_first_token_timeout_once_started():
+    llm_policy = policy(first_token_timeout=0.2, idle_timeout=0.2)
+    model = stub(latency=0.01, token_interval=0.01)
+    chunks = list(llm_policy.stream(lambda: model.stream(PROMPT)))
+    assert "".join(chunk.content for chunk in chunks) == model.invoke(PROMPT).content
+    assert llm_policy.breaker.state == "closed"
+
+def test_stream_stalled_mid_stream_times_out():
+    breaker = CircuitBreaker(failures=1, reset_timeout=60.0)
+    llm_policy = policy(breaker=breaker, first_token_timeout=1.0, idle_timeout=0.2)
+    # First chunk at once, then the stream goes quiet
+    stalled = stub(latency=0.01, token_interval=2.0)
+    chunks = []
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        for chunk in llm_policy.stream(lambda: stalled.stream(PROMPT)):
+            chunks.append(chunk)
+    assert len(chunks) == 1
+    assert time.monotonic() - start < 0.6
+    assert llm_policy.stats["deadline_exceeded"] == 1
+    assert breaker.state == "open"
+
+def test_astream_stalled_mid_stream_times_out():
+    breaker = CircuitBreaker(failures=1, reset_timeout=60.0)
+    llm_policy = policy(breaker=breaker, first_token_timeout=1.0, idle_timeout=0.2)
+    stalled = stub(latency=0.01, token_interval=2.0)
+
+    async def run():
+        chunks = []
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            async for chunk in llm_policy.astream(lambda: stalled.astream(PROMPT)):
+                chunks.append(chunk)
+        return len(chunks), time.monotonic() - start
+
+    received, elapsed = asyncio.run(run())
+    assert received == 1 and elapsed < 0.6
+    assert llm_policy.stats["deadline_exceeded"] == 1
+    assert breaker.state == "open"
+
+def test_astream_first_token_timeout_and_open_circuit():
+    breaker = CircuitBreaker(failures=1, reset_timeout=60.0)
+    llm_policy = policy(breaker=breaker, first_token_timeout=0.2)
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            async for _ in llm_policy.astream(lambda: stub(latency=2.0).astream(PROMPT)):
+                pass
+        elapsed = time.monotonic() - start
+        with pytest.raises(CircuitOpenError):
+            async for _ in llm_policy.astream(lambda: stub().astream(PROMPT)):
+                pass
+        return elapsed
+
+    assert asyncio.run(run()) < 0.6
+    assert breaker.state == "open"
+# endregion
@@ -0,0 +1,99 @@
+"""
+PantryStore journal replay after a crash, including a torn last line, and
+compaction of the journal into a snapshot.
+"""
+import os
+
+from pantry_store import PantryStore
+
+def open_store(tmp_path, compact_bytes: int = 1024 * 1024) -> PantryStore:
+    return PantryStore(str(tmp_path / "pantry.json"), str(tmp_path / "pantry.journal"), 0.05, compact_bytes)
+
+def crash(store: PantryStore):
+    """Leave the store the way a killed process would: journal on disk, no snapshot"""
+    store.journal.sync()
+    store.journal.close()
+
+def item(name: str) -> dict:
+    return {"id": f"id-{name}", "name": name, "expiry_date": None}
+
+# region journal replay
+def test_replay_after_crash_with_torn_line(tmp_path):
+    store = open_store(tmp_path)
+    for name in ("milk", "eggs", "rice"):
+        store.add_item(item(name))
+    store.remove_item("id-eggs")
+    version = store.version
+    crash(store)
+    # The process died halfway through appending the next record
+    with open(tmp_path / "pantry.journal", "a") as f:
+        f.write('{"op":"add","item":{"id":"id-br')
+
+    store = open_store(tmp_path)
+    assert store.version == version
+    assert [i["name"] for i in store.get_inventory()] == ["milk", "rice"]
+
+    # New records start on a line of their own, so they survive the next restart
+    store.add_item(item("bread"))
+    crash(store)
+    store = open_store(tmp_path)
+    assert store.version == version + 1
+    assert [i["name"] for i in store.get_inventory()] == ["milk", "rice", "bread"]
+    store.close()
+
+def test_compaction_keeps_state_and_version(tmp_path):
+    store = open_store(tmp_path, compact_bytes=512)
+    for n in range(20):
+        store.add_item(item(f"item{n}"))
+    store.replace_inventory([item("jam")], [], [item("jam"), item("tea")])
+    version = store.version
+    store.flush()  # the journal is past compact_bytes
+
+    assert os.path.exists(tmp_path / "pantry.json")
+    assert store.journal.size == 0
+    assert not os.path.exists(tmp_path / "pantry.journal.old")
+
+    store.add_item(item("honey"))
+    crash(store)
+    store = open_store(tmp_path)
+    assert store.version == version + 1
+    assert [i["name"] for i in store.get_inventory()] == ["jam", "tea", "honey"]
+    store.close()
+
+def test_registration_does_not_change_version(tmp_path):
+    store = open_store(tmp_path)
+    store.add_item(item("milk"))
+    version = store.version
+    notified = []
+    store.subscribe(notified.append)
+
+    store.registry.resolve_many(["Olive Oil", "Heinz Tomato Ketchup"])
+    store.replace_inventory([], [], [item("milk")])  # same inventory as before
+    assert store.version == version
+    assert notified == []
+    assert store.changes_since(version) == (version, {"changed": [], "removed": []})
+
+    store.add_item(item("eggs"))
+    assert store.version == version + 1
+    assert [record["version"] for record in notified] == [version + 1]
+
+    # The version survives a replay and a compaction
+    crash(store)
+    store = open_store(tmp_path)
+    assert store.version == version + 1
+    store.compact()
+    store.close()
+    assert open_store(tmp_path).version == version + 1
+
+def test_changes_since_after_replay(tmp_path):
+    store = open_store(tmp_path)
+    store.add_item(item("milk"))
+    crash(store)
+    store = open_store(tmp_path)
+    since = store.version
+    store.add_item(item("eggs"))
+    version, delta = store.changes_since(since)
+    assert version == since + 1
+    assert [i["id"] for i in delta["changed"]] == ["id-eggs"] and delta["removed"] == []
+    store.close()
+# endregion
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+from config import TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_FILE_BACKUPS, TRACE_RECENT, TRACE_FLUSH_INTERVAL
+
+# Trace of the pipeline the current thread or task is working for
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """
+    Timed stages of one pipeline run, e.g. a capture from the moment it was
+    received until its analysis was saved. Spans can be added from any
+    thread; times are stored in milliseconds from the start of the trace.
+    """
+
+    def __init__(self, tracer: "Tracer", kind: str, start: Optional[float], attrs: dict):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.start = start if start is not None else time.time()
+        self.attrs = attrs
+        self.spans = []
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def add_span(self, name: str, start: float, end: float, **attrs):
+        """Record a stage that ran from `start` to `end` (time.time() values)."""
+        span = {"name": name, "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3)}
+        if attrs:
+            span["attrs"] = attrs
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.time()
+        try:
+            yield attrs  # callers may add attributes while the stage runs
+        except Exception as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            self.add_span(name, start, time.time(), **attrs)
+
+    def finish(self, outcome: str, **attrs):
+        """Close the trace and hand it to the tracer. Later calls are ignored."""
+        end = time.time()
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        self.attrs.update(attrs)
+        self.tracer.record({
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "start": round(self.start, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "outcome": outcome,
+            "attrs": self.attrs,
+            "spans": spans,
+        })
+
+@contextmanager
+def activate(trace: Optional[Trace]):
+    """Make `trace` the one span() records into for the code inside the block."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage of the active trace; does nothing when no trace is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    with trace.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+class Tracer:
+    """
+    Collects finished traces in memory for /api/debug/traces and appends them
+    to a JSONL file. A background writer flushes every `flush_interval`
+    seconds, so finishing a trace never waits on disk. The file is rotated
+    once it grows past `max_bytes`, keeping `backups` older files
+    (<path>.1 is the newest).
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int, backups: int, recent: int, flush_interval: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        self._pending = []
+        self._stop = threading.Event()
+        self._writer = None
+        self.stats = {"started": 0, "finished": 0, "written": 0, "rotations": 0}
+
+    def start_trace(self, kind: str, start: Optional[float] = None, **attrs) -> Trace:
+        """New trace of a `kind` pipeline; `start` backdates it, e.g. to when the request arrived."""
+        with self._lock:
+            self.stats["started"] += 1
+        return Trace(self, kind, start, attrs)
+
+    def record(self, record: dict):
+        with self._lock:
+            self._recent.append(record)
+            if self.path:
+                self._pending.append(record)
+            self.stats["finished"] += 1
+
+    # region queries
+    def recent(self, kind: Optional[str] = None, device: Optional[str] = None,
+               since: Optional[float] = None) -> List[dict]:
+        with self._lock:
+            records = list(self._recent)
+        return [record for record in records
+                if (kind is None or record["kind"] == kind)
+                and (device is None or record["attrs"].get("device") == device)
+                and (since is None or record["start"] >= since)]
+
+    @staticmethod
+    def slowest(records: List[dict], limit: int) -> List[dict]:
+        return sorted(records, key=lambda record: record["duration_ms"], reverse=True)[:limit]
+
+    @staticmethod
+    def stage_breakdown(records: List[dict]) -> dict:
+        """
+        Per stage: how many traces ran it, mean/p50/p95/max duration, and its
+        share of the total time of those traces. 'total' is the whole pipeline.
+        """
+        durations = {"total": [record["duration_ms"] for record in records]}
+        for record in records:
+            for span in record["spans"]:
+                durations.setdefault(span["name"], []).append(span["duration_ms"])
+        total_ms = sum(durations["total"])
+        breakdown = {}
+        for name, samples in durations.items():
+            samples.sort()
+            breakdown[name] = {
+                "count": len(samples),
+                "mean_ms": round(sum(samples) / len(samples), 3) if samples else 0.0,
+                "p50_ms": percentile(samples, 0.50),
+                "p95_ms": percentile(samples, 0.95),
+                "max_ms": samples[-1] if samples else 0.0,
+                "share": round(sum(samples) / total_ms, 4) if total_ms else 0.0,
+            }
+        return breakdown
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"file": self.path, "recent": len(self._recent), "pending": len(self._pending), **self.stats}
+    # endregion
+
+    # region trace file
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            source = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i}")
+        if not self.backups:
+            os.remove(self.path)
+        self.stats["rotations"] += 1
+
+    def flush(self):
+        """Append pending traces to the trace file."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in pending))
+            with self._lock:
+                self.stats["written"] += len(pending)
+        except OSError as e:
+            print(f"Warning: Could not write pipeline traces: {e}")
+
+    def _writer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start the background writer. Safe to call more than once."""
+        if self._writer is not None or not self.path:
+            return
+        self._writer = threading.Thread(target=self._writer_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """Stop the background writer and write any pending traces."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self.path:
+            self.flush()
+    # endregion
+
+tracer = Tracer(
+    os.path.join(os.path.dirname(__file__), TRACE_FILE) if TRACE_FILE else None,
+    TRACE_FILE_MAX_BYTES,
+    TRACE_FILE_BACKUPS,
+    TRACE_RECENT,
+    TRACE_FLUSH_INTERVAL
+)
@@ -13,20 +13,6 @@ interface InventoryCardType {
 type SortKey = 'name' | 'expiry_date' | 'date_added';
 type SortOrder = 'asc' | 'desc';
 
-async function fetchInventoryFromAPI() {
-    try {
-        const response = await fetch(`http://${backendServer}/api/inventory`)
-        if (!response.ok) {
-            throw new Error(`API error: ${response.status}`)
-        }
-        const data = await response.json()
-        return data
-    } catch (error) {
-        console.error('Failed to fetch inventory:', error)
-        return []
-    }
-}
-
 async function addInventoryItem(item: Omit<InventoryCardType, 'id' | 'date_added'>) {
     try {
         const response = await fetch(`http://${backendServer}/api/inventory`, {
@@ -61,6 +47,31 @@ async function deleteInventoryItem(id: string) {
     }
 }
 
+// Opens /api/inventory/stream. 'snapshot' events carry the whole inventory,
+// 'inventory' events the entries of every id that changed plus the removed ids.
+function subscribeToInventory(setInventory: (update: (prev: InventoryCardType[] | null) => InventoryCardType[]) => void) {
+    const events = new EventSource(`http://${backendServer}/api/inventory/stream`)
+
+    events.addEventListener('snapshot', (e) => {
+        const data = JSON.parse((e as MessageEvent).data)
+        setInventory(() => data.inventory)
+    })
+
+    events.addEventListener('inventory', (e) => {
+        const data = JSON.parse((e as MessageEvent).data)
+        const changed: InventoryCardType[] = data.changed
+        const touched = new Set<string>([...data.removed, ...changed.map(item => item.id)])
+        setInventory(prev => [...(prev ?? []).filter(item => !touched.has(item.id)), ...changed])
+    })
+
+    events.onerror = (error) => {
+        // EventSource reconnects on its own and resumes from the last event it saw
+        console.error('Inventory stream error:', error)
+    }
+
+    return events
+}
+
 function isValidDate(dateString: string): boolean {
     const date = new Date(dateString)
     return !isNaN(date.getTime())
@@ -193,7 +204,9 @@ export default function Inventory() {
     const [warningDays, setWarningDays] = useState(parseInt(localStorage.getItem('expiryWarningDays') || '3'));
 
     useEffect(() => {
-        fetchInventoryFromAPI().then(data => setInventory(data))
+        // The stream opens with a 'snapshot' of the whole inventory and then pushes
+        // every change, so a separate fetch could only race it with older state
+        const events = subscribeToInventory(setInventory)
         
         // Listen for storage changes to update warning days
         const handleStorageChange = () => {
@@ -207,13 +220,15 @@ export default function Inventory() {
         return () => {
             window.removeEventListener('storage', handleStorageChange);
             window.removeEventListener('settingsChanged', handleStorageChange);
+            events.close();
         };
     }, [])
 
     const handleAddItem = async (item: { name: string; expiry_date: string }) => {
         try {
             const newItem = await addInventoryItem(item);
-            setInventory(prev => prev ? [...prev, newItem] : [newItem]);
+            // The stream may already have delivered the new item
+            setInventory(prev => prev ? [...prev.filter(entry => entry.id !== newItem.id), newItem] : [newItem]);
         } catch (error) {
             alert('Failed to add item. Please try again.');
         }